@@ -2,23 +2,32 @@
 
 import argparse
 import gc
-import gzip
 import multiprocessing
 import os
+import re
 
 import orjson
 from inc.asns import asns
+from inc.codec import open_file
 from inc.download import get_json_to_file
 from inc.globals import (
     COVERAGE_DATA_PATH,
+    FULL_TABLE_ASN_THRESHOLD,
     FULL_TABLE_REPORT,
     MERGED_PATHS_PATH,
     RIS_THRESHOLDS,
 )
+from inc.routes_files import find_routes_file, load_summary, open_routes
+from inc.stats import AsnRoutesSummary
 from tabulate import tabulate
 
 cli_args: argparse.Namespace
 
+# Bytes to decompress at a time when scanning a merged table
+SCAN_CHUNK_SIZE = 2**20
+# JSON strings and integers, the only tokens scan_asn_data cares about
+SCAN_TOKENS = re.compile(rb'"[^"]*"|-?[0-9]+')
+
 
 def download_ris_full_table_threshold() -> str:
     """
@@ -41,35 +50,90 @@ def get_ris_data() -> dict:
 
 def parse_asn_data(args: tuple[str, int, int, int]) -> dict[str, int | bool]:
     """
-    Load and parse the stats for a single ASN
+    Load and parse the stats for a single ASN.
+    Use the summary written during the merge if there is one which matches
+    the merged table, and only fall back to parsing the full merged table if
+    there isn't.
     """
     asn, asn_threshold, v4_threshold, v6_threshold = args
 
-    filename = os.path.join(cli_args.input, f"{asn}-routes.json.gz")
-    print(f"{os.getpid()}: Loading {filename}")
-    if os.path.splitext(filename)[1] == ".gz":
-        with gzip.open(filename, "rb") as f:
-            asn_data = orjson.loads(f.read())
-    else:
-        with open(filename) as f:
-            asn_data = orjson.loads(f.read())
+    if not cli_args.nosummary:
+        summary = load_summary(asn, cli_args.input)
+        if summary is not None:
+            print(f"{os.getpid()}: Loaded the summary for AS{asn}")
+            return summary.to_report(asn_threshold, v4_threshold, v6_threshold)
+
+    filename = find_routes_file(asn, cli_args.input)
+    # Only JSON tables can be scanned without decoding them
+    if cli_args.verdict and ".json" in os.path.basename(filename):
+        print(f"{os.getpid()}: Scanning {filename}")
+        summary = scan_asn_data(filename, asn_threshold)
+        return summary.to_report(asn_threshold, v4_threshold, v6_threshold)
+
+    print(f"{os.getpid()}: Streaming {filename}")
+    stream = open_routes(filename)
+    summary = AsnRoutesSummary.from_routes(
+        stream.peer_as, stream.v4_count, stream.v6_count, stream
+    )
+    return summary.to_report(asn_threshold, v4_threshold, v6_threshold)
+
+
+def scan_asn_data(filename: str, asn_threshold: int) -> AsnRoutesSummary:
+    """
+    Stream through a merged AsnRoutes JSON file without decoding it.
+
+    The v4 and v6 prefix counts are taken from the document's own count
+    fields, and ASNs are only counted until the ASN threshold is reached.
+    After that the rest of the file is only scanned for the prefix counts,
+    if they haven't been seen yet. The ASN count returned is therefore a
+    lower bound once it reaches the threshold.
 
+    Prefixes never contain commas or brackets, so each chunk is only
+    tokenised up to the last one of those, and the remainder is carried
+    over to the next chunk. This means no token is split between chunks.
+    """
+    header_keys = (b'"peer_as"', b'"v4_count"', b'"v6_count"')
+    header: dict[bytes, int] = {}
     seen_asns: set[int] = set()
-    as_paths: list[list[int]]
-    for as_paths in asn_data["routes"].values():
-        for as_path in as_paths:
-            seen_asns.update(as_path)
-
-    result = {
-        "asn": int(asn),
-        "v4_count": asn_data["v4_count"],
-        "v4_full": asn_data["v4_count"] >= v4_threshold,
-        "v6_count": asn_data["v6_count"],
-        "v6_full": asn_data["v6_count"] >= v6_threshold,
-        "asn_count": len(seen_asns),
-        "asn_full": len(seen_asns) >= asn_threshold,
-    }
-    return result
+    counting = True
+    last_token = b""
+    tail = b""
+
+    with open_file(filename) as f:
+        while chunk := f.read(SCAN_CHUNK_SIZE):
+            buffer = tail + chunk
+            cut = max(buffer.rfind(b","), buffer.rfind(b"]")) + 1
+            buffer, tail = buffer[:cut], buffer[cut:]
+
+            for match in SCAN_TOKENS.finditer(buffer):
+                token = match.group()
+                if token[0] == ord('"'):
+                    last_token = token
+                    continue
+                if last_token in header_keys:
+                    header[last_token] = int(token)
+                elif counting:
+                    seen_asns.add(int(token))
+                    if len(seen_asns) >= asn_threshold:
+                        counting = False
+                last_token = token
+
+            if not counting and len(header) == len(header_keys):
+                break
+        else:
+            # The final closing brackets don't end in a comma
+            for match in SCAN_TOKENS.finditer(tail):
+                token = match.group()
+                if token[0] != ord('"') and last_token in header_keys:
+                    header[last_token] = int(token)
+                last_token = token
+
+    return AsnRoutesSummary(
+        peer_as=header[b'"peer_as"'],
+        v4_count=header[b'"v4_count"'],
+        v6_count=header[b'"v6_count"'],
+        asn_count=len(seen_asns),
+    )
 
 
 def load_and_print_count(
@@ -136,11 +200,19 @@ def parse_cli_args() -> None:
     )
     parser.add_argument(
         "-input",
-        help="Path to input directory with JSON serialised AsnRoutes files",
+        help="Path to input directory with merged AsnRoutes files",
         type=str,
         metavar="path",
         default=MERGED_PATHS_PATH,
     )
+    parser.add_argument(
+        "-nosummary",
+        help="Ignore the summary files written by the merge, and count the "
+        "full merged tables instead",
+        default=False,
+        action="store_true",
+        required=False,
+    )
     parser.add_argument(
         "-output",
         help="Path to output file for storing results",
@@ -171,7 +243,16 @@ def parse_cli_args() -> None:
         help="Threshold for minimum ASNs to consider the reconstructed table "
         "as holding the full v4 table",
         type=int,
-        default=75000,
+        default=FULL_TABLE_ASN_THRESHOLD,
+    )
+    parser.add_argument(
+        "-verdict",
+        help="Only decide if each table is full. Stream through the merged "
+        "tables when there is no summary file, and stop counting ASNs once "
+        "the ASN threshold is met, so the reported ASN count is a lower bound",
+        default=False,
+        action="store_true",
+        required=False,
     )
 
     global cli_args
@@ -5,19 +5,27 @@ from __future__ import annotations
 import argparse
 import csv
 import gc
-import gzip
 import json
 import multiprocessing
 import os
-from typing import Optional, Union
+from typing import Any, Optional, Union
 
+import numpy as np
+import numpy.typing as npt
 import orjson
 import pytricia
-from inc.aggregate6 import aggregate_pyt
 from inc.asns import asns, is_tier1, skip_asn
+from inc.bitsets import BitsetMatrix, intersection_counts
 from inc.bogon_asns import BogonAsns
 from inc.bogon_prefixes import BogonPrefixes
-from inc.countries import get_asn_to_continent_mappings
+from inc.codec import (
+    CODEC_PRESETS,
+    COMPRESSION_SUFFIXES,
+    Codec,
+    find_file,
+    get_codec,
+)
+from inc.full_tables import FullTable, FullTableReport
 from inc.globals import (
     COVERAGE_AS_CONE,
     COVERAGE_AS_HOP_COUNT_ASNS,
@@ -28,20 +36,72 @@ from inc.globals import (
     COVERAGE_IP,
     COVERAGE_PEERING,
     COVERAGE_PEERINGS,
+    COVERAGE_RESULTS_DB,
+    COVERAGE_STATS_STORE,
     COVERAGE_V4,
     COVERAGE_V4_SHORTER_T1,
     COVERAGE_V6,
     COVERAGE_V6_SHORTER_T1,
+    FULL_TABLE_ASN_THRESHOLD,
     FULL_TABLE_REPORT,
     IPV4_SIZE,
     IPV6_SIZE,
     MERGED_PATHS_PATH,
     NRO_ALLOCATIONS,
     RAW_DATA,
+    RIS_THRESHOLDS,
 )
-from inc.stats import AsnRoutes, AsStats
+from inc.nro_registry import NroRegistry
+from inc.prefix_keys import address_count, covered_keys, key_prefixes
+from inc.results_db import ResultsDb
+from inc.routes_files import find_routes_file, load_summary, open_routes
+from inc.shared_arrays import SharedArrays, SharedArraysSpec
+from inc.stats import DERIVED_FIELDS, AsnRoutesSummary, AsStats, asn_array
+from inc.stats_store import StatsStore, StatsStoreWriter
 from tabulate import tabulate
 
+# The AsStats fields each coverage stage reads, and writes back
+ASN_COVERAGE_RESULTS = [
+    "asns_on_net_for_peers",
+    "asns_n_on_net_for_peers",
+    "asns_reachable_via_peers",
+    "peers_w_asn_on_net",
+    "peers_wo_asn_on_net",
+    "peers_w_reachable_asn",
+    "peers_wo_reachable_asn",
+]
+ASN_COVERAGE_FIELDS = ASN_COVERAGE_RESULTS + [
+    "as_hops",
+    "as_hops_freq",
+    "as_path_lengths",
+    "asns_reachable",
+    "avg_as_hops",
+    "avg_as_path_length",
+    "on_net_asns",
+    "weighted_as_hops_score",
+    "weighted_as_path_score",
+]
+IP_COVERAGE_RESULTS = ["v4_percent", "v6_percent"]
+IP_COVERAGE_FIELDS: list[str] = []
+PREFIX_COVERAGE_RESULTS = [
+    "peers_w_cover_v4_pfx",
+    "peers_wo_cover_v4_pfx",
+    "peers_w_cover_v6_pfx",
+    "peers_wo_cover_v6_pfx",
+    "v4_pfx_covered_by_peers",
+    "v6_pfx_covered_by_peers",
+]
+PREFIX_COVERAGE_FIELDS = PREFIX_COVERAGE_RESULTS + [
+    "v4_pfx_tree",
+    "v4_pfx_preferred_by_t1s",
+    "v4_pfx_n_preferred_by_t1s",
+    "v6_pfx_tree",
+    "v6_pfx_preferred_by_t1s",
+    "v6_pfx_n_preferred_by_t1s",
+]
+# Networks per side of each tile of the pairwise prefix comparison
+PREFIX_COMPARISON_TILE = 32
+
 
 class GlobalStats:
     all_asns: set[int] = set()  # All unique ASNs seen via all networks
@@ -53,6 +113,13 @@ class GlobalStats:
         IPV6_SIZE
     )  # All unique v6 prefixes seen via all networks
     v6_ips = 0  # Total number of IP addresses covered by all seen prefixes
+    prefix_keys_asns: set[int] = set()  # Networks the prefix keys are from
+    v4_prefix_keys: npt.NDArray[np.uint64] = np.array(
+        [], dtype=np.uint64
+    )  # Sorted keys of all v4 prefixes, a prefix's ID is its index
+    v6_prefix_keys: npt.NDArray[np.uint64] = np.array(
+        [], dtype=np.uint64
+    )  # Sorted keys of all v6 prefixes, a prefix's ID is its index
 
     @classmethod
     def to_dict(cls) -> dict[str, Union[list[Union[int, str]], int]]:
@@ -65,14 +132,84 @@ class GlobalStats:
         }
 
     @classmethod
-    def to_json(cls) -> None:
-        filename = os.path.join(cli_args.output, COVERAGE_GLOBAL)
-        with gzip.open(filename, "wb") as f:
-            # Orjson can't dump >64bit int (GlobalStats.v6_ips)
-            f.write(json.dumps(GlobalStats.to_dict(), indent=2).encode())
+    def to_json(cls, codec: Codec) -> None:
+        filename = codec.filename(
+            os.path.join(cli_args.output, COVERAGE_GLOBAL)
+        )
+        # Orjson can't dump >64bit int (GlobalStats.v6_ips)
+        codec.write_bytes(
+            filename,
+            json.dumps(
+                GlobalStats.to_dict(), indent=2 if codec.indent else None
+            ).encode(),
+        )
         print(f"Wrote global stats to {filename}")
 
 
+class CoverageSession:
+    """
+    The AsStats of the networks analysed in this run, shared by the coverage
+    stages. Each field of a network is loaded from the stats store once, the
+    first time a stage needs it. The fields a stage calculates are marked as
+    dirty, and each network's file is written once at the end of the run,
+    with only its dirty fields.
+    """
+
+    def __init__(self: CoverageSession, store: StatsStore) -> None:
+        self.store = store
+        self.all_as_stats: dict[int, AsStats] = {}
+        self.loaded: dict[int, set[str]] = {}  # Stored fields loaded
+        self.dirty: dict[int, set[str]] = {}  # Fields to write
+
+    def get(
+        self: CoverageSession, asn_list: list[int], fields: list[str]
+    ) -> list[AsStats]:
+        """
+        Return the AsStats of each network, with at least these fields
+        loaded
+        """
+        stored_fields: set[str] = set()
+        for field in fields:
+            stored_fields.update(DERIVED_FIELDS.get(field, [field]))
+
+        all_as_stats = []
+        for asn in asn_list:
+            if asn not in self.all_as_stats:
+                self.all_as_stats[asn] = self.store.as_stats(asn, fields)
+                self.loaded[asn] = set(stored_fields)
+            elif missing := stored_fields - self.loaded[asn]:
+                as_stats = self.store.as_stats(asn, missing)
+                for field in missing:
+                    setattr(
+                        self.all_as_stats[asn], field, getattr(as_stats, field)
+                    )
+                self.loaded[asn].update(missing)
+            all_as_stats.append(self.all_as_stats[asn])
+        return all_as_stats
+
+    def mark_dirty(
+        self: CoverageSession, asn_list: list[int], fields: list[str]
+    ) -> None:
+        """
+        Record that these fields of each network need writing
+        """
+        for asn in asn_list:
+            self.dirty.setdefault(asn, set()).update(fields)
+
+    def write(self: CoverageSession, codec: Codec) -> None:
+        """
+        Write the dirty fields of every network to its AsStats file
+        """
+        for asn, fields in self.dirty.items():
+            self.all_as_stats[asn].to_file(
+                codec,
+                get_output_filename(str(asn), cli_args.output),
+                sorted(fields),
+            )
+        print(f"Wrote coverage results for {len(self.dirty)} networks")
+        self.dirty = {}
+
+
 class IpCoverage:
     asn: int
     v4_percent: float
@@ -87,27 +224,69 @@ class IpCoverage:
 
 
 cli_args: argparse.Namespace
+full_table_report: Optional[FullTableReport] = None  # Loaded once
+results_db: Optional[ResultsDb] = None  # Opened if -db is set
+session: Optional[CoverageSession] = None  # Created once, in the parent
+stats_store: Optional[StatsStore] = None  # Opened once per process
+worker_prefixes: Optional[SharedArrays] = None  # Attached by pool workers
 
 
 def get_asn_report() -> dict[str, dict[str, Union[int, bool]]]:
-    assert os.path.exists(cli_args.report)
+    """
+    Return the full table report written by count_of_merged.py.
+    If there isn't one, build it from the merge summary files.
+    """
+    if not os.path.exists(cli_args.report):
+        return get_asn_report_from_summaries()
     with open(cli_args.report) as f:
         data = orjson.loads(f.read())
         assert isinstance(data, dict)  # mypy
         return data
 
 
+def get_asn_report_from_summaries() -> dict[str, dict[str, Union[int, bool]]]:
+    """
+    Build the full table report from the summary files written by
+    merge_rib_stats.py, using the RIS thresholds downloaded by
+    count_of_merged.py and the -ta ASN threshold. Merged tables are only
+    streamed if their summary is missing or out of date.
+    """
+    ris_filename = os.path.join(cli_args.output, RIS_THRESHOLDS)
+    if not os.path.exists(ris_filename):
+        raise FileExistsError(
+            f"Neither the full table report {cli_args.report} nor RIS "
+            f"thresholds {ris_filename} exist"
+        )
+    with open(ris_filename) as f:
+        ris_data = orjson.loads(f.read())
+
+    data: dict[str, dict[str, Union[int, bool]]] = {}
+    for asn in sorted(asns.keys()):
+        summary = load_summary(asn, cli_args.input)
+        if summary is None:
+            try:
+                filename = find_routes_file(asn, cli_args.input)
+            except FileExistsError:
+                continue
+            print(f"Streaming {filename}")
+            stream = open_routes(filename)
+            summary = AsnRoutesSummary.from_routes(
+                stream.peer_as, stream.v4_count, stream.v6_count, stream
+            )
+        data[str(asn)] = summary.to_report(
+            cli_args.ta,
+            int(ris_data["data"]["v4"]),
+            int(ris_data["data"]["v6"]),
+        )
+    return data
+
+
 def get_asns_full_table_asn() -> list[int]:
     """
     Return a list of ASNs which, according to the full table report,
     have True stored under the ASN threshold.
     """
-    asn_data = get_asn_report()
-    asn_list = []
-    for asn in asn_data:
-        if asn_data[asn]["asn_full"]:
-            asn_list.append(int(asn))
-    return asn_list
+    return get_full_table_report().asns(any_of=FullTable.ASN)
 
 
 def get_asns_full_table_ip() -> list[int]:
@@ -115,12 +294,7 @@ def get_asns_full_table_ip() -> list[int]:
     Return a list of ASNs which, according to the full table report,
     have True stored under the IP thresholds.
     """
-    asn_data = get_asn_report()
-    asn_list = []
-    for asn in asn_data:
-        if asn_data[asn]["v4_full"] or asn_data[asn]["v6_full"]:
-            asn_list.append(int(asn))
-    return asn_list
+    return get_full_table_report().asns(any_of=FullTable.V4 | FullTable.V6)
 
 
 def get_asns_full_table_any() -> list[int]:
@@ -128,112 +302,99 @@ def get_asns_full_table_any() -> list[int]:
     Return a list of ASNs which, according to the full table report,
     have True stored under any threshold.
     """
-    asn_data = get_asn_report()
-    asn_list = []
-    for asn in asn_data:
-        if (
-            asn_data[asn]["v4_full"]
-            or asn_data[asn]["v6_full"]
-            or asn_data[asn]["asn_full"]
-        ):
-            asn_list.append(int(asn))
-    return asn_list
+    return get_full_table_report().asns(
+        any_of=FullTable.ASN | FullTable.V4 | FullTable.V6
+    )
 
 
-def get_input_filenames(asn_list: list[int], compressed: bool) -> list[str]:
+def get_full_table_report() -> FullTableReport:
     """
-    Return a list of AsnRoutes JSON filenames based on the chosen ASNs
+    Return the full table report, loading it the first time it's used
     """
-    filenames: list[str] = []
-    for asn in asn_list:
-        filename = os.path.join(cli_args.input, f"{asn}-routes.json")
-        if compressed:
-            filename += ".gz"
-        if not os.path.exists(filename):
-            raise FileExistsError(f"Input file doesn't exist: {filename}")
-        filenames.append(filename)
-    return filenames
+    global full_table_report
+    if full_table_report is None:
+        full_table_report = FullTableReport(get_asn_report())
+    return full_table_report
+
+
+def get_input_filenames(asn_list: list[int]) -> list[str]:
+    """
+    Return a list of merged routes filenames based on the chosen ASNs
+    """
+    return [find_routes_file(asn, cli_args.input) for asn in asn_list]
 
 
-def get_output_filename(prefix: str, compressed: bool, output_dir: str) -> str:
+def get_output_filename(prefix: str, output_dir: str) -> str:
     """
-    Return output filename for serialising AsStats objects to JSON
+    Return output filename for serialising AsStats objects
     """
-    filename = os.path.join(output_dir, f"{prefix}-stats.json")
-    if compressed:
-        return filename + ".gz"
-    return filename
+    return os.path.join(output_dir, f"{prefix}-stats.fields")
 
 
 def get_output_filenames(
-    asn_list: list[int], compressed: bool, output_dir: str
+    asn_list: list[int], output_dir: str, missing_ok: bool = False
 ) -> list[str]:
     """
-    Return the list of parsed AsStat filenames based on the chosen ASNs
+    Return the list of parsed AsStat filenames based on the chosen ASNs.
+    JSON AsStats files written by older versions are also found.
+    ASNs which weren't parsed are skipped if missing_ok is True.
     """
     filenames: list[str] = []
     for asn in asn_list:
-        filename = get_output_filename(str(asn), compressed, output_dir)
+        filename = get_output_filename(str(asn), output_dir)
         if not os.path.exists(filename):
-            raise FileExistsError(f"Parsed file doesn't exist: {filename}")
+            try:
+                filename = find_file(
+                    os.path.join(output_dir, f"{asn}-stats.json")
+                )
+            except FileExistsError:
+                if missing_ok:
+                    continue
+                raise
         filenames.append(filename)
     return filenames
 
 
-def calculate_asn_coverage(as_stats_files: list[str]) -> None:
+def get_stats_store() -> StatsStore:
+    """
+    Return the stats store of all parsed networks, mapping it into memory
+    the first time it's used in this process
+    """
+    global stats_store
+    if stats_store is None:
+        stats_store = StatsStore(
+            os.path.join(cli_args.output, COVERAGE_STATS_STORE)
+        )
+    return stats_store
+
+
+def get_session() -> CoverageSession:
+    """
+    Return the coverage session, creating it the first time it's used
+    """
+    global session
+    if session is None:
+        session = CoverageSession(get_stats_store())
+    return session
+
+
+def calculate_asn_coverage(asn_list: list[int]) -> None:
     """
     Calculate ASN coverage and reachability stats
     """
 
-    print(f"Calculating ASN coverage for {len(as_stats_files)} networks")
+    print(f"Calculating ASN coverage for {len(asn_list)} networks")
 
-    # Can't call from_json with multiprocessing, pytri can't be pickled
-    all_as_stats: list[AsStats] = []
-    for as_stats_file in as_stats_files:
-        all_as_stats.append(
-            AsStats.from_json(cli_args.uncompressed, as_stats_file)
-        )
+    all_as_stats = get_session().get(asn_list, ASN_COVERAGE_FIELDS)
 
     for as_stats in all_as_stats:
-        GlobalStats.all_asns.update(as_stats.asns_reachable)
-
-    for local_as in all_as_stats:
-        print(f"Comparing ASNs for {local_as.asn}")
+        GlobalStats.all_asns.update(as_stats.asns_reachable.tolist())
 
-        # Find the ASNs reachable by each network either on- or off-net
-        for peer_as in all_as_stats:
-            if local_as == peer_as:
-                continue
+    compare_asns(all_as_stats)
+    get_session().mark_dirty(asn_list, ASN_COVERAGE_RESULTS)
 
-            local_as.peers_w_asn_on_net[peer_as.asn] = 0
-            local_as.peers_wo_asn_on_net[peer_as.asn] = 0
-            local_as.peers_w_reachable_asn[peer_as.asn] = 0
-            local_as.peers_wo_reachable_asn[peer_as.asn] = 0
-
-            for on_net_asn in local_as.on_net_asns:
-                if on_net_asn in peer_as.on_net_asns:
-                    local_as.peers_w_asn_on_net[peer_as.asn] += 1
-                    local_as.asns_on_net_for_peers.add(on_net_asn)
-                    if on_net_asn in local_as.asns_n_on_net_for_peers:
-                        local_as.asns_n_on_net_for_peers.remove(on_net_asn)
-                else:
-                    local_as.peers_wo_asn_on_net[peer_as.asn] += 1
-
-            for reachable_asn in local_as.asns_reachable:
-                if reachable_asn in peer_as.asns_reachable:
-                    local_as.peers_w_reachable_asn[peer_as.asn] += 1
-                    local_as.asns_reachable_via_peers.add(reachable_asn)
-                    if reachable_asn in local_as.asns_n_reachable_via_peers:
-                        local_as.asns_n_reachable_via_peers.remove(
-                            reachable_asn
-                        )
-                else:
-                    local_as.peers_wo_reachable_asn[peer_as.asn] += 1
-
-        local_as.to_json(
-            cli_args.uncompressed,
-            get_output_filename(str(local_as.asn), True, cli_args.output),
-        )
+    if results_db:
+        results_db.write_asn_coverage(all_as_stats)
 
     print("")
     print(f"ASNs Found via All Peers: {len(GlobalStats.all_asns)}")
@@ -246,321 +407,514 @@ def calculate_asn_coverage(as_stats_files: list[str]) -> None:
     print_peerings(all_as_stats)
 
 
-def calculate_global_prefixes(as_stats_files: list[str]) -> None:
+def calculate_global_prefixes(asn_list: list[int]) -> None:
     """
     Populate the prefix trees for all unique routes see across all networks
     """
 
-    print(
-        f"Calculating global prefixes seen via {len(as_stats_files)} networks"
-    )
-    for as_stats_file in as_stats_files:
-        as_stats = AsStats.from_json(cli_args.uncompressed, as_stats_file)
-        # Update the global stats for prefixes seen via a network
-        for prefix in as_stats.v4_pfx_tree:
-            GlobalStats.v4_pfx_tree.insert(prefix, None)
-        for prefix in as_stats.v6_pfx_tree:
-            GlobalStats.v6_pfx_tree.insert(prefix, None)
-
-    v4_aggregates = aggregate_pyt(GlobalStats.v4_pfx_tree, IPV4_SIZE)
-    v6_aggregates = aggregate_pyt(GlobalStats.v6_pfx_tree, IPV6_SIZE)
-
-    for prefix in v4_aggregates:
-        mask = int(prefix.split("/")[1])
-        GlobalStats.v4_ips += 2 ** (IPV4_SIZE - mask)
+    print(f"Calculating global prefixes seen via {len(asn_list)} networks")
+    calculate_global_prefix_keys(asn_list)
+    for prefix in key_prefixes(GlobalStats.v4_prefix_keys, 4):
+        GlobalStats.v4_pfx_tree.insert(prefix, None)
+    for prefix in key_prefixes(GlobalStats.v6_prefix_keys, 6):
+        GlobalStats.v6_pfx_tree.insert(prefix, None)
 
-    for prefix in v6_aggregates:
-        mask = int(prefix.split("/")[1])
-        GlobalStats.v6_ips += 2 ** (IPV6_SIZE - mask)
+    GlobalStats.v4_ips, v4_ranges = address_count(
+        GlobalStats.v4_prefix_keys, 4
+    )
+    GlobalStats.v6_ips, v6_ranges = address_count(
+        GlobalStats.v6_prefix_keys, 6
+    )
 
     print(
         f"{len(GlobalStats.v4_pfx_tree)} v4 prefixes seen across all networks"
     )
-    print(f"{len(v4_aggregates)} v4 prefixes after aggregation")
+    print(f"{v4_ranges} v4 address ranges after merging")
     print(f"{GlobalStats.v4_ips} IPv4 addresses covered by v4 prefixes")
     print(
         f"{len(GlobalStats.v6_pfx_tree)} v6 prefixes seen across all networks"
     )
-    print(f"{len(v4_aggregates)} v6 prefixes after aggregation")
+    print(f"{v6_ranges} v6 address ranges after merging")
     print(f"{GlobalStats.v6_ips} IPv6 addresses covered by v6 prefixes")
     print("")
 
 
-def calculate_ip_coverage_per_asn(filename: str) -> IpCoverage:
+def calculate_global_prefix_keys(asn_list: list[int]) -> None:
     """
-    Calculate the coverage of IP space visible via a network
+    Build the global prefix dictionary, the sorted keys of every unique
+    prefix seen via all networks, once per AFI
+    """
+    if GlobalStats.prefix_keys_asns:
+        return
+
+    def merge_prefix_keys(afi: int) -> npt.NDArray[np.uint64]:
+        store = get_stats_store()
+        keys = np.array([], dtype=np.uint64)
+        pending: list[npt.NDArray[np.uint64]] = []
+        pending_count = 0
+        for asn in asn_list:
+            pending.append(store.prefix_keys(asn, afi))
+            pending_count += len(pending[-1])
+            # Merge in batches, rather than concatenating every table
+            if pending_count > max(len(keys), 2**20) * 4:
+                keys = np.unique(np.concatenate([keys] + pending))
+                pending = []
+                pending_count = 0
+        return np.unique(np.concatenate([keys] + pending))
+
+    GlobalStats.v4_prefix_keys = merge_prefix_keys(4)
+    GlobalStats.v6_prefix_keys = merge_prefix_keys(6)
+    GlobalStats.prefix_keys_asns = set(asn_list)
+
+
+def publish_global_prefixes(
+    empty: Optional[dict[str, tuple[str, tuple[int, ...]]]] = None,
+) -> SharedArrays:
     """
-    as_stats = AsStats.from_json(cli_args.uncompressed, filename)
-
-    print(f"{os.getpid()}: Calculating IP coverage for {as_stats.asn}")
-    result = IpCoverage(as_stats.asn, 0, 0)
-
-    v4_aggregates = aggregate_pyt(as_stats.v4_pfx_tree, IPV4_SIZE)
-    v4_ips = 0
-    for prefix in v4_aggregates:
-        mask = int(prefix.split("/")[1])
-        v4_ips += 2 ** (IPV4_SIZE - mask)
-    as_stats.v4_percent = (v4_ips / GlobalStats.v4_ips) * 100
-    result.v4_percent = as_stats.v4_percent
-
-    v6_ips = 0
-    v6_aggregates = aggregate_pyt(as_stats.v6_pfx_tree, IPV6_SIZE)
-    for prefix in v6_aggregates:
-        mask = int(prefix.split("/")[1])
-        v6_ips += 2 ** (IPV6_SIZE - mask)
-    as_stats.v6_percent = (v6_ips / GlobalStats.v6_ips) * 100
-    result.v6_percent = as_stats.v6_percent
-
-    as_stats.to_json(
-        cli_args.uncompressed,
-        get_output_filename(str(as_stats.asn), True, cli_args.output),
+    Publish the global prefix keys, and the total IPs they cover, to shared
+    memory for pool workers. The v6 total doesn't fit in 64 bits, so it's
+    split into high and low halves. Any empty arrays are published zeroed,
+    for the workers to fill in.
+    """
+    return SharedArrays.publish(
+        {
+            "v4_prefix_keys": GlobalStats.v4_prefix_keys,
+            "v6_prefix_keys": GlobalStats.v6_prefix_keys,
+            "ip_totals": np.array(
+                [
+                    GlobalStats.v4_ips,
+                    GlobalStats.v6_ips >> 64,
+                    GlobalStats.v6_ips & (2**64 - 1),
+                ],
+                dtype=np.uint64,
+            ),
+        },
+        empty,
     )
 
+
+def calculate_ip_coverage_per_asn(asn: int) -> IpCoverage:
+    """
+    Calculate the coverage of IP space visible via a network
+    """
+    assert worker_prefixes is not None  # mypy
+    store = get_stats_store()
+    v4_total, v6_total_hi, v6_total_lo = worker_prefixes["ip_totals"].tolist()
+
+    print(f"{os.getpid()}: Calculating IP coverage for {asn}")
+    result = IpCoverage(asn, 0, 0)
+
+    v4_ips, _ = address_count(store.prefix_keys(asn, 4), 4)
+    result.v4_percent = (v4_ips / v4_total) * 100
+
+    v6_ips, _ = address_count(store.prefix_keys(asn, 6), 6)
+    result.v6_percent = (v6_ips / ((v6_total_hi << 64) | v6_total_lo)) * 100
+
     return result
 
 
-def calculate_ip_coverage(as_stats_files: list[str]) -> None:
+def calculate_ip_coverage(asn_list: list[int]) -> None:
     """
     Calculate the percentage of IP space visible via all networks
     """
 
-    print(f"Calculating IP coverage for {len(as_stats_files)} networks")
+    print(f"Calculating IP coverage for {len(asn_list)} networks")
 
     if not len(GlobalStats.v4_pfx_tree) or not len(GlobalStats.v6_pfx_tree):
-        calculate_global_prefixes(as_stats_files=as_stats_files)
+        calculate_global_prefixes(asn_list=asn_list)
         gc.collect()
 
-    pool = multiprocessing.Pool(cli_args.p)
-    results: list[IpCoverage] = pool.map(
-        calculate_ip_coverage_per_asn, as_stats_files
-    )
-    pool.close()
+    shared = publish_global_prefixes()
+    try:
+        pool = multiprocessing.Pool(
+            cli_args.p,
+            initializer=init_coverage_worker,
+            initargs=(
+                os.path.join(cli_args.output, COVERAGE_STATS_STORE),
+                shared.spec,
+            ),
+        )
+        results: list[IpCoverage] = pool.map(
+            calculate_ip_coverage_per_asn, asn_list
+        )
+        pool.close()
+        pool.join()
+    finally:
+        shared.close()
     print("")
 
+    # The results are stored in the parent's AsStats, and written at the end
+    all_as_stats = get_session().get(asn_list, IP_COVERAGE_FIELDS)
+    for as_stats, result in zip(all_as_stats, results, strict=True):
+        as_stats.v4_percent = result.v4_percent
+        as_stats.v6_percent = result.v6_percent
+    get_session().mark_dirty(asn_list, IP_COVERAGE_RESULTS)
+
+    if results_db:
+        results_db.write_ip_coverage(
+            (result.asn, result.v4_percent, result.v6_percent)
+            for result in results
+        )
+
     print_ip_coverage(results)
 
 
-def calculate_prefix_coverage(as_stats_files: list[str]) -> None:
+def calculate_prefix_coverage(asn_list: list[int]) -> None:
     """
     Find all the unique and overlapping prefixes between ASNs
     """
 
-    print(f"Calculating prefix coverage for {len(as_stats_files)} networks")
+    print(f"Calculating prefix coverage for {len(asn_list)} networks")
+
+    all_as_stats = get_session().get(asn_list, PREFIX_COVERAGE_FIELDS)
+
+    calculate_global_prefix_keys(asn_list)
+    if not GlobalStats.prefix_keys_asns.issuperset(asn_list):
+        raise ValueError(
+            "The global prefixes weren't calculated for all of " f"{asn_list}"
+        )
 
-    # Can't call from_json with multiprocessing, pytri can't be pickled
-    all_as_stats: list[AsStats] = []
-    for as_stats_file in as_stats_files:
-        all_as_stats.append(
-            AsStats.from_json(cli_args.uncompressed, as_stats_file)
+    # The table and covered prefix bitmaps of every network, per AFI, are
+    # built in shared memory by the pool workers
+    bitmaps: dict[str, tuple[str, tuple[int, ...]]] = {}
+    for afi in (4, 6):
+        words = (len(getattr(GlobalStats, f"v{afi}_prefix_keys")) + 63) // 64
+        bitmaps[f"v{afi}_tables"] = ("<u8", (len(asn_list), words))
+        bitmaps[f"v{afi}_covered"] = ("<u8", (len(asn_list), words))
+
+    # Every network is compared against every other network in tiles of
+    # PREFIX_COMPARISON_TILE local networks by as many peer networks
+    tiles: list[tuple[int, int, int, int, int]] = []
+    for afi in (4, 6):
+        for r0 in range(0, len(asn_list), PREFIX_COMPARISON_TILE):
+            for c0 in range(0, len(asn_list), PREFIX_COMPARISON_TILE):
+                tiles.append(
+                    (
+                        afi,
+                        r0,
+                        min(r0 + PREFIX_COMPARISON_TILE, len(asn_list)),
+                        c0,
+                        min(c0 + PREFIX_COMPARISON_TILE, len(asn_list)),
+                    )
+                )
+    all_counts = {
+        afi: np.zeros((len(asn_list), len(asn_list)), dtype=np.int64)
+        for afi in (4, 6)
+    }
+
+    shared = publish_global_prefixes(bitmaps)
+    try:
+        pool = multiprocessing.Pool(
+            cli_args.p,
+            initializer=init_coverage_worker,
+            initargs=(
+                os.path.join(cli_args.output, COVERAGE_STATS_STORE),
+                shared.spec,
+                True,
+            ),
+        )
+        all_covered_by_peers = pool.map(
+            build_prefix_bitmaps, [(4, asn_list), (6, asn_list)]
         )
+        for (afi, r0, r1, c0, c1), counts in pool.imap_unordered(
+            compare_prefix_tile, tiles
+        ):
+            all_counts[afi][r0:r1, c0:c1] = counts
+        pool.close()
+        pool.join()
+    finally:
+        shared.close()
+
+    for afi, covered_by_peers in zip((4, 6), all_covered_by_peers):
+        counts = all_counts[afi]
+        for idx, local_as in enumerate(all_as_stats):
+            if afi == 4:
+                peers_w_cover = local_as.peers_w_cover_v4_pfx
+                peers_wo_cover = local_as.peers_wo_cover_v4_pfx
+                pfx_covered_by_peers = local_as.v4_pfx_covered_by_peers
+            else:
+                peers_w_cover = local_as.peers_w_cover_v6_pfx
+                peers_wo_cover = local_as.peers_wo_cover_v6_pfx
+                pfx_covered_by_peers = local_as.v6_pfx_covered_by_peers
 
-    for local_as in all_as_stats:
-        print(f"Comparing prefixes for {local_as.asn}")
-        for peer_as in all_as_stats:
+            for peer_idx, peer_as in enumerate(all_as_stats):
+                if peer_idx == idx:
+                    continue
+                peers_w_cover[peer_as.asn] = int(counts[idx, peer_idx])
+                peers_wo_cover[peer_as.asn] = int(
+                    counts[idx, idx] - counts[idx, peer_idx]
+                )
+            pfx_covered_by_peers.update(
+                key_prefixes(covered_by_peers[idx], afi)
+            )
 
-            if local_as == peer_as:
-                continue
+    get_session().mark_dirty(asn_list, PREFIX_COVERAGE_RESULTS)
 
-            local_as.peers_w_cover_v4_pfx[peer_as.asn] = 0
-            local_as.peers_wo_cover_v4_pfx[peer_as.asn] = 0
-            local_as.peers_w_cover_v6_pfx[peer_as.asn] = 0
-            local_as.peers_wo_cover_v6_pfx[peer_as.asn] = 0
-
-            for prefix in local_as.v4_pfx_tree:
-                if prefix in peer_as.v4_pfx_tree:
-                    local_as.peers_w_cover_v4_pfx[peer_as.asn] += 1
-                    local_as.v4_pfx_covered_by_peers.add(prefix)
-                    if prefix in local_as.v4_pfx_n_covered_by_peers:
-                        local_as.v4_pfx_n_covered_by_peers.remove(prefix)
-                else:
-                    local_as.peers_wo_cover_v4_pfx[peer_as.asn] += 1
-
-            for prefix in local_as.v6_pfx_tree:
-                if prefix in peer_as.v6_pfx_tree:
-                    local_as.peers_w_cover_v6_pfx[peer_as.asn] += 1
-                    local_as.v6_pfx_covered_by_peers.add(prefix)
-                    if prefix in local_as.v6_pfx_n_covered_by_peers:
-                        local_as.v6_pfx_n_covered_by_peers.remove(prefix)
-                else:
-                    local_as.peers_wo_cover_v6_pfx[peer_as.asn] += 1
-
-        local_as.to_json(
-            cli_args.uncompressed,
-            get_output_filename(str(local_as.asn), True, cli_args.output),
-        )
+    if results_db:
+        results_db.write_prefix_coverage(all_as_stats)
 
     print("")
     print_prefix_coverage(all_as_stats)
     print_t1_prefix_preference(all_as_stats)
 
 
+def compare_asns(all_as_stats: list[AsStats]) -> None:
+    """
+    Compare the ASNs of every network against every other network.
+
+    The on-net and reachable ASNs of each network are rows of a bitset
+    matrix, so the per peer counts are popcounts of ANDed rows, and each
+    pair of networks is only intersected once. The ASNs each network shares
+    with any other network come from how many networks each ASN is in.
+    """
+    print(f"Comparing ASNs for {len(all_as_stats)} networks")
+    on_net = BitsetMatrix.from_sets([a.on_net_asns for a in all_as_stats])
+    reachable = BitsetMatrix.from_sets(
+        [a.asns_reachable for a in all_as_stats]
+    )
+    on_net_counts = on_net.intersection_counts()
+    reachable_counts = reachable.intersection_counts()
+    on_net_for_peers = on_net.shared_items()
+    reachable_via_peers = reachable.shared_items()
+
+    for idx, local_as in enumerate(all_as_stats):
+        for peer_idx, peer_as in enumerate(all_as_stats):
+            if peer_idx == idx:
+                continue
+
+            count = int(on_net_counts[idx, peer_idx])
+            local_as.peers_w_asn_on_net[peer_as.asn] = count
+            local_as.peers_wo_asn_on_net[peer_as.asn] = (
+                len(local_as.on_net_asns) - count
+            )
+
+            count = int(reachable_counts[idx, peer_idx])
+            local_as.peers_w_reachable_asn[peer_as.asn] = count
+            local_as.peers_wo_reachable_asn[peer_as.asn] = (
+                len(local_as.asns_reachable) - count
+            )
+
+        local_as.asns_on_net_for_peers = asn_array(
+            np.concatenate(
+                [local_as.asns_on_net_for_peers, on_net_for_peers[idx]]
+            )
+        )
+        local_as.asns_n_on_net_for_peers = np.setdiff1d(
+            local_as.asns_n_on_net_for_peers,
+            local_as.asns_on_net_for_peers,
+            assume_unique=True,
+        )
+        local_as.asns_reachable_via_peers = asn_array(
+            np.concatenate(
+                [local_as.asns_reachable_via_peers, reachable_via_peers[idx]]
+            )
+        )
+
+
+def build_prefix_bitmaps(
+    args: tuple[int, list[int]],
+) -> list[npt.NDArray[np.uint64]]:
+    """
+    Build the v4 or v6 prefix bitmaps of every network in shared memory.
+    Run in a pool worker, one per AFI.
+
+    Each network's table is a bitmap over the IDs of the global prefix
+    dictionary, as is the set of prefixes each network covers, with an equal
+    or less specific prefix. Return the keys of the prefixes of each network
+    which any other network covers.
+    """
+    afi, asn_list = args
+    assert worker_prefixes is not None  # mypy
+    prefix_keys = worker_prefixes[f"v{afi}_prefix_keys"]
+    print(f"{os.getpid()}: Building v{afi} prefix bitmaps")
+    store = get_stats_store()
+    table_ids = [
+        np.searchsorted(prefix_keys, store.prefix_keys(asn, afi))
+        for asn in asn_list
+    ]
+    covered_ids, cover_counts = covered_keys(prefix_keys, table_ids, afi)
+    BitsetMatrix(prefix_keys, table_ids, out=worker_prefixes[f"v{afi}_tables"])
+    BitsetMatrix(
+        prefix_keys, covered_ids, out=worker_prefixes[f"v{afi}_covered"]
+    )
+    # Each table covers its own prefixes, so look for at least 2 covers
+    return [prefix_keys[ids[cover_counts[ids] > 1]] for ids in table_ids]
+
+
+def compare_prefix_tile(
+    tile: tuple[int, int, int, int, int],
+) -> tuple[tuple[int, int, int, int, int], npt.NDArray[np.int64]]:
+    """
+    Count how many of the prefixes of local networks r0 to r1 are covered by
+    each of peer networks c0 to c1, from the bitmaps in shared memory. Run in
+    a pool worker, one tile at a time.
+    """
+    afi, r0, r1, c0, c1 = tile
+    assert worker_prefixes is not None  # mypy
+    return tile, intersection_counts(
+        worker_prefixes[f"v{afi}_tables"][r0:r1],
+        worker_prefixes[f"v{afi}_covered"][c0:c1],
+    )
+
+
+def init_coverage_worker(
+    store_filename: str, shared_spec: SharedArraysSpec, writable: bool = False
+) -> None:
+    """
+    Open the stats store and attach to the global prefixes in a pool
+    worker. Everything the worker needs is passed in, rather than inherited
+    from the parent, so this works with any multiprocessing start method.
+    The shared arrays are only writable if the workers fill some in.
+    """
+    global stats_store, worker_prefixes
+    stats_store = StatsStore(store_filename)
+    worker_prefixes = SharedArrays.attach(shared_spec, writable)
+
+
 def is_full_asn_table(asn: int) -> bool:
-    asn_data = get_asn_report()
-    full = asn_data[str(asn)]["asn_full"]
-    assert isinstance(full, bool)
-    return full
+    return FullTable.ASN in get_full_table_report().full(asn)
 
 
 def is_full_v4_table(asn: int) -> bool:
-    asn_data = get_asn_report()
-    full = asn_data[str(asn)]["v4_full"]
-    assert isinstance(full, bool)
-    return full
+    return FullTable.V4 in get_full_table_report().full(asn)
 
 
 def is_full_v6_table(asn: int) -> bool:
-    asn_data = get_asn_report()
-    full = asn_data[str(asn)]["v6_full"]
-    assert isinstance(full, bool)
-    return full
+    return FullTable.V6 in get_full_table_report().full(asn)
+
+
+def add_prefix(as_stats: AsStats, prefix: str) -> None:
+    """
+    Add a prefix to a network's prefix trees, unless it's filtered out
+    """
+    mask = int(prefix.split("/")[1])
+    if ":" in prefix:
+        """
+        Some networks export prefixes to public collectors which aren't
+        reachable outside that network
+        """
+        if mask > 48 or mask < 16:
+            return
+        """
+        Some networks export a default route
+        """
+        if prefix == "::/0":
+            return
+        as_stats.v6_pfx_tree.insert(prefix, None)
+        as_stats.v6_pfx_n_preferred_by_t1s.add(prefix)
+    else:
+        if mask > 24 or mask < 8:
+            return
+        if prefix == "0.0.0.0/0":
+            return
+        as_stats.v4_pfx_tree.insert(prefix, None)
+        as_stats.v4_pfx_n_preferred_by_t1s.add(prefix)
+
+
+def set_tier1_preference(
+    as_stats: AsStats, prefix: str, best_paths: list[list[int]]
+) -> None:
+    """
+    Record whether the shortest AS paths to a prefix are via a tier 1
+    """
+    # Are any of the first hops Tier 1 ASNs?
+    for as_path in best_paths:
+        # Locally originated prefix
+        if len(as_path) == 0:
+            if "." in prefix:
+                as_stats.v4_pfx_n_preferred_by_t1s.add(prefix)
+            else:
+                as_stats.v6_pfx_n_preferred_by_t1s.add(prefix)
+            return
+
+        if is_tier1(as_path[0]):
+            if "." in prefix:
+                as_stats.v4_pfx_preferred_by_t1s.add(prefix)
+                if prefix in as_stats.v4_pfx_n_preferred_by_t1s:
+                    as_stats.v4_pfx_n_preferred_by_t1s.remove(prefix)
+            else:
+                as_stats.v6_pfx_preferred_by_t1s.add(prefix)
+                if prefix in as_stats.v6_pfx_n_preferred_by_t1s:
+                    as_stats.v6_pfx_n_preferred_by_t1s.remove(prefix)
+            return
+
+    if "." in prefix:
+        as_stats.v4_pfx_n_preferred_by_t1s.add(prefix)
+    else:
+        as_stats.v6_pfx_n_preferred_by_t1s.add(prefix)
 
 
 def parse_asn_file(filename: str) -> Optional[str]:
     """
-    Load and parse a per-ASN AsnRoutes JSON file.
+    Load and parse a per-ASN merged routes file, in any format.
     As the data is loaded in, pre-calculate some stats used later.
+    The file is streamed, one prefix at a time, in a single pass over the
+    routes, so the whole table is never held in memory.
     """
 
     print(f"{os.getpid()}: Loading {filename}...")
-    if os.path.splitext(filename)[1] == ".gz":
-        with gzip.open(filename, "rb") as f:
-            asn_routes = AsnRoutes.from_dict(orjson.loads(f.read()))
-    else:
-        with open(filename) as f:
-            asn_routes = AsnRoutes.from_dict(orjson.loads(f.read()))
+    asn_routes = open_routes(filename)
 
     # Skip files which aren't for an ASNs of interest:
     if skip_asn(asn_routes.peer_as):
         print(f"{os.getpid()}: Skipping {asn_routes.peer_as}, not of interest")
         return None
 
-    as_stats = AsStats(
-        asn=asn_routes.peer_as,
-        v4_percent=0.0,
-        v6_percent=0.0,
-        v4_pfx_tree=pytricia.PyTricia(IPV4_SIZE),
-        v6_pfx_tree=pytricia.PyTricia(IPV6_SIZE),
-        as_path_lengths={},
-        avg_as_path_length=0,
-        weighted_as_path_score=0,
-        as_hops={},
-        as_hops_freq={},
-        avg_as_hops=0,
-        weighted_as_hops_score=0,
-        peers_w_cover_v4_pfx={},
-        peers_wo_cover_v4_pfx={},
-        v4_pfx_covered_by_peers=set(),
-        v4_pfx_n_covered_by_peers=set(),
-        v4_pfx_preferred_by_t1s=set(),
-        v4_pfx_n_preferred_by_t1s=set(),
-        peers_w_cover_v6_pfx={},
-        peers_wo_cover_v6_pfx={},
-        v6_pfx_covered_by_peers=set(),
-        v6_pfx_n_covered_by_peers=set(),
-        v6_pfx_preferred_by_t1s=set(),
-        v6_pfx_n_preferred_by_t1s=set(),
-        asns_reachable=set(),
-        asns_reachable_via_peers=set(),
-        asns_n_reachable_via_peers=set(),
-        peers_w_reachable_asn={},
-        peers_wo_reachable_asn={},
-        on_net_asns=set(),
-        asns_on_net_for_peers=set(),
-        asns_n_on_net_for_peers=set(),
-        peers_w_asn_on_net={},
-        peers_wo_asn_on_net={},
-    )
-
-    """
-    Pre-populate v4 and v6 data from the loaded routes
-    """
-    print(f"{os.getpid()}: Populating prefixes for {as_stats.asn}")
-    for prefix in asn_routes.routes.keys():
-        if BogonPrefixes.is_bogon(prefix):
-            continue
-        mask = int(prefix.split("/")[1])
-        if ":" in prefix:
-            """
-            Some networks export prefixes to public collectors which aren't
-            reachable outside that network
-            """
-            if mask > 48 or mask < 16:
-                continue
-            """
-            Some networks export a default route
-            """
-            if prefix == "::/0":
-                continue
-            as_stats.v6_pfx_tree.insert(prefix, None)
-            as_stats.v6_pfx_n_covered_by_peers.add(prefix)
-            as_stats.v6_pfx_n_preferred_by_t1s.add(prefix)
-        else:
-            if mask > 24 or mask < 8:
-                continue
-            if prefix == "0.0.0.0/0":
-                continue
-            as_stats.v4_pfx_tree.insert(prefix, None)
-            as_stats.v4_pfx_n_covered_by_peers.add(prefix)
-            as_stats.v4_pfx_n_preferred_by_t1s.add(prefix)
+    as_stats = AsStats(asn=asn_routes.peer_as)
 
     """
-    Pre-populate ASN data from the loaded routes.
+    Pre-populate the prefix, ASN and tier 1 data in one walk over the
+    routes. Each AS path is normalised once, by removing bogon ASNs.
 
-    Create a set of de-duped on-net ASNs.
+    ASN sets are built here and stored in the AsStats object as sorted
+    arrays once complete.
     """
-    print(f"{os.getpid()}: Populating ASNs for {as_stats.asn}")
-
-    for as_paths in asn_routes.routes.values():
-        for as_path in as_paths:
+    print(
+        f"{os.getpid()}: Populating prefixes, ASNs and tier 1 paths for "
+        f"{as_stats.asn}"
+    )
+    min_hops: dict[int, int] = {}  # The lowest hop count of each ASN
+    hop_buckets: dict[int, None] = {}  # Hop counts any ASN was stored at
+    on_net_asns: set[int] = set()
+    asns_n_on_net_for_peers: set[int] = set()
+    bogon_asns: dict[int, bool] = {}  # BogonAsns.is_bogon() of each ASN
+
+    path_count = 0
+    for prefix, as_paths in asn_routes:
+        if not BogonPrefixes.is_bogon(prefix):
+            add_prefix(as_stats, prefix)
+
+        path_count += len(as_paths)
+        best_paths: list[list[int]] = []
 
-            for asn in as_path[:]:
-                if BogonAsns.is_bogon(asn):
-                    as_path.remove(asn)
+        for raw_path in as_paths:
+            for asn in raw_path:
+                if asn not in bogon_asns:
+                    bogon_asns[asn] = BogonAsns.is_bogon(asn)
+            as_path = [asn for asn in raw_path if not bogon_asns[asn]]
 
             path_len = len(as_path)
             # It was a path of entirely bogon ASNs
             assert path_len, f"{os.getpid()}: null AS path after bogon removal"
 
-            as_stats.asns_reachable.update(as_path)
-            as_stats.asns_n_reachable_via_peers.update(as_path)
-
             """
             Record the AS path lengths as we go, later calculate avg.
 
             All paths start with the network's own ASN, which makes the AS paths
             1 hop longer than they are when referring to external connectivity.
             """
-            if (path_len - 1) not in as_stats.as_path_lengths:
-                as_stats.as_path_lengths[path_len - 1] = 1
-            else:
-                as_stats.as_path_lengths[path_len - 1] += 1
+            as_stats.as_path_lengths[path_len - 1] = (
+                as_stats.as_path_lengths.get(path_len - 1, 0) + 1
+            )
 
             """
             An ASN might be reachable via paths of varying lengths.
-            Only count the shortest path, and remove count of existing longer
-            path.
-            Later calculate avg.
+            Only count the shortest path, later calculate avg.
             """
             for idx, asn in enumerate(as_path):
-                for hop_count in as_stats.as_hops.keys():
-                    if int(asn) in as_stats.as_hops[hop_count]:
-                        # Found the AS with a higher hop count
-                        if hop_count > idx:
-                            # Remove it and store at lower hop count
-                            as_stats.as_hops[hop_count].remove(int(asn))
-                            if idx not in as_stats.as_hops:
-                                as_stats.as_hops[idx] = set()
-                            as_stats.as_hops[idx].add(int(asn))
-                            break
-                        # Found AS with same of lower hop count
-                        if hop_count <= idx:
-                            # No need to store this hop count
-                            break
-                else:
-                    # Didn't find the ASN yet, store hop count
-                    if idx not in as_stats.as_hops:
-                        as_stats.as_hops[idx] = set()
-                    as_stats.as_hops[idx].add(int(asn))
+                if min_hops.get(asn, path_len) > idx:
+                    min_hops[asn] = idx
+                    hop_buckets[idx] = None
 
             if path_len == 1:
                 """
@@ -569,30 +923,62 @@ def parse_asn_file(filename: str) -> Optional[str]:
                 reachability is implicit:
                 as_stats.on_net_asns.add(as_path[0])
                 """
-                as_stats.asns_n_on_net_for_peers.add(as_path[0])
-            elif path_len > 1:
-                """
-                Ensure the first ASN is the local ASN which ensures the next
-                ASN is the peer ASN
-                """
-                assert int(as_path[0]) == as_stats.asn
-                as_stats.on_net_asns.add(as_path[1])
-                as_stats.asns_n_on_net_for_peers.add(as_path[1])
+                asns_n_on_net_for_peers.add(as_path[0])
+                best_paths = [[]]
+                continue
 
-    assert sum([x for x in as_stats.as_path_lengths.values()]) == sum(
-        [len(as_path) for as_path in asn_routes.routes.values()]
-    )
+            """
+            Ensure the first ASN is the local ASN which ensures the next
+            ASN is the peer ASN
+            """
+            assert as_path[0] == as_stats.asn
+            on_net_asns.add(as_path[1])
+            asns_n_on_net_for_peers.add(as_path[1])
+
+            """
+            Is this a new shortest AS path? The best paths are stored
+            without the local ASN, but compared by the length with it.
+            """
+            if not best_paths:
+                best_paths.append(as_path[1:])
+            elif path_len < len(best_paths[0]):
+                best_paths = [as_path[1:]]
+            elif path_len == len(best_paths[0]):
+                if as_path[1:] not in best_paths:
+                    best_paths.append(as_path[1:])
+
+        set_tier1_preference(as_stats, prefix, best_paths)
+
+    """
+    Group the ASNs by their lowest hop count. A hop count whose ASNs were
+    all later found at a lower hop count keeps an empty bucket.
+    """
+    hop_asns = np.fromiter(min_hops.keys(), dtype=np.uint32)
+    hop_counts = np.fromiter(min_hops.values(), dtype=np.int64)
+    order = np.lexsort((hop_asns, hop_counts))
+    hop_asns, hop_counts = hop_asns[order], hop_counts[order]
+    buckets = list(hop_buckets)
+    starts = np.searchsorted(hop_counts, buckets).tolist()
+    ends = np.searchsorted(hop_counts, buckets, side="right").tolist()
+    as_stats.asns_reachable = np.sort(hop_asns)
+    as_stats.as_hops = {
+        hop_count: hop_asns[start:end]
+        for hop_count, start, end in zip(buckets, starts, ends)
+    }
+    as_stats.on_net_asns = asn_array(on_net_asns)
+    as_stats.asns_n_on_net_for_peers = asn_array(asns_n_on_net_for_peers)
+    del min_hops, hop_buckets, on_net_asns, asns_n_on_net_for_peers
+
+    assert sum([x for x in as_stats.as_path_lengths.values()]) == path_count
 
     assert sum([len(x) for x in as_stats.as_hops.values()]) == len(
         as_stats.asns_reachable
     )
 
     # Calculate the mode AS path length
+    max_freq = max(as_stats.as_path_lengths.values())
     modes = [
-        k
-        for k in as_stats.as_path_lengths
-        if as_stats.as_path_lengths[k]
-        == max(as_stats.as_path_lengths.values())
+        k for k, freq in as_stats.as_path_lengths.items() if freq == max_freq
     ]
     if len(modes) != 1:
         raise ValueError(
@@ -617,10 +1003,9 @@ def parse_asn_file(filename: str) -> Optional[str]:
     for hop_count in as_stats.as_hops:
         as_stats.as_hops_freq[hop_count] = len(as_stats.as_hops[hop_count])
 
+    max_freq = max(as_stats.as_hops_freq.values())
     modes = [
-        k
-        for k in as_stats.as_hops_freq
-        if as_stats.as_hops_freq[k] == max(as_stats.as_hops_freq.values())
+        k for k, freq in as_stats.as_hops_freq.items() if freq == max_freq
     ]
     if len(modes) != 1:
         raise ValueError(
@@ -634,71 +1019,6 @@ def parse_asn_file(filename: str) -> Optional[str]:
         if as_hops > 0 and as_hops < 11:
             as_stats.weighted_as_hops_score += (max_hops - as_hops) * frequency
 
-    """
-    Pre-populate AS path shortest via a tier 1, for each prefix.
-    """
-    print(f"{os.getpid()}: Populating tier 1 paths for {as_stats.asn}")
-
-    for prefix, as_paths in asn_routes.routes.items():
-        best_paths: list[list[int]] = []
-
-        for as_path in as_paths:
-            for asn in as_path[:]:
-                if BogonAsns.is_bogon(asn):
-                    as_path.remove(asn)
-
-            path_len = len(as_path)
-            # It was a path of entirely bogon ASNs
-            assert (
-                path_len
-            ), f"{os.getpid()}: empty AS path after bogon removal"
-
-            # First ASN is always the local ASN
-            if path_len == 1:
-                best_paths = [[]]
-                continue
-
-            # Remove the local ASN
-            as_path.remove(as_stats.asn)
-
-            # Is this a new shortest AS path?
-            if not best_paths:
-                best_paths.append(as_path)
-            else:
-                if path_len > len(best_paths[0]):
-                    continue
-                elif path_len == len(best_paths[0]):
-                    if as_path not in best_paths:
-                        best_paths.append(as_path)
-                elif path_len < len(best_paths[0]):
-                    best_paths = [as_path]
-
-        # Are any of the first hops Tier 1 ASNs?
-        for as_path in best_paths:
-            # Locally originated prefix
-            if len(as_path) == 0:
-                if "." in prefix:
-                    as_stats.v4_pfx_n_preferred_by_t1s.add(prefix)
-                else:
-                    as_stats.v6_pfx_n_preferred_by_t1s.add(prefix)
-                break
-
-            if is_tier1(as_path[0]):
-                if "." in prefix:
-                    as_stats.v4_pfx_preferred_by_t1s.add(prefix)
-                    if prefix in as_stats.v4_pfx_n_preferred_by_t1s:
-                        as_stats.v4_pfx_n_preferred_by_t1s.remove(prefix)
-                else:
-                    as_stats.v6_pfx_preferred_by_t1s.add(prefix)
-                    if prefix in as_stats.v6_pfx_n_preferred_by_t1s:
-                        as_stats.v6_pfx_n_preferred_by_t1s.remove(prefix)
-                break
-        else:
-            if "." in prefix:
-                as_stats.v4_pfx_n_preferred_by_t1s.add(prefix)
-            else:
-                as_stats.v6_pfx_n_preferred_by_t1s.add(prefix)
-
     print(
         f"{os.getpid()}: Parsed {len(as_stats.asns_reachable)} ASNs, "
         f"{len(as_stats.v4_pfx_tree)} v4 prefixes, "
@@ -706,10 +1026,8 @@ def parse_asn_file(filename: str) -> Optional[str]:
         f"for {as_stats.asn}"
     )
 
-    out_filename = get_output_filename(
-        str(as_stats.asn), True, cli_args.output
-    )
-    as_stats.to_json(cli_args.uncompressed, out_filename)
+    out_filename = get_output_filename(str(as_stats.asn), cli_args.output)
+    as_stats.to_file(cli_args.codec, out_filename)
     return out_filename
 
 
@@ -719,9 +1037,7 @@ def parse_asn_files(asn_list: list[int]) -> list[str]:
     Spread this over multiple processes.
     """
 
-    filenames: list[str] = get_input_filenames(
-        asn_list, not cli_args.uncompressed
-    )
+    filenames: list[str] = get_input_filenames(asn_list)
     print(f"Loading {len(filenames)} input files")
 
     pool = multiprocessing.Pool(cli_args.p)
@@ -920,10 +1236,8 @@ def print_continent_breakdown(all_as_stats: list[AsStats]) -> None:
     each continent, to show any continental differences between networks.
     """
 
-    continent_mappings = get_asn_to_continent_mappings(
-        os.path.join(RAW_DATA, NRO_ALLOCATIONS)
-    )
-    continents: set[str] = set(list(continent_mappings.values()))
+    registry = NroRegistry.load(os.path.join(RAW_DATA, NRO_ALLOCATIONS))
+    continents: set[str] = set(registry.continent_names())
 
     table_data: list[list[str]] = []
     table_headers = ["ASN", "Name", "T1", "Directly Connected ASNs"]
@@ -939,8 +1253,8 @@ def print_continent_breakdown(all_as_stats: list[AsStats]) -> None:
             continent: 0 for continent in continents
         }
 
-        for asn in as_stats.as_hops[1]:
-            continent_count[continent_mappings[asn]] += 1
+        for asn in as_stats.as_hops[1].tolist():
+            continent_count[registry.continent(asn)] += 1
 
         row = [
             f"{as_stats.asn}",
@@ -1362,14 +1676,45 @@ def parse_cli_args() -> None:
         f"{FULL_TABLE_REPORT} are included. This option takes precedence if used.",
         type=str,
     )
+    parser.add_argument(
+        "-codec",
+        help="Output codec for AsStats fields and global stats, "
+        "either a preset "
+        f"({', '.join(CODEC_PRESETS.keys())}) "
+        "or compression[:level][:indent|compact][:t<threads>] where "
+        "compression is one of "
+        f"{', '.join(COMPRESSION_SUFFIXES.keys())}. "
+        "Input files are read with whichever codec wrote them. "
+        "gzip is compressed with -p threads unless t<threads> is given",
+        type=str,
+        default="default",
+    )
+    parser.add_argument(
+        "-db",
+        help="Also write the results to an indexed SQLite database, "
+        f"{COVERAGE_RESULTS_DB} in the output directory",
+        default=False,
+        action="store_true",
+        required=False,
+    )
     parser.add_argument(
         "-input",
-        help="Path to merged AsnRoutes JSON files to parse as input. "
+        help="Path to merged AsnRoutes files, in any format, to parse as "
+        "input. "
         "Ignored if -skip is used.",
         type=str,
         metavar="path",
         default=MERGED_PATHS_PATH,
     )
+    parser.add_argument(
+        "-json",
+        help="Also export each network's AsStats as JSON, "
+        "{asn}-stats.json[.gz|.bz2|.xz] in the output directory, "
+        "as written before AsStats fields files",
+        default=False,
+        action="store_true",
+        required=False,
+    )
     parser.add_argument(
         "-na",
         help="Don't produce ASN coverage stats",
@@ -1419,9 +1764,17 @@ def parse_cli_args() -> None:
         action="store_true",
         required=False,
     )
+    parser.add_argument(
+        "-ta",
+        help="Threshold for minimum ASNs to consider a table full, when there "
+        "is no full table report and it's built from the merge summaries. "
+        "This should match the -ta given to count_of_merged.py",
+        type=int,
+        default=FULL_TABLE_ASN_THRESHOLD,
+    )
     parser.add_argument(
         "-uncompressed",
-        help="Read and write uncompressed files",
+        help="Write uncompressed files, overrides -codec",
         default=False,
         action="store_true",
         required=False,
@@ -1429,6 +1782,7 @@ def parse_cli_args() -> None:
 
     global cli_args
     cli_args = parser.parse_args()
+    cli_args.codec = get_codec(cli_args.codec, cli_args.uncompressed)
 
     if cli_args.asns:
         cli_args.asns = cli_args.asns.split(",")
@@ -1444,6 +1798,25 @@ def parse_cli_args() -> None:
         raise ValueError(f"Input must be a directory: {cli_args.input}")
 
 
+def write_stats_store(as_stats_files: list[str]) -> None:
+    """
+    Write the parsed stats of all networks to one memory-mappable store,
+    which the later stages and their worker processes read from.
+    AsStats JSON files written by older versions are converted to field
+    containers, so that each stage can update the result fields in place.
+    """
+    filename = os.path.join(cli_args.output, COVERAGE_STATS_STORE)
+    with StatsStoreWriter(filename) as writer:
+        for as_stats_file in as_stats_files:
+            as_stats = AsStats.load(as_stats_file)
+            writer.add(as_stats)
+            fields_filename = get_output_filename(
+                str(as_stats.asn), cli_args.output
+            )
+            if as_stats_file != fields_filename:
+                as_stats.to_file(cli_args.codec, fields_filename)
+
+
 def write_csv(
     filename: str, headers: list[str], rows: list[list[str]]
 ) -> None:
@@ -1455,16 +1828,50 @@ def write_csv(
         csv_writer.writerows(rows)
     print(f"Wrote to {filename}")
 
+    if results_db:
+        results_db.write_report(os.path.basename(filename), headers, rows)
+
+
+def write_json_exports(asn_list: list[int], codec: Codec) -> None:
+    """
+    Export the AsStats file of each network as JSON, for tools which read
+    the {asn}-stats.json files written by older versions
+    """
+    for filename in get_output_filenames(
+        asn_list, cli_args.output, missing_ok=True
+    ):
+        as_stats = AsStats.load(filename)
+        json_filename = codec.filename(
+            os.path.join(cli_args.output, f"{as_stats.asn}-stats.json")
+        )
+        if filename != json_filename:
+            as_stats.to_json(codec, json_filename)
+
 
 def main() -> None:
+    global results_db
     parse_cli_args()
 
+    if cli_args.db:
+        results_db = ResultsDb(
+            os.path.join(cli_args.output, COVERAGE_RESULTS_DB)
+        )
+
+    if cli_args.asns:
+        parse_asn_list = [int(asn) for asn in cli_args.asns]
+    else:
+        parse_asn_list = get_asns_full_table_any()
+
+    store_filename = os.path.join(cli_args.output, COVERAGE_STATS_STORE)
     if not cli_args.skip:
         BogonAsns.load_allocated_asns(os.path.join(RAW_DATA, NRO_ALLOCATIONS))
-        if cli_args.asns:
-            parse_asn_files([int(asn) for asn in cli_args.asns])
-        else:
-            parse_asn_files(get_asns_full_table_any())
+        write_stats_store(parse_asn_files(parse_asn_list))
+    elif not os.path.exists(store_filename):
+        write_stats_store(
+            get_output_filenames(
+                parse_asn_list, cli_args.output, missing_ok=True
+            )
+        )
 
     if not cli_args.na:
         if cli_args.asns:
@@ -1472,10 +1879,7 @@ def main() -> None:
         else:
             asn_list = get_asns_full_table_asn()
 
-        as_stats_files = get_output_filenames(
-            asn_list, not cli_args.uncompressed, cli_args.output
-        )
-        calculate_asn_coverage(as_stats_files)
+        calculate_asn_coverage(asn_list)
         gc.collect()
 
     if not cli_args.ni:
@@ -1484,10 +1888,7 @@ def main() -> None:
         else:
             asn_list = get_asns_full_table_ip()
 
-        as_stats_files = get_output_filenames(
-            asn_list, not cli_args.uncompressed, cli_args.output
-        )
-        calculate_ip_coverage(as_stats_files)
+        calculate_ip_coverage(asn_list)
         gc.collect()
 
     if not cli_args.np:
@@ -1496,13 +1897,21 @@ def main() -> None:
         else:
             asn_list = get_asns_full_table_ip()
 
-        as_stats_files = get_output_filenames(
-            asn_list, not cli_args.uncompressed, cli_args.output
-        )
-        calculate_prefix_coverage(as_stats_files)
+        calculate_prefix_coverage(asn_list)
         gc.collect()
 
-    GlobalStats.to_json()
+    # Each network's file is written once, serially by the parent process
+    get_session().write(cli_args.codec.parallel(cli_args.p))
+    GlobalStats.to_json(cli_args.codec.parallel(cli_args.p))
+    if cli_args.json:
+        write_json_exports(parse_asn_list, cli_args.codec.parallel(cli_args.p))
+
+    if results_db:
+        results_db.close()
+        print(
+            "Wrote results to "
+            f"{os.path.join(cli_args.output, COVERAGE_RESULTS_DB)}"
+        )
 
 
 if __name__ == "__main__":
@@ -3,12 +3,10 @@
 from __future__ import annotations
 
 import argparse
-import gzip
 import os
 
 import matplotlib.pyplot as plt
 import networkx as nx
-import orjson
 from inc.asns import asns
 from inc.bogon_asns import BogonAsns
 from inc.download import get_url_to_file
@@ -18,6 +16,7 @@ from inc.globals import (
     NRO_ALLOCATIONS,
     RAW_DATA,
 )
+from inc.routes_files import find_routes_file, open_routes
 
 cli_args: argparse.Namespace
 
@@ -32,25 +31,18 @@ def download_nro_delegated_stats() -> str:
     )
 
 
-def get_filename(asn: str, compressed: bool, directory: str) -> str:
+def get_filename(asn: str, directory: str) -> str:
     """
-    Return the filename for a AsnRoutes object serialised to JSON
+    Return the filename for the merged AsnRoutes of an ASN, in any format
     """
-    filename = os.path.join(directory, f"{asn}-routes.json")
-    if compressed:
-        return filename + ".gz"
-    if not os.path.exists(filename):
-        raise FileExistsError(f"File doesn't exist: {filename}")
-    return filename
+    return find_routes_file(asn, directory)
 
 
-def get_filenames(
-    asn_list: list[str], compressed: bool, directory: str
-) -> list[str]:
+def get_filenames(asn_list: list[str], directory: str) -> list[str]:
     """
     Return the list of AsnRoutes filenames based on the chosen ASNs
     """
-    return [get_filename(asn, compressed, directory) for asn in asn_list]
+    return [get_filename(asn, directory) for asn in asn_list]
 
 
 def load_asn_data() -> dict[int, set[int]]:
@@ -59,26 +51,16 @@ def load_asn_data() -> dict[int, set[int]]:
     """
 
     asns: dict[int, set[int]] = {}
-    filenames = get_filenames(
-        cli_args.asns, not cli_args.uncompressed, cli_args.input
-    )
+    filenames = get_filenames(cli_args.asns, cli_args.input)
 
     BogonAsns.load_allocated_asns(os.path.join(RAW_DATA, NRO_ALLOCATIONS))
 
     for filename in filenames:
         print(f"Loading {filename}")
 
-        data: dict
-        if cli_args.uncompressed:
-            with open(filename) as f:
-                data = orjson.loads(f.read())
-        else:
-            with gzip.open(filename, "rt") as f:
-                data = orjson.loads(f.read())
-
         print("Parsing data")
-        as_paths: list[list[str]]
-        for as_paths in data["routes"].values():
+        as_paths: list[list[int]]
+        for _, as_paths in open_routes(filename):
             for as_path in as_paths:
 
                 if len(as_path) == 1:
@@ -204,7 +186,7 @@ def parse_cli_args() -> None:
     )
     parser.add_argument(
         "-input",
-        help="Path to AsnRoutes JSON files to parse as input",
+        help="Path to merged AsnRoutes files to parse as input",
         type=str,
         metavar="path",
         default=MERGED_PATHS_PATH,
@@ -229,13 +211,6 @@ def parse_cli_args() -> None:
         metavar="path",
         default=ASN_GRAPHS_PATH,
     )
-    parser.add_argument(
-        "-uncompressed",
-        help="Read and write uncompressed files",
-        default=False,
-        action="store_true",
-        required=False,
-    )
 
     global cli_args
     cli_args = parser.parse_args()
@@ -2,6 +2,10 @@
 * Inline the main function from the aggregate6 module
 * Replace py-radix with Pytricia
 * Inline the certain functions from the ipaddress module
+* Aggregate (int, mask) pairs in one sorted pass with a stack, instead of
+  repeated passes over a pytricia tree converting between strings and ints
+* Remove aggregating pytricia trees of prefix strings, coverage.py counts
+  covered address space from prefix keys instead
 
 Load a full DFZ table into a py-radix tree and aggregate using aggregate6:
 
@@ -26,7 +30,7 @@ Aggregated to 162315 v4 prefixes and 58546 v6 prefixes
 Duration: 24.281097173690796
 """
 
-import pytricia
+from collections.abc import Iterable
 
 
 def int_to_ip(ip_int: int, size: int) -> str:
@@ -35,18 +39,15 @@ def int_to_ip(ip_int: int, size: int) -> str:
             str((ip_int >> (i * 8)) & 0xFF) for i in range(3, -1, -1)
         )
     else:
-        hex_str = '%032x' % ip_int
-        hextets = ['%x' % int(hex_str[x : x + 4], 16) for x in range(0, 32, 4)]
-        return ':'.join(hextets)
+        return ':'.join(
+            '%x' % ((ip_int >> (i * 16)) & 0xFFFF) for i in range(7, -1, -1)
+        )
 
 
 def ip_to_int(ip: str, size: int) -> int:
     if size == 32:
         octets = list(map(int, ip.split(".")))
-        return int(
-            f"{octets[0] << 24 | octets[1] << 16 | octets[2] << 8 | octets[3]:032b}",
-            2,
-        )
+        return octets[0] << 24 | octets[1] << 16 | octets[2] << 8 | octets[3]
     else:
 
         skip_index = None
@@ -87,62 +88,44 @@ def ip_to_int(ip: str, size: int) -> int:
         return ip_int
 
 
-def aggregate_pyt(tree: pytricia.PyTricia, size: int) -> list[str]:
-    # phase1 removes any supplied prefixes which are superfluous because
-    # they are already included in another supplied prefix. For example,
-    # 2001:67c:208c:10::/64 would be removed if 2001:67c:208c::/48 was
-    # also supplied.
-    n_tree = pytricia.PyTricia(size)
-
-    for prefix in tree:
-        parent = prefix
-        while tree.parent(parent):
-            parent = tree.parent(parent)
-        n_tree.insert(parent, None)
+def aggregate_ints(
+    prefixes: Iterable[tuple[int, int]], size: int
+) -> list[tuple[int, int]]:
+    """
+    Aggregate (network int, mask length) pairs, and return the aggregates
+    as (network int, mask length) pairs in sorted order
+    """
+    stack: list[tuple[int, int]] = []
+    covered_to = -1  # Last address of the prefixes kept so far
+
+    # Sorted by network and then mask, a prefix comes before the more
+    # specific prefixes it covers
+    for net, mask in sorted(set(prefixes)):
+        # phase1 removes any supplied prefixes which are superfluous because
+        # they are already included in another supplied prefix. For example,
+        # 2001:67c:208c:10::/64 would be removed if 2001:67c:208c::/48 was
+        # also supplied.
+        if net <= covered_to:
+            continue
+        covered_to = net + (1 << (size - mask)) - 1
 
-    potential = len(n_tree)
-
-    while potential:
         # phase2 identifies adjacent prefixes that can be combined under a
         # single, shorter-length prefix. For example, 2001:67c:208c::/48 and
         # 2001:67c:208d::/48 can be combined into the single prefix
-        # 2001:67c:208c::/47.
-        potential = 0
-        for prefix in list(n_tree):
-            base_net, base_mask = prefix.split("/")
-
-            """
-            Don't need to cater for this scenario because elsewhere we ensure
-            no default routes are present
-            """
-            # if base_mask == "0":
-            #    return prefix
-
-            base_net_int = ip_to_int(base_net, size)
-            base_mask_int = int(base_mask)
-
-            parent_mask_int = base_mask_int - 1
-            parent_mask = str(parent_mask_int)
-            parent_mask_bin = ("1" * parent_mask_int) + (
-                "0" * (size - parent_mask_int)
-            )
-            parent_net_int = base_net_int & int(parent_mask_bin, 2)
-            parent_net = int_to_ip(parent_net_int, size)
-
-            next_net_start_bin = (
-                ("0" * base_mask_int) + "1" + ("0" * (size - base_mask_int))
-            )
-            second_subnet_int = parent_net_int | int(next_net_start_bin, 2)
-            second_subnet = int_to_ip(second_subnet_int, size)
-
-            prefix_1 = parent_net + "/" + base_mask
-            prefix_2 = second_subnet + "/" + base_mask
-            parent = parent_net + "/" + parent_mask
-
-            if n_tree.has_key(prefix_1) and n_tree.has_key(prefix_2):
-                n_tree.delete(prefix_1)
-                n_tree.delete(prefix_2)
-                n_tree.insert(parent, None)
-                potential += 1
-
-    return list(n_tree)
+        # 2001:67c:208c::/47. The prefixes are disjoint and sorted, so the
+        # only candidate is the prefix before, and a merged prefix can then
+        # be merged with the one before it.
+        while stack and mask:
+            prev_net, prev_mask = stack[-1]
+            parent_size = 1 << (size - mask + 1)
+            if (
+                prev_mask != mask
+                or prev_net % parent_size
+                or prev_net + (parent_size >> 1) != net
+            ):
+                break
+            stack.pop()
+            net, mask = prev_net, mask - 1
+        stack.append((net, mask))
+
+    return stack
@@ -0,0 +1,288 @@
+"""
+A binary, columnar file format for AsnRoutes.
+
+Prefixes are stored as packed arrays of network integers and mask lengths,
+v4 prefixes first and then v6 prefixes. Each unique AS path is stored once,
+in a pool of ASNs, and each prefix references the IDs of its AS paths.
+Loading the file is a handful of numpy.frombuffer calls, no per-prefix or
+per-path Python objects are built until they are asked for.
+
+File layout, each array starts on an 8 byte boundary:
+
+header: MAGIC, peer_as (uint32), v4 prefix count, v6 prefix count, path count,
+        path pool length, path reference count
+v4_nets: uint32 per v4 prefix
+v4_masks: uint8 per v4 prefix
+v6_nets_hi: uint64 per v6 prefix, the top 64 bits of the network
+v6_nets_lo: uint64 per v6 prefix, the bottom 64 bits of the network
+v6_masks: uint8 per v6 prefix
+path_offsets: uint32 per path + 1, the start of each path in the pool
+path_pool: uint32 per ASN in all unique paths
+prefix_offsets: uint32 per prefix + 1, the start of each prefix's path IDs
+path_refs: uint32 per path ID referenced by all prefixes
+"""
+
+from __future__ import annotations
+
+import gzip
+import ipaddress
+import os
+import struct
+from collections.abc import Iterator
+from typing import Any
+
+import numpy as np
+import numpy.typing as npt
+
+from inc.aggregate6 import int_to_ip, ip_to_int
+from inc.globals import IPV4_SIZE, IPV6_SIZE
+from inc.stats import AsnRoutes
+
+MAGIC = b"T1BINR01"
+HEADER = struct.Struct("<8sIIIIII")
+U64_MASK = 2**64 - 1
+
+
+def align(offset: int) -> int:
+    """
+    Return the next offset which is on an 8 byte boundary
+    """
+    return (offset + 7) & ~7
+
+
+class BinaryRoutes:
+    """
+    The arrays which make up an AsnRoutes object in the binary format
+    """
+
+    peer_as: int
+    v4_nets: npt.NDArray[np.uint32]
+    v4_masks: npt.NDArray[np.uint8]
+    v6_nets_hi: npt.NDArray[np.uint64]
+    v6_nets_lo: npt.NDArray[np.uint64]
+    v6_masks: npt.NDArray[np.uint8]
+    path_offsets: npt.NDArray[np.uint32]
+    path_pool: npt.NDArray[np.uint32]
+    prefix_offsets: npt.NDArray[np.uint32]
+    path_refs: npt.NDArray[np.uint32]
+
+    def __init__(
+        self: BinaryRoutes,
+        peer_as: int,
+        v4_nets: npt.NDArray[np.uint32],
+        v4_masks: npt.NDArray[np.uint8],
+        v6_nets_hi: npt.NDArray[np.uint64],
+        v6_nets_lo: npt.NDArray[np.uint64],
+        v6_masks: npt.NDArray[np.uint8],
+        path_offsets: npt.NDArray[np.uint32],
+        path_pool: npt.NDArray[np.uint32],
+        prefix_offsets: npt.NDArray[np.uint32],
+        path_refs: npt.NDArray[np.uint32],
+    ) -> None:
+        self.peer_as = peer_as
+        self.v4_nets = v4_nets
+        self.v4_masks = v4_masks
+        self.v6_nets_hi = v6_nets_hi
+        self.v6_nets_lo = v6_nets_lo
+        self.v6_masks = v6_masks
+        self.path_offsets = path_offsets
+        self.path_pool = path_pool
+        self.prefix_offsets = prefix_offsets
+        self.path_refs = path_refs
+
+    def __iter__(
+        self: BinaryRoutes,
+    ) -> Iterator[tuple[str, list[list[int]]]]:
+        for idx, prefix in enumerate(self.prefixes()):
+            yield prefix, self.as_paths(idx)
+
+    @property
+    def v4_count(self: BinaryRoutes) -> int:
+        return len(self.v4_nets)
+
+    @property
+    def v6_count(self: BinaryRoutes) -> int:
+        return len(self.v6_nets_hi)
+
+    @property
+    def path_count(self: BinaryRoutes) -> int:
+        return len(self.path_offsets) - 1
+
+    @staticmethod
+    def from_asn_routes(asn_routes: AsnRoutes) -> BinaryRoutes:
+        """
+        Return the binary arrays for an AsnRoutes object
+        """
+        v4_prefixes: list[tuple[int, int, list[list[int]]]] = []
+        v6_prefixes: list[tuple[int, int, list[list[int]]]] = []
+        for prefix, as_paths in asn_routes.routes.items():
+            net, mask = prefix.split("/")
+            if ":" in net:
+                v6_prefixes.append(
+                    (ip_to_int(net, IPV6_SIZE), int(mask), as_paths)
+                )
+            else:
+                v4_prefixes.append(
+                    (ip_to_int(net, IPV4_SIZE), int(mask), as_paths)
+                )
+
+        path_ids: dict[tuple[int, ...], int] = {}
+        path_offsets = [0]
+        path_pool: list[int] = []
+        prefix_offsets = [0]
+        path_refs: list[int] = []
+        for _, _, as_paths in v4_prefixes + v6_prefixes:
+            for as_path in as_paths:
+                key = tuple(as_path)
+                if key not in path_ids:
+                    path_ids[key] = len(path_ids)
+                    path_pool.extend(as_path)
+                    path_offsets.append(len(path_pool))
+                path_refs.append(path_ids[key])
+            prefix_offsets.append(len(path_refs))
+
+        return BinaryRoutes(
+            peer_as=asn_routes.peer_as,
+            v4_nets=np.array([p[0] for p in v4_prefixes], dtype=np.uint32),
+            v4_masks=np.array([p[1] for p in v4_prefixes], dtype=np.uint8),
+            v6_nets_hi=np.array(
+                [p[0] >> 64 for p in v6_prefixes], dtype=np.uint64
+            ),
+            v6_nets_lo=np.array(
+                [p[0] & U64_MASK for p in v6_prefixes], dtype=np.uint64
+            ),
+            v6_masks=np.array([p[1] for p in v6_prefixes], dtype=np.uint8),
+            path_offsets=np.array(path_offsets, dtype=np.uint32),
+            path_pool=np.array(path_pool, dtype=np.uint32),
+            prefix_offsets=np.array(prefix_offsets, dtype=np.uint32),
+            path_refs=np.array(path_refs, dtype=np.uint32),
+        )
+
+    @staticmethod
+    def from_file(filename: str) -> BinaryRoutes:
+        """
+        Load the binary arrays from disk.
+        The file may optionally be gzip compressed.
+        """
+        if not os.path.exists(filename):
+            raise FileExistsError(
+                f"Binary routes file doesn't exist: {filename}"
+            )
+
+        if os.path.splitext(filename)[1] == ".gz":
+            with gzip.open(filename, "rb") as f:
+                data = f.read()
+        else:
+            with open(filename, "rb") as f:
+                data = f.read()
+
+        (
+            magic,
+            peer_as,
+            v4_count,
+            v6_count,
+            path_count,
+            pool_length,
+            ref_count,
+        ) = HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise ValueError(f"Not a binary routes file: {filename}")
+
+        offset = align(HEADER.size)
+        arrays: list[Any] = []
+        for dtype, count in (
+            (np.uint32, v4_count),
+            (np.uint8, v4_count),
+            (np.uint64, v6_count),
+            (np.uint64, v6_count),
+            (np.uint8, v6_count),
+            (np.uint32, path_count + 1),
+            (np.uint32, pool_length),
+            (np.uint32, v4_count + v6_count + 1),
+            (np.uint32, ref_count),
+        ):
+            arrays.append(
+                np.frombuffer(data, dtype=dtype, count=count, offset=offset)
+            )
+            offset = align(offset + arrays[-1].nbytes)
+
+        return BinaryRoutes(peer_as, *arrays)
+
+    def as_paths(self: BinaryRoutes, idx: int) -> list[list[int]]:
+        """
+        Return the AS paths of the prefix at index idx
+        """
+        as_paths: list[list[int]] = []
+        for path_id in self.path_refs[
+            self.prefix_offsets[idx] : self.prefix_offsets[idx + 1]
+        ]:
+            start = self.path_offsets[path_id]
+            end = self.path_offsets[path_id + 1]
+            as_paths.append(self.path_pool[start:end].tolist())
+        return as_paths
+
+    def prefixes(self: BinaryRoutes) -> Iterator[str]:
+        """
+        Yield the prefixes as strings, v4 then v6, in index order
+        """
+        for net, mask in zip(self.v4_nets.tolist(), self.v4_masks.tolist()):
+            yield f"{int_to_ip(net, IPV4_SIZE)}/{mask}"
+        for hi, lo, mask in zip(
+            self.v6_nets_hi.tolist(),
+            self.v6_nets_lo.tolist(),
+            self.v6_masks.tolist(),
+        ):
+            yield f"{ipaddress.IPv6Address((hi << 64) | lo)}/{mask}"
+
+    def to_asn_routes(self: BinaryRoutes) -> AsnRoutes:
+        """
+        Return an AsnRoutes object, for example to export as JSON
+        """
+        return AsnRoutes(
+            peer_as=self.peer_as,
+            v4_count=self.v4_count,
+            v6_count=self.v6_count,
+            routes={prefix: as_paths for prefix, as_paths in self},
+        )
+
+    def to_file(self: BinaryRoutes, filename: str) -> None:
+        """
+        Write the binary arrays to disk.
+        This is gzip compressed if the filename ends in .gz.
+        """
+        if not 0 <= self.peer_as < 2**32:
+            raise ValueError(f"Invalid peer ASN {self.peer_as} for {filename}")
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        chunks = [
+            HEADER.pack(
+                MAGIC,
+                self.peer_as,
+                self.v4_count,
+                self.v6_count,
+                self.path_count,
+                len(self.path_pool),
+                len(self.path_refs),
+            )
+        ]
+        offset = HEADER.size
+        for array in (
+            self.v4_nets,
+            self.v4_masks,
+            self.v6_nets_hi,
+            self.v6_nets_lo,
+            self.v6_masks,
+            self.path_offsets,
+            self.path_pool,
+            self.prefix_offsets,
+            self.path_refs,
+        ):
+            chunks.append(b"\0" * (align(offset) - offset))
+            chunks.append(array.tobytes())
+            offset = align(offset) + array.nbytes
+
+        if os.path.splitext(filename)[1] == ".gz":
+            with gzip.open(filename, "wb") as f:
+                f.write(b"".join(chunks))
+        else:
+            with open(filename, "wb") as f:
+                f.write(b"".join(chunks))
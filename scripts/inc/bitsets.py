@@ -0,0 +1,138 @@
+"""
+Sets of integer IDs stored as rows of a bit matrix, for comparing the sets of
+many networks against each other with vectorised bitwise operations.
+
+Every item (e.g. an ASN) in any of the sets is given a dense ID, its index in
+the sorted universe of all items. Each set is then one row of packed uint64
+words, where bit n is set if item n is in the set.
+
+The size of the intersection of two sets is the popcount of the AND of their
+rows. Intersections are symmetric, so the counts between every pair of sets
+are calculated once, for the upper triangle of the matrix. Which items of one
+set are in at least one other set comes from how many sets each item is in,
+without comparing pairs at all.
+"""
+
+from __future__ import annotations
+
+from collections.abc import Sequence
+from typing import Any, Optional
+
+import numpy as np
+import numpy.typing as npt
+
+# Items below this are mapped to IDs with a lookup table of this many entries
+DENSE_ID_LIMIT = 2**26
+
+
+def intersection_counts(
+    rows: npt.NDArray[np.uint64], other_rows: npt.NDArray[np.uint64]
+) -> npt.NDArray[np.int64]:
+    """
+    Return the matrix of the popcount of the AND of every row of rows with
+    every row of other_rows, e.g. one tile of a larger comparison
+    """
+    counts = np.zeros((len(rows), len(other_rows)), dtype=np.int64)
+    for idx in range(len(rows)):
+        counts[idx] = np.bitwise_count(rows[idx] & other_rows).sum(
+            axis=1, dtype=np.int64
+        )
+    return counts
+
+
+class BitsetMatrix:
+    universe: npt.NDArray[Any]  # The sorted items, indexed by ID
+    ids: list[npt.NDArray[np.int64]]  # The sorted IDs in each set
+    rows: npt.NDArray[np.uint64]  # One row of packed bits per set
+
+    def __init__(
+        self: BitsetMatrix,
+        universe: npt.NDArray[Any],
+        ids: list[npt.NDArray[np.int64]],
+        out: Optional[npt.NDArray[np.uint64]] = None,
+    ) -> None:
+        """
+        The rows are written to out if it's given, e.g. an array in shared
+        memory, which must be zeroed and of shape (len(ids), words)
+        """
+        self.universe = universe
+        self.ids = ids
+        words = (len(universe) + 63) // 64
+        if out is None:
+            out = np.zeros((len(ids), words), dtype="<u8")
+        elif out.shape != (len(ids), words):
+            raise ValueError(f"Bitset rows must be {(len(ids), words)}")
+        self.rows = out
+        bits = np.zeros(words * 64, dtype=bool)
+        for row, row_ids in zip(self.rows, ids):
+            # Bit n of the row is bit n % 64 of little endian word n // 64
+            bits[row_ids] = True
+            row[:] = np.packbits(bits, bitorder="little").view("<u8")
+            bits[row_ids] = False
+
+    @staticmethod
+    def from_sets(sets: Sequence[npt.NDArray[Any]]) -> BitsetMatrix:
+        """
+        Return the matrix for a list of sorted, unique arrays of integers
+        """
+        top = max((int(items[-1]) for items in sets if len(items)), default=0)
+        if top >= DENSE_ID_LIMIT:
+            universe = np.unique(np.concatenate(sets))
+            return BitsetMatrix(
+                universe,
+                [
+                    np.searchsorted(universe, items).astype(np.int64)
+                    for items in sets
+                ],
+            )
+
+        # Small integers, such as ASNs, are mapped to IDs with a lookup
+        # table rather than by sorting the items of every set together
+        seen = np.zeros(top + 1, dtype=bool)
+        for items in sets:
+            seen[items] = True
+        id_lookup = np.cumsum(seen, dtype=np.int64) - 1
+        return BitsetMatrix(
+            np.flatnonzero(seen).astype(sets[0].dtype if sets else np.uint32),
+            [id_lookup[items] for items in sets],
+        )
+
+    def __len__(self: BitsetMatrix) -> int:
+        return len(self.ids)
+
+    def intersection_counts(
+        self: BitsetMatrix, other: Optional[BitsetMatrix] = None
+    ) -> npt.NDArray[np.int64]:
+        """
+        Return the matrix of the intersection size of every pair of sets.
+
+        Without other, this is N x N for the sets of this matrix, and the
+        diagonal is the size of each set. With other, which must have the
+        same universe, row i column j is the size of the intersection of
+        set i of this matrix with set j of other.
+        """
+        if other is not None:
+            return intersection_counts(self.rows, other.rows)
+
+        counts = np.zeros((len(self), len(self)), dtype=np.int64)
+        for idx in range(len(self)):
+            row_counts = np.bitwise_count(
+                self.rows[idx] & self.rows[idx:]
+            ).sum(axis=1, dtype=np.int64)
+            counts[idx, idx:] = row_counts
+            counts[idx:, idx] = row_counts
+        return counts
+
+    def shared_items(self: BitsetMatrix) -> list[npt.NDArray[Any]]:
+        """
+        Return, for each set, the sorted items it shares with any other set
+        """
+        if not self.ids:
+            return []
+        occurrences = np.bincount(
+            np.concatenate(self.ids), minlength=len(self.universe)
+        )
+        return [
+            self.universe[row_ids[occurrences[row_ids] > 1]]
+            for row_ids in self.ids
+        ]
@@ -1,5 +1,35 @@
-import ipaddress
+import bisect
+import socket
+from collections.abc import Sequence
 from ipaddress import IPv4Network, IPv6Network
+from typing import Union
+
+import numpy as np
+import numpy.typing as npt
+
+from inc.prefix_keys import KEY_NET_BITS
+
+
+def net_ranges(
+    nets: Sequence[Union[IPv4Network, IPv6Network]],
+) -> tuple[list[int], list[int]]:
+    """
+    Return the first and last addresses of the networks, sorted by the first
+    address. Networks inside another network in the list are dropped, so the
+    ranges don't overlap.
+    """
+    firsts: list[int] = []
+    lasts: list[int] = []
+    for net in sorted(
+        nets, key=lambda net: (net.network_address, -net.prefixlen)
+    ):
+        first = int(net.network_address)
+        last = int(net.broadcast_address)
+        if lasts and last <= lasts[-1]:
+            continue
+        firsts.append(first)
+        lasts.append(last)
+    return firsts, lasts
 
 
 class BogonPrefixes:
@@ -40,20 +70,67 @@ class BogonPrefixes:
         IPv6Network("ff00::/8"),  # RFC 4291
     ]
 
+    # The bogon networks as sorted, non-overlapping address ranges. Adjacent
+    # networks aren't merged, a prefix must be inside a single bogon network.
+    BOGON_RANGES = {
+        4: net_ranges(BOGON_V4_NETS),
+        6: net_ranges(BOGON_V6_NETS),
+    }
+
     @staticmethod
     def is_bogon(subnet: str) -> bool:
         """
         Return True if IP prefix is in a v4  or v6 bogon range, else False.
         Expects CIDR notation as string.
         """
-        ip_net = ipaddress.ip_network(subnet)
-        if isinstance(ip_net, IPv4Network):
-            for bogon_v4_net in BogonPrefixes.BOGON_V4_NETS:
-                if ip_net.subnet_of(bogon_v4_net):
-                    return True
-            return False
+        address, _, mask = subnet.partition("/")
+        if ":" in address:
+            afi, size = 6, 128
+            net = int.from_bytes(
+                socket.inet_pton(socket.AF_INET6, address), "big"
+            )
         else:
-            for bogon_v6_net in BogonPrefixes.BOGON_V6_NETS:
-                if ip_net.subnet_of(bogon_v6_net):
-                    return True
-            return False
+            afi, size = 4, 32
+            net = int.from_bytes(
+                socket.inet_pton(socket.AF_INET, address), "big"
+            )
+        mask_len = int(mask) if mask else size
+        if not 0 <= mask_len <= size:
+            raise ValueError(f"Invalid mask length: {subnet}")
+        host_bits = (1 << (size - mask_len)) - 1
+        if net & host_bits:
+            raise ValueError(f"{subnet} has host bits set")
+
+        # The only bogon which can contain the prefix starts at or before it
+        firsts, lasts = BogonPrefixes.BOGON_RANGES[afi]
+        idx = bisect.bisect_right(firsts, net) - 1
+        return idx >= 0 and net | host_bits <= lasts[idx]
+
+    @staticmethod
+    def are_bogons(
+        keys: npt.NDArray[np.uint64], afi: int
+    ) -> npt.NDArray[np.bool_]:
+        """
+        Return which of an array of prefixes, as inc.prefix_keys keys, are in
+        a bogon range. Bogon networks longer than a key can hold (e.g. a v6
+        /64) can't contain any of the prefixes, so they're ignored.
+        """
+        net_bits = KEY_NET_BITS[afi]
+        size = 32 if afi == 4 else 128
+        firsts: list[int] = []
+        lasts: list[int] = []
+        for first, last in zip(*BogonPrefixes.BOGON_RANGES[afi]):
+            if last - first + 1 < 1 << (size - net_bits):
+                continue
+            firsts.append(first >> (size - net_bits))
+            lasts.append(last >> (size - net_bits))
+
+        nets = keys >> np.uint64(8)
+        last_nets = nets + (
+            (np.uint64(1) << (np.uint64(net_bits) - (keys & np.uint64(0xFF))))
+            - np.uint64(1)
+        )
+        idx = np.searchsorted(np.array(firsts, dtype=np.uint64), nets, "right")
+        in_range = idx > 0
+        idx = np.maximum(idx - 1, 0)
+        return in_range & (last_nets <= np.array(lasts, dtype=np.uint64)[idx])
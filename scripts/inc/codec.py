@@ -0,0 +1,324 @@
+"""
+One place to choose how the JSON files written by these scripts are
+serialised and compressed.
+
+A codec is a compression type (gzip, bz2, lzma or none), a compression level,
+and whether the JSON is indented or compact. It can be chosen by preset name,
+or as "compression[:level][:indent|compact]", e.g. "gzip:6:compact".
+
+Files are read back by sniffing their magic bytes, so a reader doesn't need to
+know which codec wrote a file.
+
+A gzip codec can also be given a number of threads, e.g.
+"gzip:6:compact:t8". Output is then split into blocks which are compressed
+in parallel, pigz style, and written as concatenated gzip members. zlib
+releases the GIL while compressing, so this uses multiple cores, and standard
+gzip readers read the members back as one stream.
+"""
+
+from __future__ import annotations
+
+import bz2
+import collections
+import copy
+import gzip
+import io
+import lzma
+import os
+import zlib
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Optional
+
+import orjson
+
+COMPRESSION_SUFFIXES = {
+    "bz2": ".bz2",
+    "gzip": ".gz",
+    "lzma": ".xz",
+    "none": "",
+}
+
+COMPRESSION_MAGIC = {
+    b"BZh": "bz2",
+    b"\x1f\x8b": "gzip",
+    b"\xfd7zXZ\x00": "lzma",
+}
+
+GZIP_BLOCK_SIZE = 2**20  # Uncompressed bytes per parallel gzip member
+
+
+class ParallelGzipWriter(io.BufferedIOBase):
+    """
+    Write a gzip file by compressing fixed size blocks on a thread pool.
+    Each block is a complete gzip member, written in order.
+    """
+
+    def __init__(
+        self: ParallelGzipWriter,
+        filename: str,
+        level: int = 9,
+        threads: int = 2,
+        block_size: int = GZIP_BLOCK_SIZE,
+    ) -> None:
+        super().__init__()
+        self.level = level
+        self.block_size = block_size
+        self.buffer = bytearray()
+        self.members = 0
+        # Bound the number of blocks in memory
+        self.max_pending = threads * 2
+        self.pending: collections.deque[Future[bytes]] = collections.deque()
+        self.executor = ThreadPoolExecutor(max_workers=threads)
+        self.f = open(filename, "wb")
+
+    def close(self: ParallelGzipWriter) -> None:
+        """
+        Compress the last block, write any pending members, and close
+        """
+        if self.closed:
+            return
+        try:
+            if self.buffer or not self.members:
+                self.submit(bytes(self.buffer))
+                self.buffer = bytearray()
+            while self.pending:
+                self.f.write(self.pending.popleft().result())
+        finally:
+            self.executor.shutdown()
+            self.f.close()
+            super().close()
+
+    def compress(self: ParallelGzipWriter, block: bytes) -> bytes:
+        """
+        Return a block compressed as a standalone gzip member
+        """
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, 31)
+        return compressor.compress(block) + compressor.flush()
+
+    def submit(self: ParallelGzipWriter, block: bytes) -> None:
+        """
+        Queue a block for compression, writing completed members in order
+        whenever too many blocks are pending
+        """
+        self.pending.append(self.executor.submit(self.compress, block))
+        self.members += 1
+        while len(self.pending) >= self.max_pending:
+            self.f.write(self.pending.popleft().result())
+
+    def writable(self: ParallelGzipWriter) -> bool:
+        return True
+
+    def write(self: ParallelGzipWriter, data: Any) -> int:
+        if self.closed:
+            raise ValueError("write to closed file")
+        view = memoryview(data).cast("B")
+        pos = 0
+        if self.buffer:
+            pos = min(len(view), self.block_size - len(self.buffer))
+            self.buffer += view[:pos]
+            if len(self.buffer) < self.block_size:
+                return len(view)
+            self.submit(bytes(self.buffer))
+            self.buffer = bytearray()
+        while len(view) - pos >= self.block_size:
+            self.submit(bytes(view[pos : pos + self.block_size]))
+            pos += self.block_size
+        self.buffer += view[pos:]
+        return len(view)
+
+
+class Codec:
+    compression: str
+    level: int
+    indent: bool
+    threads: int
+
+    def __init__(
+        self: Codec,
+        compression: str = "gzip",
+        level: int = 9,
+        indent: bool = True,
+        threads: int = 1,
+    ) -> None:
+        if compression not in COMPRESSION_SUFFIXES:
+            raise ValueError(f"Unknown compression: {compression}")
+        self.compression = compression
+        self.level = level
+        self.indent = indent
+        self.threads = threads
+
+    def __repr__(self: Codec) -> str:
+        layout = "indent" if self.indent else "compact"
+        if self.threads > 1:
+            return f"{self.compression}:{self.level}:{layout}:t{self.threads}"
+        return f"{self.compression}:{self.level}:{layout}"
+
+    @staticmethod
+    def from_str(spec: str) -> Codec:
+        """
+        Return a codec from a preset name, or from a string in the format
+        compression[:level][:indent|compact][:t<threads>]
+        """
+        parts = spec.split(":")
+        if parts[0] in CODEC_PRESETS:
+            codec = copy.copy(CODEC_PRESETS[parts[0]])
+        else:
+            codec = Codec(compression=parts[0])
+        for part in parts[1:]:
+            if part == "indent":
+                codec.indent = True
+            elif part == "compact":
+                codec.indent = False
+            elif part.isdigit():
+                codec.level = int(part)
+            elif part.startswith("t") and part[1:].isdigit():
+                codec.threads = max(1, int(part[1:]))
+            else:
+                raise ValueError(f"Unknown codec option {part} in {spec}")
+        return codec
+
+    def parallel(self: Codec, threads: int) -> Codec:
+        """
+        Return a copy of this codec which compresses using multiple threads,
+        unless a number of threads was already chosen.
+        Only gzip compression is parallelised.
+        """
+        codec = copy.copy(self)
+        if codec.threads == 1:
+            codec.threads = max(1, threads)
+        return codec
+
+    @property
+    def suffix(self: Codec) -> str:
+        """
+        The filename suffix for this codec's compression type
+        """
+        return COMPRESSION_SUFFIXES[self.compression]
+
+    def compress(self: Codec, data: bytes) -> bytes:
+        """
+        Compress data in memory, as a complete stream of this codec's type
+        """
+        if self.compression == "gzip":
+            return gzip.compress(data, compresslevel=self.level, mtime=0)
+        if self.compression == "bz2":
+            return bz2.compress(data, compresslevel=max(1, self.level))
+        if self.compression == "lzma":
+            return lzma.compress(data, preset=self.level)
+        return data
+
+    def dumps(self: Codec, obj: Any) -> bytes:
+        """
+        Serialise an object to JSON
+        """
+        if self.indent:
+            return orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+        return orjson.dumps(obj)
+
+    def filename(self: Codec, base: str) -> str:
+        """
+        Return the filename with this codec's suffix added
+        """
+        return base + self.suffix
+
+    def open(self: Codec, filename: str) -> io.BufferedIOBase:
+        """
+        Open a file for binary writing with this codec's compression
+        """
+        if os.path.dirname(filename):
+            os.makedirs(os.path.dirname(filename), exist_ok=True)
+        if self.compression == "gzip" and self.threads > 1:
+            return ParallelGzipWriter(filename, self.level, self.threads)
+        if self.compression == "gzip":
+            return gzip.open(filename, "wb", compresslevel=self.level)
+        if self.compression == "bz2":
+            return bz2.open(filename, "wb", compresslevel=max(1, self.level))
+        if self.compression == "lzma":
+            return lzma.open(filename, "wb", preset=self.level)
+        return open(filename, "wb")
+
+    def write_bytes(self: Codec, filename: str, data: bytes) -> None:
+        """
+        Compress and write already serialised data to disk
+        """
+        with self.open(filename) as f:
+            f.write(data)
+
+    def write_json(self: Codec, filename: str, obj: Any) -> None:
+        """
+        Serialise an object to JSON, compress it, and write it to disk
+        """
+        self.write_bytes(filename, self.dumps(obj))
+
+
+CODEC_PRESETS = {
+    # How files were always written before codecs existed
+    "default": Codec("gzip", 9, True),
+    # For intermediate files which are read once and deleted
+    "fast": Codec("gzip", 1, False),
+    # For files which are archived
+    "small": Codec("lzma", 6, False),
+    "none": Codec("none", 0, True),
+}
+
+
+def decompress(data: bytes) -> bytes:
+    """
+    Decompress data in memory, based on its magic bytes
+    """
+    for prefix, compression in COMPRESSION_MAGIC.items():
+        if data.startswith(prefix):
+            if compression == "gzip":
+                return gzip.decompress(data)
+            if compression == "bz2":
+                return bz2.decompress(data)
+            return lzma.decompress(data)
+    return data
+
+
+def find_file(base: str, codec: Optional[Codec] = None) -> str:
+    """
+    Return the filename which exists for a base filename, with any of the
+    compression suffixes. The suffix of codec is tried first, if given.
+    """
+    suffixes = list(COMPRESSION_SUFFIXES.values())
+    if codec:
+        suffixes.insert(0, codec.suffix)
+    for suffix in suffixes:
+        if os.path.exists(base + suffix):
+            return base + suffix
+    raise FileExistsError(f"File doesn't exist: {base}[.gz|.bz2|.xz]")
+
+
+def get_codec(spec: str, uncompressed: bool = False) -> Codec:
+    """
+    Return the codec chosen on the CLI. The -uncompressed flag which all the
+    scripts support, takes precedence.
+    """
+    if uncompressed:
+        return CODEC_PRESETS["none"]
+    return Codec.from_str(spec)
+
+
+def load_json(filename: str) -> Any:
+    """
+    Read and decode a JSON file written with any codec
+    """
+    with open_file(filename) as f:
+        return orjson.loads(f.read())
+
+
+def open_file(filename: str) -> io.BufferedIOBase:
+    """
+    Open a file for binary reading, decompressing it based on its magic bytes
+    """
+    with open(filename, "rb") as f:
+        magic = f.read(6)
+    for prefix, compression in COMPRESSION_MAGIC.items():
+        if magic.startswith(prefix):
+            if compression == "gzip":
+                return gzip.open(filename, "rb")
+            if compression == "bz2":
+                return bz2.open(filename, "rb")
+            return lzma.open(filename, "rb")
+    return open(filename, "rb")
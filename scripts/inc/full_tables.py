@@ -0,0 +1,94 @@
+"""
+The full table report written by count_of_merged.py, loaded once into arrays.
+
+Each network in the report is one row, in the order of the report. Whether
+its ASN, v4 and v6 tables are full is stored as a bitmask of FullTable flags,
+so selecting networks is a bitwise test of one array, e.g. the networks with
+full v4 AND full ASN tables:
+
+report.asns(all_of=FullTable.V4 | FullTable.ASN)
+"""
+
+from __future__ import annotations
+
+import enum
+from typing import Any, Optional
+
+import numpy as np
+import numpy.typing as npt
+
+
+class FullTable(enum.IntFlag):
+    ASN = 1
+    V4 = 2
+    V6 = 4
+
+
+# The report entry key of each flag
+FULL_TABLE_KEYS = {
+    FullTable.ASN: "asn_full",
+    FullTable.V4: "v4_full",
+    FullTable.V6: "v6_full",
+}
+
+
+class FullTableReport:
+    asn_list: npt.NDArray[np.int64]  # The ASN of each row
+    flags: npt.NDArray[np.uint8]  # The FullTable flags of each row
+    asn_counts: npt.NDArray[np.int64]
+    v4_counts: npt.NDArray[np.int64]
+    v6_counts: npt.NDArray[np.int64]
+    index: dict[int, int]  # The row of each ASN
+
+    def __init__(
+        self: FullTableReport, data: dict[str, dict[str, Any]]
+    ) -> None:
+        """
+        Load the dict of report entries, keyed by ASN
+        """
+        self.asn_list = np.array([int(asn) for asn in data], dtype=np.int64)
+        self.flags = np.zeros(len(data), dtype=np.uint8)
+        for flag, key in FULL_TABLE_KEYS.items():
+            self.flags |= np.array(
+                [bool(entry[key]) for entry in data.values()], dtype=np.uint8
+            ) * np.uint8(flag)
+        self.asn_counts = np.array(
+            [entry["asn_count"] for entry in data.values()], dtype=np.int64
+        )
+        self.v4_counts = np.array(
+            [entry["v4_count"] for entry in data.values()], dtype=np.int64
+        )
+        self.v6_counts = np.array(
+            [entry["v6_count"] for entry in data.values()], dtype=np.int64
+        )
+        self.index = {
+            asn: row for row, asn in enumerate(self.asn_list.tolist())
+        }
+
+    def __contains__(self: FullTableReport, asn: int) -> bool:
+        return asn in self.index
+
+    def __len__(self: FullTableReport) -> int:
+        return len(self.asn_list)
+
+    def asns(
+        self: FullTableReport,
+        all_of: FullTable = FullTable(0),
+        any_of: Optional[FullTable] = None,
+    ) -> list[int]:
+        """
+        Return the ASNs, in report order, with all of the all_of flags set,
+        and at least one of the any_of flags set
+        """
+        selected = (self.flags & np.uint8(all_of)) == np.uint8(all_of)
+        if any_of is not None:
+            selected &= (self.flags & np.uint8(any_of)) != 0
+        return self.asn_list[selected].tolist()
+
+    def full(self: FullTableReport, asn: int) -> FullTable:
+        """
+        Return the flags of an ASN, raising KeyError if it isn't in the report
+        """
+        if asn not in self.index:
+            raise KeyError(f"AS{asn} isn't in the full table report")
+        return FullTable(int(self.flags[self.index[asn]]))
@@ -31,6 +31,7 @@ PLOT_PATH = os.path.join(
 
 # Full table thresholds
 RIS_THRESHOLDS = "ris-full-table-threshold.json"
+FULL_TABLE_ASN_THRESHOLD = 75000  # Min. ASNs to consider a full table
 # NRO allocated resources
 NRO_ALLOCATIONS = "nro-delegated-stats"
 
@@ -39,10 +40,12 @@ COVERAGE_AS_CONE = "as_cone_coverage.csv"
 COVERAGE_AS_HOP_COUNT_ASNS = "as_hop_count_per_asn.csv"
 COVERAGE_AS_HOP_COUNT_PREFIXES = "as_hop_count_per_prefix.csv"
 COVERAGE_CONTINENT_BREAKDOWN = "as_continent_breakdown.csv"
-COVERAGE_GLOBAL = "global-stats.json.gz"
+COVERAGE_GLOBAL = "global-stats.json"
 COVERAGE_IP = "ip_coverage.csv"
 COVERAGE_PEERING = "peering_coverage.csv"
 COVERAGE_PEERINGS = "peerings.csv"
+COVERAGE_RESULTS_DB = "results.sqlite"
+COVERAGE_STATS_STORE = "stats.store"
 COVERAGE_V4 = "v4_coverage.csv"
 COVERAGE_V4_SHORTER_T1 = "v4_shorter_t1.csv"
 COVERAGE_V6 = "v6_coverage.csv"
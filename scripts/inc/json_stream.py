@@ -0,0 +1,121 @@
+"""
+A streaming reader for AsnRoutes JSON files.
+
+Loading a merged table with orjson.loads(f.read()) holds the compressed file,
+the decompressed document and the decoded object graph in memory at once.
+This reader decompresses the file a chunk at a time and walks the routes
+object one prefix at a time, so only one prefix's AS paths are decoded at
+any moment.
+
+The header fields (peer_as, v4_count and v6_count) are read when the stream
+is opened, they come before the routes object in every file written by
+AsnRoutes.to_json. Each AS path list is found by scanning for the first "]]"
+after a prefix key, which is safe because the lists only contain integers,
+and is then decoded with orjson.
+
+A stream can be iterated more than once, each iteration re-reads the file.
+"""
+
+from __future__ import annotations
+
+import os
+import re
+from collections.abc import Iterator
+from typing import Optional
+
+import orjson
+
+from inc.codec import open_file
+
+# Bytes to decompress at a time
+STREAM_CHUNK_SIZE = 2**20
+
+HEADER_FIELD = re.compile(rb'"(peer_as|v4_count|v6_count)"\s*:\s*(-?[0-9]+)')
+ROUTES_START = re.compile(rb'"routes"\s*:\s*\{')
+ROUTE = re.compile(rb'\s*,?\s*"([^"]*)"\s*:\s*(\[\s*\]|\[.*?\]\s*\])', re.S)
+ROUTES_END = re.compile(rb"\s*\}")
+
+
+class AsnRoutesStream:
+    """
+    Iterate over the (prefix, as_paths) pairs of an AsnRoutes JSON file,
+    which may have been compressed with any codec
+    """
+
+    peer_as: int
+    v4_count: int
+    v6_count: int
+
+    def __init__(
+        self: AsnRoutesStream,
+        filename: str,
+        chunk_size: int = STREAM_CHUNK_SIZE,
+    ) -> None:
+        if not os.path.exists(filename):
+            raise FileExistsError(f"AsnRoutes file doesn't exist: {filename}")
+        self.filename = filename
+        self.chunk_size = chunk_size
+
+        header: dict[str, int] = {}
+        with open_file(filename) as f:
+            buffer = b""
+            while not (match := ROUTES_START.search(buffer)):
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    raise ValueError(f"No routes object in {filename}")
+                buffer += chunk
+            for field in HEADER_FIELD.finditer(buffer, 0, match.start()):
+                header[field.group(1).decode()] = int(field.group(2))
+
+        for name in ("peer_as", "v4_count", "v6_count"):
+            if name not in header:
+                raise ValueError(f"No {name} before the routes in {filename}")
+        self.peer_as = header["peer_as"]
+        self.v4_count = header["v4_count"]
+        self.v6_count = header["v6_count"]
+
+    def __iter__(
+        self: AsnRoutesStream,
+    ) -> Iterator[tuple[str, list[list[int]]]]:
+        for prefix, as_paths in self.scan():
+            assert as_paths is not None  # mypy
+            yield prefix, orjson.loads(as_paths)
+
+    def prefixes(self: AsnRoutesStream) -> Iterator[str]:
+        """
+        Yield only the prefixes, without decoding their AS paths
+        """
+        for prefix, _ in self.scan(decode=False):
+            yield prefix
+
+    def scan(
+        self: AsnRoutesStream, decode: bool = True
+    ) -> Iterator[tuple[str, Optional[bytes]]]:
+        """
+        Yield each prefix, and the raw JSON of its AS paths if decode is True
+        """
+        with open_file(self.filename) as f:
+            buffer = b""
+            while not (match := ROUTES_START.search(buffer)):
+                buffer += f.read(self.chunk_size)
+            pos = match.end()
+            eof = False
+
+            while True:
+                match = ROUTE.match(buffer, pos)
+                if match:
+                    pos = match.end()
+                    yield match.group(1).decode(), (
+                        match.group(2) if decode else None
+                    )
+                    continue
+                if ROUTES_END.match(buffer, pos):
+                    return
+                if eof:
+                    raise ValueError(f"Truncated routes in {self.filename}")
+
+                # Read more, dropping the routes already yielded
+                chunk = f.read(self.chunk_size)
+                eof = not chunk
+                buffer = buffer[pos:] + chunk
+                pos = 0
@@ -0,0 +1,225 @@
+"""
+A registry of the ASNs assigned in the NRO delegated stats file, and the
+continent each ASN is assigned in.
+
+The file lists ASNs as ranges, which are kept as ranges: sorted arrays of
+the first and last ASN of each range, and the country code of each range.
+Looking up an ASN is one bisect over the first ASNs. Each country code is
+converted to a continent once, when it's first needed, not once per ASN.
+
+The parsed registry is cached next to the NRO file in a binary sidecar file,
+keyed by the SHA256 of the NRO file, so each script which needs it only
+parses the NRO file if it has changed.
+
+Sidecar file layout:
+
+MAGIC
+firsts: uint32 array, the first ASN of each range
+lasts: uint32 array, the last ASN of each range
+countries: uint16 array, the index into the country codes of each range
+directory: JSON dict with the "sha256" of the NRO file, the "ranges" count
+           and the "countries" codes
+footer: directory offset (uint64), directory length (uint64), MAGIC
+"""
+
+from __future__ import annotations
+
+import bisect
+import hashlib
+import os
+import struct
+
+import numpy as np
+import orjson
+
+from inc.countries import cc_to_continent
+
+MAGIC = b"T1NRO001"
+FOOTER = struct.Struct("<QQ8s")
+SIDECAR_SUFFIX = ".registry"
+
+
+def file_sha256(filename: str) -> str:
+    sha256 = hashlib.sha256()
+    with open(filename, "rb") as f:
+        while chunk := f.read(2**20):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+class NroRegistry:
+    firsts: list[int]  # The first ASN of each range, sorted
+    lasts: list[int]  # The last ASN of each range
+    range_countries: list[int]  # The country code index of each range
+    countries: list[str]  # Country codes, in the order first seen
+
+    def __init__(
+        self: NroRegistry,
+        firsts: list[int],
+        lasts: list[int],
+        range_countries: list[int],
+        countries: list[str],
+    ) -> None:
+        self.firsts = firsts
+        self.lasts = lasts
+        self.range_countries = range_countries
+        self.countries = countries
+
+    def __contains__(self: NroRegistry, asn: int) -> bool:
+        return self.find(asn) >= 0
+
+    def __len__(self: NroRegistry) -> int:
+        """
+        Return the number of assigned ASNs
+        """
+        return sum(self.lasts) - sum(self.firsts) + len(self.firsts)
+
+    def continent(self: NroRegistry, asn: int) -> str:
+        """
+        Return the name of the continent an ASN is assigned in
+        """
+        idx = self.find(asn)
+        if idx < 0:
+            raise KeyError(f"AS{asn} isn't assigned in the NRO registry")
+        return cc_to_continent(self.countries[self.range_countries[idx]])
+
+    def continent_names(self: NroRegistry) -> list[str]:
+        """
+        Return the names of the continents with assigned ASNs, in the order
+        they're first seen in the NRO file
+        """
+        return list(
+            dict.fromkeys(cc_to_continent(cc) for cc in self.countries)
+        )
+
+    def find(self: NroRegistry, asn: int) -> int:
+        """
+        Return the index of the range an ASN is in, or -1
+        """
+        idx = bisect.bisect_right(self.firsts, asn) - 1
+        if idx >= 0 and asn <= self.lasts[idx]:
+            return idx
+        return -1
+
+    @staticmethod
+    def from_nro_file(filename: str) -> NroRegistry:
+        """
+        Parse the assigned ASN ranges from an NRO delegated stats file
+        """
+        ranges: list[tuple[int, int, int]] = []
+        countries: dict[str, int] = {}
+
+        for line in open(filename).readlines():
+            values = line.split("|")
+
+            # Country code
+            cc = values[1].upper()
+            if cc == "*":
+                continue
+
+            # Resource type
+            if values[2].lower() != "asn":
+                continue
+
+            # Status
+            if values[6].lower() != "assigned":
+                continue
+
+            base_asn = int(values[3])
+            asn_range = int(values[4])
+            if asn_range < 1:
+                continue
+
+            if cc not in countries:
+                countries[cc] = len(countries)
+            ranges.append((base_asn, base_asn + asn_range - 1, countries[cc]))
+
+        ranges.sort()
+        for prev, current in zip(ranges, ranges[1:]):
+            if current[0] <= prev[1]:
+                raise ValueError(f"ASN found more than once: {current[0]}")
+
+        return NroRegistry(
+            [first for first, _, _ in ranges],
+            [last for _, last, _ in ranges],
+            [country for _, _, country in ranges],
+            list(countries),
+        )
+
+    @staticmethod
+    def load(filename: str) -> NroRegistry:
+        """
+        Return the registry of an NRO delegated stats file, from its sidecar
+        file if the sidecar was written from the same NRO file, else parse
+        the NRO file and write a new sidecar
+        """
+        sha256 = file_sha256(filename)
+        sidecar = filename + SIDECAR_SUFFIX
+        if os.path.exists(sidecar):
+            try:
+                registry = NroRegistry.read_sidecar(sidecar, sha256)
+            except ValueError as e:
+                print(f"Ignoring NRO registry sidecar: {e}")
+            else:
+                print(f"Loaded NRO registry from {sidecar}")
+                return registry
+
+        registry = NroRegistry.from_nro_file(filename)
+        registry.write_sidecar(sidecar, sha256)
+        print(f"Wrote NRO registry to {sidecar}")
+        return registry
+
+    @staticmethod
+    def read_sidecar(filename: str, sha256: str) -> NroRegistry:
+        """
+        Read a sidecar file, which must have been written from an NRO file
+        with this SHA256
+        """
+        with open(filename, "rb") as f:
+            data = f.read()
+        if data[: len(MAGIC)] != MAGIC or len(data) < FOOTER.size:
+            raise ValueError(f"Not an NRO registry: {filename}")
+        offset, length, magic = FOOTER.unpack_from(
+            data, len(data) - FOOTER.size
+        )
+        if magic != MAGIC:
+            raise ValueError(f"Truncated NRO registry: {filename}")
+
+        directory = orjson.loads(data[offset : offset + length])
+        if directory["sha256"] != sha256:
+            raise ValueError(f"{filename} is for a different NRO file")
+
+        count = directory["ranges"]
+        firsts = np.frombuffer(data, "<u4", count, len(MAGIC))
+        lasts = np.frombuffer(data, "<u4", count, len(MAGIC) + 4 * count)
+        range_countries = np.frombuffer(
+            data, "<u2", count, len(MAGIC) + 8 * count
+        )
+        return NroRegistry(
+            firsts.tolist(),
+            lasts.tolist(),
+            range_countries.tolist(),
+            directory["countries"],
+        )
+
+    def write_sidecar(self: NroRegistry, filename: str, sha256: str) -> None:
+        """
+        Write the registry to a sidecar file, replacing it atomically
+        """
+        tmp_filename = f"{filename}.{os.getpid()}.tmp"
+        with open(tmp_filename, "wb") as f:
+            f.write(MAGIC)
+            f.write(np.array(self.firsts, dtype="<u4").tobytes())
+            f.write(np.array(self.lasts, dtype="<u4").tobytes())
+            f.write(np.array(self.range_countries, dtype="<u2").tobytes())
+            offset = f.tell()
+            directory = orjson.dumps(
+                {
+                    "sha256": sha256,
+                    "ranges": len(self.firsts),
+                    "countries": self.countries,
+                }
+            )
+            f.write(directory)
+            f.write(FOOTER.pack(offset, len(directory), MAGIC))
+        os.replace(tmp_filename, filename)
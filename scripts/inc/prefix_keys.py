@@ -0,0 +1,152 @@
+"""
+Prefixes as uint64 keys, for handling whole routing tables as numpy arrays.
+
+A key is the network bits of a prefix shifted left 8 bits, plus the mask
+length in the bottom 8 bits. For v4 the network bits are the whole 32 bit
+address. For v6 they are the top 56 bits of the address, which holds every
+prefix up to a /56, and coverage.py only keeps v6 prefixes up to a /48.
+Building keys for longer prefixes raises a ValueError, rather than silently
+truncating them.
+
+Sorting keys sorts prefixes by network and then by mask length, so a
+prefix always sorts before the more specific prefixes it covers.
+
+Sorted keys are also sorted [start, end) address ranges, so the address
+space covered by a table is the union of its ranges, in one sweep. Ranges are
+counted in units of the smallest prefix a key holds (a /32 or a /56), which
+keeps v6 counts exact in uint64 arithmetic.
+"""
+
+from __future__ import annotations
+
+import ipaddress
+
+import numpy as np
+import numpy.typing as npt
+
+from inc.aggregate6 import int_to_ip
+from inc.globals import IPV4_SIZE, IPV6_SIZE
+
+KEY_NET_BITS = {4: 32, 6: 56}  # Network bits stored in a key, per AFI
+
+
+def address_count(keys: npt.NDArray[np.uint64], afi: int) -> tuple[int, int]:
+    """
+    Return the number of IP addresses covered by the union of the prefixes,
+    and the number of contiguous address ranges they merge into
+    """
+    if not len(keys):
+        return 0, 0
+    net_bits = KEY_NET_BITS[afi]
+    keys = np.sort(keys)
+    starts = (keys >> np.uint64(8)).astype(np.int64)
+    ends = starts + (
+        np.int64(1) << (net_bits - (keys & np.uint64(0xFF))).astype(np.int64)
+    )
+
+    # The furthest end of all the ranges before each range
+    reach = np.maximum.accumulate(ends)
+    before = np.concatenate(([0], reach[:-1]))
+    blocks = int(np.clip(ends - np.maximum(starts, before), 0, None).sum())
+    ranges = int(np.count_nonzero(starts[1:] > reach[:-1])) + 1
+    size = IPV4_SIZE if afi == 4 else IPV6_SIZE
+    return blocks << (size - net_bits), ranges
+
+
+def make_keys(
+    nets: npt.NDArray[np.uint64], masks: npt.NDArray[np.uint8], afi: int
+) -> npt.NDArray[np.uint64]:
+    """
+    Return the keys of prefixes, from their network bits (the top 32 v4 or
+    56 v6 bits of the address) and mask lengths
+    """
+    net_bits = KEY_NET_BITS[afi]
+    if len(masks) and int(masks.max()) > net_bits:
+        raise ValueError(
+            f"v{afi} prefixes longer than /{net_bits} can't be prefix keys"
+        )
+    return (nets.astype(np.uint64) << np.uint64(8)) | masks
+
+
+def key_parents(
+    keys: npt.NDArray[np.uint64], afi: int
+) -> npt.NDArray[np.int64]:
+    """
+    Return the index of the most specific covering prefix of each key in a
+    sorted array of keys, or -1 if no other key covers it
+    """
+    net_bits = KEY_NET_BITS[afi]
+    masks = keys & np.uint64(0xFF)
+    nets = keys >> np.uint64(8)
+    parents = np.full(len(keys), -1, dtype=np.int64)
+
+    # Shorter masks first, so that more specific parents overwrite them
+    for mask in np.unique(masks).tolist():
+        longer = np.flatnonzero(masks > mask)
+        if not len(longer):
+            continue
+        shift = np.uint64(net_bits - mask)
+        covering = (
+            ((nets[longer] >> shift) << shift) << np.uint64(8)
+        ) | np.uint64(mask)
+        pos = np.minimum(np.searchsorted(keys, covering), len(keys) - 1)
+        found = keys[pos] == covering
+        parents[longer[found]] = pos[found]
+    return parents
+
+
+def key_prefixes(keys: npt.NDArray[np.uint64], afi: int) -> list[str]:
+    """
+    Return the prefix strings for an array of keys
+    """
+    masks = (keys & np.uint64(0xFF)).tolist()
+    nets = (keys >> np.uint64(8)).tolist()
+    if afi == 4:
+        return [
+            f"{int_to_ip(net, IPV4_SIZE)}/{mask}"
+            for net, mask in zip(nets, masks)
+        ]
+    return [
+        f"{ipaddress.IPv6Address(net << 72)}/{mask}"
+        for net, mask in zip(nets, masks)
+    ]
+
+
+def covered_keys(
+    keys: npt.NDArray[np.uint64],
+    tables: list[npt.NDArray[np.int64]],
+    afi: int,
+) -> tuple[list[npt.NDArray[np.int64]], npt.NDArray[np.int64]]:
+    """
+    Given a sorted array of keys, and the indexes into it of the prefixes of
+    each table, find the keys each table covers. A table covers a prefix if
+    the table has the prefix or any less specific prefix which contains it,
+    like a longest prefix match in a pytricia tree.
+
+    Return the indexes of the keys each table covers, and how many tables
+    cover each key.
+    """
+    parents = key_parents(keys, afi)
+    masks = keys & np.uint64(0xFF)
+
+    # One bit per table, for each key
+    words = (len(tables) + 63) // 64
+    covered_by = np.zeros((len(keys), words), dtype=np.uint64)
+    for idx, table in enumerate(tables):
+        covered_by[table, idx // 64] |= np.uint64(1) << np.uint64(idx % 64)
+
+    # Copy the tables covering each prefix down to the prefixes it contains
+    for mask in np.unique(masks).tolist():
+        children = np.flatnonzero((masks == mask) & (parents >= 0))
+        covered_by[children] |= covered_by[parents[children]]
+
+    return (
+        [
+            np.flatnonzero(
+                covered_by[:, idx // 64]
+                & (np.uint64(1) << np.uint64(idx % 64))
+            )
+            for idx in range(len(tables))
+        ],
+        np.bitwise_count(covered_by).sum(axis=1, dtype=np.int64),
+    )
@@ -0,0 +1,319 @@
+"""
+An optional SQLite database of the coverage results.
+
+coverage.py writes the same results as its CSV files and AsStats files into
+indexed tables, so that plots and ad-hoc questions are SQL queries rather than
+re-parsing files:
+
+aoi_metrics: one row per network analysed, with its per-network metrics
+pairwise: the overlap counts between each pair of networks, per metric
+aoi_asns: every ASN reachable via each network, with its AS hop count
+aoi_prefixes: every prefix seen via each network
+report_<name>: a copy of each CSV report
+
+Rows are written in bulk, one transaction per table and stage, and the
+database uses WAL mode so it can be queried while coverage.py is running.
+"""
+
+from __future__ import annotations
+
+import os
+import sqlite3
+from collections.abc import Iterable
+from typing import Any
+
+from inc.asns import asns
+from inc.stats import AsStats
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS aoi_metrics (
+    asn INTEGER PRIMARY KEY,
+    name TEXT,
+    tier_1 INTEGER,
+    asns_reachable INTEGER,
+    asns_reachable_via_peers INTEGER,
+    on_net_asns INTEGER,
+    asns_on_net_for_peers INTEGER,
+    asns_n_on_net_for_peers INTEGER,
+    avg_as_path_length INTEGER,
+    weighted_as_path_score INTEGER,
+    avg_as_hops INTEGER,
+    weighted_as_hops_score INTEGER,
+    v4_percent REAL,
+    v6_percent REAL,
+    v4_prefixes INTEGER,
+    v4_pfx_covered_by_peers INTEGER,
+    v4_pfx_preferred_by_t1s INTEGER,
+    v4_pfx_n_preferred_by_t1s INTEGER,
+    v6_prefixes INTEGER,
+    v6_pfx_covered_by_peers INTEGER,
+    v6_pfx_preferred_by_t1s INTEGER,
+    v6_pfx_n_preferred_by_t1s INTEGER
+);
+CREATE TABLE IF NOT EXISTS pairwise (
+    metric TEXT,
+    local_asn INTEGER,
+    peer_asn INTEGER,
+    value INTEGER,
+    PRIMARY KEY (metric, local_asn, peer_asn)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS pairwise_peer_asn ON pairwise (peer_asn);
+CREATE TABLE IF NOT EXISTS aoi_asns (
+    aoi INTEGER,
+    asn INTEGER,
+    hops INTEGER,
+    on_net INTEGER,
+    via_peers INTEGER,
+    PRIMARY KEY (aoi, asn)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS aoi_asns_asn ON aoi_asns (asn);
+CREATE TABLE IF NOT EXISTS aoi_prefixes (
+    aoi INTEGER,
+    prefix TEXT,
+    afi INTEGER,
+    covered_by_peers INTEGER,
+    preferred_by_t1s INTEGER,
+    PRIMARY KEY (aoi, prefix)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS aoi_prefixes_prefix ON aoi_prefixes (prefix);
+"""
+
+# The AsStats dicts of per peer counts, stored in the pairwise table
+ASN_PAIRWISE_METRICS = [
+    "peers_w_asn_on_net",
+    "peers_wo_asn_on_net",
+    "peers_w_reachable_asn",
+    "peers_wo_reachable_asn",
+]
+PREFIX_PAIRWISE_METRICS = [
+    "peers_w_cover_v4_pfx",
+    "peers_wo_cover_v4_pfx",
+    "peers_w_cover_v6_pfx",
+    "peers_wo_cover_v6_pfx",
+]
+
+
+def quote(identifier: str) -> str:
+    """
+    Return an SQL quoted identifier, e.g. for a CSV header
+    """
+    return '"' + identifier.replace('"', '""') + '"'
+
+
+class ResultsDb:
+    def __init__(self: ResultsDb, filename: str) -> None:
+        if os.path.dirname(filename):
+            os.makedirs(os.path.dirname(filename), exist_ok=True)
+        self.filename = filename
+        self.conn = sqlite3.connect(filename)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    def close(self: ResultsDb) -> None:
+        self.conn.close()
+
+    def update_metrics(
+        self: ResultsDb, metrics: Iterable[dict[str, Any]]
+    ) -> None:
+        """
+        Insert or update per-network metrics. Each dict has an "asn" key and
+        any of the aoi_metrics columns, other columns are left as they are.
+        """
+        with self.conn:
+            for row in metrics:
+                row = {
+                    "name": asns[row["asn"]].name,
+                    "tier_1": asns[row["asn"]].tier_1,
+                    **row,
+                }
+                columns = list(row)
+                self.conn.execute(
+                    f"INSERT INTO aoi_metrics ({', '.join(columns)}) "
+                    f"VALUES ({', '.join('?' * len(columns))}) "
+                    "ON CONFLICT (asn) DO UPDATE SET "
+                    + ", ".join(f"{col} = excluded.{col}" for col in columns),
+                    list(row.values()),
+                )
+
+    def write_asn_coverage(
+        self: ResultsDb, all_as_stats: list[AsStats]
+    ) -> None:
+        """
+        Write the results of the ASN coverage stage
+        """
+        self.update_metrics(
+            {
+                "asn": as_stats.asn,
+                "asns_reachable": len(as_stats.asns_reachable),
+                "asns_reachable_via_peers": len(
+                    as_stats.asns_reachable_via_peers
+                ),
+                "on_net_asns": len(as_stats.on_net_asns),
+                "asns_on_net_for_peers": len(as_stats.asns_on_net_for_peers),
+                "asns_n_on_net_for_peers": len(
+                    as_stats.asns_n_on_net_for_peers
+                ),
+                "avg_as_path_length": as_stats.avg_as_path_length,
+                "weighted_as_path_score": as_stats.weighted_as_path_score,
+                "avg_as_hops": as_stats.avg_as_hops,
+                "weighted_as_hops_score": as_stats.weighted_as_hops_score,
+            }
+            for as_stats in all_as_stats
+        )
+        self.write_pairwise(all_as_stats, ASN_PAIRWISE_METRICS)
+
+        with self.conn:
+            for as_stats in all_as_stats:
+                self.conn.execute(
+                    "DELETE FROM aoi_asns WHERE aoi = ?", (as_stats.asn,)
+                )
+                on_net = set(as_stats.on_net_asns.tolist())
+                via_peers = set(as_stats.asns_reachable_via_peers.tolist())
+                self.conn.executemany(
+                    "INSERT INTO aoi_asns VALUES (?, ?, ?, ?, ?)",
+                    (
+                        (
+                            as_stats.asn,
+                            asn,
+                            hop_count,
+                            asn in on_net,
+                            asn in via_peers,
+                        )
+                        for hop_count, hop_asns in as_stats.as_hops.items()
+                        for asn in hop_asns.tolist()
+                    ),
+                )
+
+    def write_ip_coverage(
+        self: ResultsDb, results: Iterable[tuple[int, float, float]]
+    ) -> None:
+        """
+        Write the (asn, v4_percent, v6_percent) results of the IP coverage
+        stage
+        """
+        self.update_metrics(
+            {"asn": asn, "v4_percent": v4_percent, "v6_percent": v6_percent}
+            for asn, v4_percent, v6_percent in results
+        )
+
+    def write_pairwise(
+        self: ResultsDb, all_as_stats: list[AsStats], metrics: list[str]
+    ) -> None:
+        """
+        Write the per peer counts of each network
+        """
+        with self.conn:
+            for metric in metrics:
+                self.conn.execute(
+                    "DELETE FROM pairwise WHERE metric = ?", (metric,)
+                )
+                self.conn.executemany(
+                    "INSERT INTO pairwise VALUES (?, ?, ?, ?)",
+                    (
+                        (metric, as_stats.asn, peer_asn, value)
+                        for as_stats in all_as_stats
+                        for peer_asn, value in getattr(
+                            as_stats, metric
+                        ).items()
+                    ),
+                )
+
+    def write_prefix_coverage(
+        self: ResultsDb, all_as_stats: list[AsStats]
+    ) -> None:
+        """
+        Write the results of the prefix coverage stage
+        """
+        self.update_metrics(
+            {
+                "asn": as_stats.asn,
+                "v4_prefixes": len(as_stats.v4_pfx_tree),
+                "v4_pfx_covered_by_peers": len(
+                    as_stats.v4_pfx_covered_by_peers
+                ),
+                "v4_pfx_preferred_by_t1s": len(
+                    as_stats.v4_pfx_preferred_by_t1s
+                ),
+                "v4_pfx_n_preferred_by_t1s": len(
+                    as_stats.v4_pfx_n_preferred_by_t1s
+                ),
+                "v6_prefixes": len(as_stats.v6_pfx_tree),
+                "v6_pfx_covered_by_peers": len(
+                    as_stats.v6_pfx_covered_by_peers
+                ),
+                "v6_pfx_preferred_by_t1s": len(
+                    as_stats.v6_pfx_preferred_by_t1s
+                ),
+                "v6_pfx_n_preferred_by_t1s": len(
+                    as_stats.v6_pfx_n_preferred_by_t1s
+                ),
+            }
+            for as_stats in all_as_stats
+        )
+        self.write_pairwise(all_as_stats, PREFIX_PAIRWISE_METRICS)
+
+        with self.conn:
+            for as_stats in all_as_stats:
+                self.conn.execute(
+                    "DELETE FROM aoi_prefixes WHERE aoi = ?", (as_stats.asn,)
+                )
+                for afi, tree, covered, preferred, n_preferred in (
+                    (
+                        4,
+                        as_stats.v4_pfx_tree,
+                        as_stats.v4_pfx_covered_by_peers,
+                        as_stats.v4_pfx_preferred_by_t1s,
+                        as_stats.v4_pfx_n_preferred_by_t1s,
+                    ),
+                    (
+                        6,
+                        as_stats.v6_pfx_tree,
+                        as_stats.v6_pfx_covered_by_peers,
+                        as_stats.v6_pfx_preferred_by_t1s,
+                        as_stats.v6_pfx_n_preferred_by_t1s,
+                    ),
+                ):
+                    # preferred_by_t1s is NULL for filtered prefixes
+                    self.conn.executemany(
+                        "INSERT INTO aoi_prefixes VALUES (?, ?, ?, ?, ?)",
+                        (
+                            (
+                                as_stats.asn,
+                                prefix,
+                                afi,
+                                prefix in covered,
+                                (
+                                    True
+                                    if prefix in preferred
+                                    else (
+                                        False
+                                        if prefix in n_preferred
+                                        else None
+                                    )
+                                ),
+                            )
+                            for prefix in tree
+                        ),
+                    )
+
+    def write_report(
+        self: ResultsDb, name: str, headers: list[str], rows: list[list[str]]
+    ) -> None:
+        """
+        Replace the copy of a CSV report. Numeric values are stored as
+        numbers, because the columns have NUMERIC affinity.
+        """
+        table = quote(f"report_{os.path.splitext(name)[0]}")
+        with self.conn:
+            self.conn.execute(f"DROP TABLE IF EXISTS {table}")
+            self.conn.execute(
+                f"CREATE TABLE {table} ("
+                + ", ".join(f"{quote(header)} NUMERIC" for header in headers)
+                + ")"
+            )
+            self.conn.executemany(
+                f"INSERT INTO {table} VALUES "
+                f"({', '.join('?' * len(headers))})",
+                rows,
+            )
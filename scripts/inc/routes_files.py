@@ -0,0 +1,85 @@
+"""
+Find and open the merged routes of an ASN, in whichever format
+merge_rib_stats.py wrote them.
+
+JSON AsnRoutes files, compressed with any codec, are streamed with
+AsnRoutesStream, sorted routes files are read with SortedRoutesReader, and
+binary routes files are loaded with BinaryRoutes. All of them have the
+peer_as, v4_count and v6_count of the table, and iterate over its
+(prefix, as_paths) pairs, so the scripts which read merged routes don't need
+to know which format they were written in.
+
+The summary written next to the merged routes is only used while the routes
+file is the one it was written with.
+"""
+
+from __future__ import annotations
+
+import os
+from typing import Optional, Union
+
+from inc.binary_routes import BinaryRoutes
+from inc.codec import COMPRESSION_SUFFIXES
+from inc.json_stream import AsnRoutesStream
+from inc.sorted_routes import SortedRoutesReader
+from inc.stats import AsnRoutesSummary
+
+RoutesReader = Union[AsnRoutesStream, BinaryRoutes, SortedRoutesReader]
+
+# The suffixes of every format, after {asn}-routes
+ROUTES_SUFFIXES = [
+    f".json{suffix}" for suffix in COMPRESSION_SUFFIXES.values()
+] + [".sorted", ".bin", ".bin.gz"]
+
+
+def find_routes_file(asn: Union[int, str], directory: str) -> str:
+    """
+    Return the merged routes filename of an ASN, in any format. If there is
+    more than one, e.g. the merge was re-run with a different format, the
+    newest is returned.
+    """
+    base = os.path.join(directory, f"{asn}-routes")
+    filenames = [
+        base + suffix
+        for suffix in ROUTES_SUFFIXES
+        if os.path.exists(base + suffix)
+    ]
+    if not filenames:
+        raise FileExistsError(
+            f"File doesn't exist: {base}"
+            "[.json[.gz|.bz2|.xz]|.sorted|.bin[.gz]]"
+        )
+    return max(filenames, key=os.path.getmtime)
+
+
+def load_summary(
+    asn: Union[int, str], directory: str
+) -> Optional[AsnRoutesSummary]:
+    """
+    Return the summary written by the merge for an ASN, or None if there
+    isn't one, or if the merged routes file has changed since it was written
+    """
+    summary_file = os.path.join(directory, f"{asn}-summary.json")
+    if not os.path.exists(summary_file):
+        return None
+    try:
+        routes_file = find_routes_file(asn, directory)
+    except FileExistsError:
+        return None
+
+    summary = AsnRoutesSummary.from_json(summary_file)
+    if not summary.matches(routes_file):
+        print(f"Ignoring {summary_file}, it doesn't match {routes_file}")
+        return None
+    return summary
+
+
+def open_routes(filename: str) -> RoutesReader:
+    """
+    Return a reader for a merged routes file, based on its suffix
+    """
+    if filename.endswith(".sorted"):
+        return SortedRoutesReader(filename)
+    if filename.endswith((".bin", ".bin.gz")):
+        return BinaryRoutes.from_file(filename)
+    return AsnRoutesStream(filename)
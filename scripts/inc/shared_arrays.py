@@ -0,0 +1,105 @@
+"""
+Numpy arrays published in one block of shared memory, so worker processes
+can attach to them without copying, whatever the multiprocessing start
+method.
+
+The parent process publishes the arrays. The spec of the block is the
+block's name and the [dtype, offset, shape] of each array. It is small and
+picklable, so it can be passed to each worker, e.g. as an argument of a
+Pool initializer. Workers attach with the spec and get views onto the
+block, which are read-only unless the workers are to fill in arrays which
+the parent allocated empty.
+
+Only the parent, which created the block, unlinks it.
+"""
+
+from __future__ import annotations
+
+from multiprocessing import shared_memory
+from typing import Any, Optional
+
+import numpy as np
+import numpy.typing as npt
+
+# The block name, and the [dtype, offset, shape] of each array
+SharedArraysSpec = tuple[str, dict[str, tuple[str, int, tuple[int, ...]]]]
+
+
+def align(offset: int) -> int:
+    """
+    Return the next 8 byte boundary
+    """
+    return (offset + 7) & ~7
+
+
+class SharedArrays:
+    def __init__(
+        self: SharedArrays,
+        shm: shared_memory.SharedMemory,
+        spec: SharedArraysSpec,
+        owner: bool,
+        writable: bool = False,
+    ) -> None:
+        self.shm = shm
+        self.spec = spec
+        self.owner = owner
+        self.arrays: dict[str, npt.NDArray[Any]] = {}
+        for name, (dtype, offset, shape) in spec[1].items():
+            array: npt.NDArray[Any] = np.ndarray(
+                shape, dtype=np.dtype(dtype), buffer=shm.buf, offset=offset
+            )
+            array.flags.writeable = writable
+            self.arrays[name] = array
+
+    def __getitem__(self: SharedArrays, name: str) -> npt.NDArray[Any]:
+        return self.arrays[name]
+
+    @staticmethod
+    def attach(spec: SharedArraysSpec, writable: bool = False) -> SharedArrays:
+        """
+        Attach to arrays published by another process
+        """
+        return SharedArrays(
+            shared_memory.SharedMemory(name=spec[0]),
+            spec,
+            owner=False,
+            writable=writable,
+        )
+
+    def close(self: SharedArrays) -> None:
+        """
+        Release the views and detach from the block. The owner also frees
+        the block.
+        """
+        self.arrays = {}
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+    @staticmethod
+    def publish(
+        arrays: dict[str, npt.NDArray[Any]],
+        empty: Optional[dict[str, tuple[str, tuple[int, ...]]]] = None,
+    ) -> SharedArrays:
+        """
+        Copy arrays into a new block of shared memory. The block also holds
+        the empty arrays, zeroed, of the given (dtype, shape).
+        """
+        layout: dict[str, tuple[str, int, tuple[int, ...]]] = {}
+        size = 0
+        for name, array in arrays.items():
+            offset = align(size)
+            layout[name] = (array.dtype.str, offset, array.shape)
+            size = offset + array.nbytes
+        for name, (dtype, shape) in (empty or {}).items():
+            offset = align(size)
+            layout[name] = (np.dtype(dtype).str, offset, shape)
+            size = offset + np.dtype(dtype).itemsize * int(np.prod(shape))
+
+        shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        for name, array in arrays.items():
+            dtype, offset, shape = layout[name]
+            np.ndarray(
+                shape, dtype=np.dtype(dtype), buffer=shm.buf, offset=offset
+            )[...] = array
+        return SharedArrays(shm, (shm.name, layout), owner=True)
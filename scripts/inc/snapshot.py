@@ -0,0 +1,344 @@
+"""
+An indexed snapshot archive of the files produced by a run.
+
+This replaces the tarball of the merged_paths, coverage and asn_graphs
+directories. Like a zip file, each member is compressed on its own and a
+central index of all members is stored at the end of the archive. A single
+member of an old snapshot can be found in the index and read with one seek,
+without decompressing the rest of the archive.
+
+Files which are already compressed (by their magic bytes) are stored as-is.
+All other files are compressed with the archive's codec. Either way, reading
+a member returns the original file contents.
+
+Intermediate files are written with a fast codec, so when archiving they
+can instead be recompressed with the archive's codec. Reading such a member
+returns its decompressed contents, and extracting it compresses it again, at
+a fast level, with the compression its name's suffix implies. The extracted
+file decompresses to the same contents as the archived file, but it isn't
+byte-identical to it.
+
+Members are named by their path relative to the current directory, with no
+leading "/" and no ".." parts, so extracting a member always writes under
+the output directory. Files outside the current directory are named by
+their absolute path without the leading "/", like tar does.
+
+Members can be appended to an existing archive. The new members are written
+after the existing footer, followed by a new index and footer, so the
+archive stays readable until the new footer is on disk. If an append is
+interrupted, readers search back for the last complete footer.
+
+File layout:
+
+MAGIC
+member 0: the compressed file contents
+...
+member n
+index: zlib compressed JSON dict keyed by member name, with the
+       [offset, length, compression, size, mtime] of every member
+footer: index offset (uint64), index length (uint64), MAGIC
+(appended members, index and footer)
+...
+"""
+
+from __future__ import annotations
+
+import fnmatch
+import os
+import struct
+import zlib
+from collections.abc import Iterable, Iterator
+from typing import Any, BinaryIO
+
+import orjson
+
+from inc.codec import (
+    CODEC_PRESETS,
+    COMPRESSION_MAGIC,
+    COMPRESSION_SUFFIXES,
+    Codec,
+    decompress,
+)
+
+MAGIC = b"T1SNAP01"
+FOOTER = struct.Struct("<QQ8s")
+SCAN_CHUNK_SIZE = 2**20  # Bytes to search at a time for a footer
+
+
+def get_compression(data: bytes) -> str:
+    """
+    Return the compression type of data, based on its magic bytes
+    """
+    for prefix, compression in COMPRESSION_MAGIC.items():
+        if data.startswith(prefix):
+            return compression
+    return "none"
+
+
+def get_suffix_compression(name: str) -> str:
+    """
+    Return the compression type implied by a filename's suffix
+    """
+    for compression, suffix in COMPRESSION_SUFFIXES.items():
+        if suffix and name.endswith(suffix):
+            return compression
+    return "none"
+
+
+def member_name(filename: str) -> str:
+    """
+    Return the member name of a file on disk
+    """
+    name = os.path.relpath(filename)
+    if name == os.pardir or name.startswith(os.pardir + os.sep):
+        name = os.path.abspath(filename).lstrip(os.sep)
+    return name
+
+
+def find_magic(f: Any, end: int) -> int:
+    """
+    Return the offset of the last MAGIC which ends at or before end, or -1
+    """
+    while end >= len(MAGIC):
+        start = max(0, end - max(SCAN_CHUNK_SIZE, 2 * len(MAGIC)))
+        f.seek(start)
+        idx = f.read(end - start).rfind(MAGIC)
+        if idx >= 0:
+            return start + idx
+        if start == 0:
+            break
+        # Overlap the chunks, in case MAGIC spans two of them
+        end = start + len(MAGIC) - 1
+    return -1
+
+
+def read_index(f: Any, filename: str) -> dict[str, list[Any]]:
+    """
+    Return the index of an open archive. If an append was interrupted, the
+    archive doesn't end with a footer, so the last complete footer is used.
+    """
+    f.seek(0)
+    if f.read(len(MAGIC)) != MAGIC:
+        raise ValueError(f"Not a snapshot archive: {filename}")
+    end = f.seek(0, os.SEEK_END)
+
+    pos = end - len(MAGIC)
+    while (pos := find_magic(f, pos + len(MAGIC))) >= 0:
+        footer_offset = pos + len(MAGIC) - FOOTER.size
+        if footer_offset < len(MAGIC):
+            break
+        f.seek(footer_offset)
+        index_offset, index_length, _ = FOOTER.unpack(f.read(FOOTER.size))
+        if (
+            index_offset >= len(MAGIC)
+            and index_offset + index_length == footer_offset
+        ):
+            f.seek(index_offset)
+            try:
+                index: dict[str, list[Any]] = orjson.loads(
+                    zlib.decompress(f.read(index_length))
+                )
+            except (zlib.error, orjson.JSONDecodeError):
+                pass
+            else:
+                if footer_offset + FOOTER.size != end:
+                    print(f"Ignoring an incomplete append to {filename}")
+                return index
+        # Search before this MAGIC
+        pos -= 1
+    raise ValueError(f"Truncated snapshot archive: {filename}")
+
+
+class SnapshotWriter:
+    """
+    Add files to a new, or existing, snapshot archive
+    """
+
+    def __init__(
+        self: SnapshotWriter,
+        filename: str,
+        codec: Codec,
+        append: bool = False,
+        recompress: bool = False,
+    ) -> None:
+        self.filename = filename
+        self.codec = codec
+        self.recompress = recompress
+        self.index: dict[str, list[Any]] = {}
+        self.f: BinaryIO
+
+        if append and os.path.exists(filename):
+            self.f = open(filename, "r+b")
+            self.index = read_index(self.f, filename)
+            # The old index and footer stay valid until the new ones are
+            # written after the new members
+            self.f.seek(0, os.SEEK_END)
+        else:
+            if os.path.dirname(filename):
+                os.makedirs(os.path.dirname(filename), exist_ok=True)
+            self.f = open(filename, "wb")
+            self.f.write(MAGIC)
+
+    def __enter__(self: SnapshotWriter) -> SnapshotWriter:
+        return self
+
+    def __exit__(self: SnapshotWriter, *args: Any) -> None:
+        self.close()
+
+    def add(self: SnapshotWriter, name: str, data: bytes, mtime: int) -> None:
+        """
+        Add a member to the archive, compressing it unless it is already
+        compressed, or recompressing it if the writer recompresses. A member
+        with the same name is replaced.
+        """
+        if (
+            os.path.isabs(name)
+            or os.pardir in name.split(os.sep)
+            or os.path.normpath(name) != name
+        ):
+            raise ValueError(f"Invalid snapshot member name: {name}")
+        compression = get_compression(data)
+        if compression != "none" and self.recompress:
+            stored = self.codec.compress(decompress(data))
+            compression = self.codec.compression
+        elif compression == "none":
+            stored = self.codec.compress(data)
+            compression = self.codec.compression
+        else:
+            stored = data
+            compression = "none"
+        self.index[name] = [
+            self.f.tell(),
+            len(stored),
+            compression,
+            len(data),
+            mtime,
+        ]
+        self.f.write(stored)
+
+    def add_file(self: SnapshotWriter, filename: str) -> None:
+        """
+        Add a file from disk, named by its relative path
+        """
+        with open(filename, "rb") as f:
+            data = f.read()
+        self.add(member_name(filename), data, int(os.path.getmtime(filename)))
+
+    def add_paths(self: SnapshotWriter, paths: Iterable[str]) -> None:
+        """
+        Add files, and all the files under directories, in sorted order
+        """
+        for path in paths:
+            if os.path.isdir(path):
+                for root, dirs, files in os.walk(path):
+                    dirs.sort()
+                    for file in sorted(files):
+                        self.add_file(os.path.join(root, file))
+            else:
+                self.add_file(path)
+
+    def close(self: SnapshotWriter) -> None:
+        """
+        Write the index and footer
+        """
+        if self.f.closed:
+            return
+        index = zlib.compress(orjson.dumps(self.index), 9)
+        index_offset = self.f.tell()
+        self.f.write(index)
+        self.f.write(FOOTER.pack(index_offset, len(index), MAGIC))
+        self.f.close()
+
+
+class SnapshotReader:
+    """
+    Read single members of a snapshot archive
+    """
+
+    def __init__(self: SnapshotReader, filename: str) -> None:
+        if not os.path.exists(filename):
+            raise FileExistsError(
+                f"Snapshot archive doesn't exist: {filename}"
+            )
+        self.filename = filename
+        self.f = open(filename, "rb")
+        self.index = read_index(self.f, filename)
+
+    def __contains__(self: SnapshotReader, name: str) -> bool:
+        return os.path.normpath(name) in self.index
+
+    def __enter__(self: SnapshotReader) -> SnapshotReader:
+        return self
+
+    def __exit__(self: SnapshotReader, *args: Any) -> None:
+        self.close()
+
+    def __iter__(self: SnapshotReader) -> Iterator[str]:
+        return iter(sorted(self.index))
+
+    def __len__(self: SnapshotReader) -> int:
+        return len(self.index)
+
+    def close(self: SnapshotReader) -> None:
+        self.f.close()
+
+    def extract(self: SnapshotReader, name: str, output_dir: str) -> str:
+        """
+        Write a member to disk, under output_dir, and return its filename.
+        Members which would be written outside output_dir are refused.
+        Recompressed members are compressed again with the fast codec, so
+        they aren't byte-identical to the archived files.
+        """
+        root = os.path.realpath(output_dir)
+        filename = os.path.realpath(os.path.join(root, name))
+        if os.path.commonpath([root, filename]) != root or filename == root:
+            raise ValueError(
+                f"Member {name} would be extracted outside {output_dir}"
+            )
+
+        data = self.read(name)
+        compression = get_suffix_compression(name)
+        if compression != "none" and get_compression(data) == "none":
+            # The member was recompressed when it was archived
+            codec = Codec(compression, CODEC_PRESETS["fast"].level)
+            data = codec.compress(data)
+
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        with open(filename, "wb") as f:
+            f.write(data)
+        mtime = self.info(name)[4]
+        os.utime(filename, (mtime, mtime))
+        return filename
+
+    def glob(self: SnapshotReader, pattern: str) -> list[str]:
+        """
+        Return the names of the members which match a shell style pattern
+        """
+        return [name for name in self if fnmatch.fnmatch(name, pattern)]
+
+    def info(self: SnapshotReader, name: str) -> list[Any]:
+        """
+        Return the [offset, length, compression, size, mtime] of a member
+        """
+        name = os.path.normpath(name)
+        if name not in self.index:
+            raise KeyError(f"{name} isn't in snapshot {self.filename}")
+        return self.index[name]
+
+    def load_json(self: SnapshotReader, name: str) -> Any:
+        """
+        Read and decode a JSON member, written with any codec
+        """
+        return orjson.loads(decompress(self.read(name)))
+
+    def read(self: SnapshotReader, name: str) -> bytes:
+        """
+        Return the original contents of a member, or the decompressed
+        contents if it was recompressed
+        """
+        offset, length, compression, _, _ = self.info(name)
+        self.f.seek(offset)
+        data = self.f.read(length)
+        if compression == "none":
+            return data
+        return decompress(data)
@@ -0,0 +1,325 @@
+"""
+A prefix sorted, block compressed, seekable file format for AsnRoutes.
+
+Prefixes are sorted by (AFI, network integer, mask length) and stored in
+blocks of a fixed number of prefixes. Each block is compressed on its own,
+and an index of the first and last prefix in each block is stored at the end
+of the file. This means a single prefix can be found by binary searching the
+index and decompressing one block, and ranges of prefixes can be streamed,
+without loading the whole table.
+
+File layout:
+
+MAGIC
+block 0: zlib compressed JSON list of [prefix, as_paths] pairs
+...
+block n
+index: zlib compressed JSON dict with the AsnRoutes counts and the
+       [first prefix, last prefix, offset, length, count] of every block
+footer: index offset (uint64), index length (uint64), MAGIC
+"""
+
+from __future__ import annotations
+
+import bisect
+import os
+import struct
+import zlib
+from collections.abc import Iterator
+from typing import Any, Optional
+
+import orjson
+
+from inc.aggregate6 import ip_to_int
+from inc.globals import IPV4_SIZE, IPV6_SIZE
+from inc.stats import AsnRoutes
+
+MAGIC = b"T1SRTD01"
+FOOTER = struct.Struct("<QQ8s")
+BLOCK_PREFIXES = 4096  # Default number of prefixes per block
+
+
+def prefix_key(prefix: str) -> tuple[int, int, int]:
+    """
+    Return the sort key for a prefix: (AFI, network integer, mask length)
+    """
+    net, mask = prefix.split("/")
+    if ":" in net:
+        return (6, ip_to_int(net, IPV6_SIZE), int(mask))
+    return (4, ip_to_int(net, IPV4_SIZE), int(mask))
+
+
+class SortedRoutesWriter:
+    """
+    Write prefixes, which must be added in sorted order, to a sorted routes
+    file, one compressed block at a time.
+    """
+
+    def __init__(
+        self: SortedRoutesWriter,
+        filename: str,
+        peer_as: int,
+        block_prefixes: int = BLOCK_PREFIXES,
+        compresslevel: int = 6,
+    ) -> None:
+        self.filename = filename
+        self.peer_as = peer_as
+        self.block_prefixes = block_prefixes
+        self.compresslevel = compresslevel
+        self.v4_count = 0
+        self.v6_count = 0
+        self.blocks: list[list[Any]] = []
+        self.block: list[tuple[str, list[list[int]]]] = []
+        self.last_key: Optional[tuple[int, int, int]] = None
+
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        self.f = open(filename, "wb")
+        self.f.write(MAGIC)
+
+    def __enter__(self: SortedRoutesWriter) -> SortedRoutesWriter:
+        return self
+
+    def __exit__(self: SortedRoutesWriter, *args: Any) -> None:
+        self.close()
+
+    def add(
+        self: SortedRoutesWriter, prefix: str, as_paths: list[list[int]]
+    ) -> None:
+        """
+        Add the next prefix and its AS paths
+        """
+        key = prefix_key(prefix)
+        if self.last_key is not None and key < self.last_key:
+            raise ValueError(
+                f"AS{self.peer_as} prefix {prefix} added out of order"
+            )
+        self.last_key = key
+
+        if key[0] == 6:
+            self.v6_count += 1
+        else:
+            self.v4_count += 1
+
+        self.block.append((prefix, as_paths))
+        if len(self.block) >= self.block_prefixes:
+            self.flush()
+
+    def flush(self: SortedRoutesWriter) -> None:
+        """
+        Compress and write the current block
+        """
+        if not self.block:
+            return
+        data = zlib.compress(orjson.dumps(self.block), self.compresslevel)
+        self.blocks.append(
+            [
+                self.block[0][0],
+                self.block[-1][0],
+                self.f.tell(),
+                len(data),
+                len(self.block),
+            ]
+        )
+        self.f.write(data)
+        self.block = []
+
+    def close(self: SortedRoutesWriter) -> None:
+        """
+        Write the last block, the block index and the footer
+        """
+        if self.f.closed:
+            return
+        self.flush()
+        index = zlib.compress(
+            orjson.dumps(
+                {
+                    "peer_as": self.peer_as,
+                    "v4_count": self.v4_count,
+                    "v6_count": self.v6_count,
+                    "blocks": self.blocks,
+                }
+            ),
+            self.compresslevel,
+        )
+        index_offset = self.f.tell()
+        self.f.write(index)
+        self.f.write(FOOTER.pack(index_offset, len(index), MAGIC))
+        self.f.close()
+
+
+class SortedRoutesReader:
+    """
+    Read a sorted routes file, only decompressing the blocks needed
+    """
+
+    peer_as: int
+    v4_count: int
+    v6_count: int
+
+    def __init__(self: SortedRoutesReader, filename: str) -> None:
+        if not os.path.exists(filename):
+            raise FileExistsError(
+                f"Sorted routes file doesn't exist: {filename}"
+            )
+
+        self.filename = filename
+        self.f = open(filename, "rb")
+        if self.f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"Not a sorted routes file: {filename}")
+
+        if self.f.seek(0, os.SEEK_END) < len(MAGIC) + FOOTER.size:
+            raise ValueError(f"Truncated sorted routes file: {filename}")
+        self.f.seek(-FOOTER.size, os.SEEK_END)
+        index_offset, index_length, magic = FOOTER.unpack(
+            self.f.read(FOOTER.size)
+        )
+        if magic != MAGIC:
+            raise ValueError(f"Truncated sorted routes file: {filename}")
+        self.f.seek(index_offset)
+        index = orjson.loads(zlib.decompress(self.f.read(index_length)))
+
+        self.peer_as = index["peer_as"]
+        self.v4_count = index["v4_count"]
+        self.v6_count = index["v6_count"]
+        self.blocks = index["blocks"]
+        self.first_keys = [prefix_key(block[0]) for block in self.blocks]
+        self.last_keys = [prefix_key(block[1]) for block in self.blocks]
+        self.cached_block: tuple[int, list[list[Any]]] = (-1, [])
+        self.cached_keys: tuple[int, list[tuple[int, int, int]]] = (-1, [])
+
+    def __enter__(self: SortedRoutesReader) -> SortedRoutesReader:
+        return self
+
+    def __exit__(self: SortedRoutesReader, *args: Any) -> None:
+        self.close()
+
+    def __iter__(
+        self: SortedRoutesReader,
+    ) -> Iterator[tuple[str, list[list[int]]]]:
+        for idx in range(len(self.blocks)):
+            for prefix, as_paths in self.read_block(idx):
+                yield prefix, as_paths
+
+    def __len__(self: SortedRoutesReader) -> int:
+        return self.v4_count + self.v6_count
+
+    def close(self: SortedRoutesReader) -> None:
+        self.f.close()
+
+    def get(
+        self: SortedRoutesReader, prefix: str
+    ) -> Optional[list[list[int]]]:
+        """
+        Return the AS paths for an exact prefix, or None if it isn't present
+        """
+        key = prefix_key(prefix)
+        idx = bisect.bisect_left(self.last_keys, key)
+        if idx == len(self.blocks) or key < self.first_keys[idx]:
+            return None
+
+        block = self.read_block(idx)
+        if self.cached_keys[0] != idx:
+            self.cached_keys = (idx, [prefix_key(entry[0]) for entry in block])
+        keys = self.cached_keys[1]
+        pos = bisect.bisect_left(keys, key)
+        if pos < len(keys) and keys[pos] == key:
+            as_paths: list[list[int]] = block[pos][1]
+            return as_paths
+        return None
+
+    def iter_range(
+        self: SortedRoutesReader, start: str, end: str
+    ) -> Iterator[tuple[str, list[list[int]]]]:
+        """
+        Yield the prefixes, and their AS paths, which sort between the start
+        and end prefixes (inclusive)
+        """
+        start_key = prefix_key(start)
+        end_key = prefix_key(end)
+        idx = bisect.bisect_left(self.last_keys, start_key)
+        while idx < len(self.blocks) and self.first_keys[idx] <= end_key:
+            for prefix, as_paths in self.read_block(idx):
+                key = prefix_key(prefix)
+                if key > end_key:
+                    return
+                if key >= start_key:
+                    yield prefix, as_paths
+            idx += 1
+
+    def read_block(self: SortedRoutesReader, idx: int) -> list[list[Any]]:
+        """
+        Return the decompressed [prefix, as_paths] pairs in a block.
+        The last block read is cached, for repeated lookups in the same block.
+        """
+        if self.cached_block[0] == idx:
+            return self.cached_block[1]
+        _, _, offset, length, _ = self.blocks[idx]
+        self.f.seek(offset)
+        block = orjson.loads(zlib.decompress(self.f.read(length)))
+        self.cached_block = (idx, block)
+        return block
+
+    def to_asn_routes(self: SortedRoutesReader) -> AsnRoutes:
+        """
+        Load the whole file into an AsnRoutes object
+        """
+        return AsnRoutes(
+            peer_as=self.peer_as,
+            v4_count=self.v4_count,
+            v6_count=self.v6_count,
+            routes={prefix: as_paths for prefix, as_paths in self},
+        )
+
+
+def merge_join(
+    reader_1: SortedRoutesReader, reader_2: SortedRoutesReader
+) -> Iterator[
+    tuple[str, Optional[list[list[int]]], Optional[list[list[int]]]]
+]:
+    """
+    Walk two sorted routes files in prefix order, yielding each prefix with
+    its AS paths from each file, or None if the file doesn't have the prefix
+    """
+    iter_1 = iter(reader_1)
+    iter_2 = iter(reader_2)
+    entry_1 = next(iter_1, None)
+    entry_2 = next(iter_2, None)
+
+    while entry_1 is not None or entry_2 is not None:
+        if entry_2 is None:
+            assert entry_1 is not None  # mypy
+            yield entry_1[0], entry_1[1], None
+            entry_1 = next(iter_1, None)
+            continue
+        if entry_1 is None:
+            yield entry_2[0], None, entry_2[1]
+            entry_2 = next(iter_2, None)
+            continue
+
+        key_1 = prefix_key(entry_1[0])
+        key_2 = prefix_key(entry_2[0])
+        if key_1 == key_2:
+            yield entry_1[0], entry_1[1], entry_2[1]
+            entry_1 = next(iter_1, None)
+            entry_2 = next(iter_2, None)
+        elif key_1 < key_2:
+            yield entry_1[0], entry_1[1], None
+            entry_1 = next(iter_1, None)
+        else:
+            yield entry_2[0], None, entry_2[1]
+            entry_2 = next(iter_2, None)
+
+
+def write_sorted_routes(
+    asn_routes: AsnRoutes,
+    filename: str,
+    block_prefixes: int = BLOCK_PREFIXES,
+) -> None:
+    """
+    Write an AsnRoutes object to disk in the sorted routes format
+    """
+    with SortedRoutesWriter(
+        filename, asn_routes.peer_as, block_prefixes
+    ) as writer:
+        for prefix in sorted(asn_routes.routes, key=prefix_key):
+            writer.add(prefix, asn_routes.routes[prefix])
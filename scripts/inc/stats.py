@@ -1,15 +1,44 @@
 from __future__ import annotations
 
 import copy
-import gzip
 import os
-from typing import Any
+import struct
+from collections.abc import Iterable
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Optional
 
+import numpy as np
+import numpy.typing as npt
 import orjson
 import pytricia
 
+from inc.codec import Codec, decompress, load_json
 from inc.globals import IPV4_SIZE, IPV6_SIZE
 
+# AsStats field files: MAGIC, one compressed JSON block per field, a JSON
+# directory of {field: [offset, length]}, then a footer of the directory
+# offset (uint64), directory length (uint64) and MAGIC.
+FIELDS_MAGIC = b"T1FLDS01"
+FIELDS_FOOTER = struct.Struct("<QQ8s")
+# AsStats fields which aren't stored, they are calculated from other fields
+DERIVED_FIELDS = {
+    "asns_n_reachable_via_peers": [
+        "asns_reachable",
+        "asns_reachable_via_peers",
+    ],
+    "v4_pfx_n_covered_by_peers": ["v4_pfx_tree", "v4_pfx_covered_by_peers"],
+    "v6_pfx_n_covered_by_peers": ["v6_pfx_tree", "v6_pfx_covered_by_peers"],
+}
+
+
+def asn_array(asns: Iterable[Any]) -> npt.NDArray[np.uint32]:
+    """
+    Return a sorted array of unique ASNs, which is how AsStats stores sets
+    of ASNs. This uses a fraction of the memory of a set of ints, and sets
+    of ASNs can be compared with numpy's sorted set operations.
+    """
+    return np.unique(np.fromiter(asns, dtype=np.uint32))
+
 
 class AsStats:
     asn: int
@@ -25,7 +54,7 @@ class AsStats:
         int  # Weighted score of AS path length frequencies (per prefix)
     )
     as_hops: dict[
-        int, set[int]
+        int, npt.NDArray[np.uint32]
     ]  # How many hops to each ASN (dict value) keyed by hop count
     as_hops_freq: dict[
         int, int
@@ -37,9 +66,6 @@ class AsStats:
     v4_pfx_covered_by_peers: set[
         str
     ]  # v4 prefixes which other networks also have in their table
-    v4_pfx_n_covered_by_peers: set[
-        str
-    ]  # v4 prefixes not visible by any other network
     v4_pfx_preferred_by_t1s: set[
         str
     ]  # v4 prefixes with shortest AS path via Tier 1(s)
@@ -49,31 +75,29 @@ class AsStats:
     v6_pfx_covered_by_peers: set[
         str
     ]  # v6 prefixes which other networks also have in their table
-    v6_pfx_n_covered_by_peers: set[
-        str
-    ]  # v6 prefixes not visible by any other network
     v6_pfx_preferred_by_t1s: set[
         str
     ]  # v6 prefixes with shortest AS path via Tier 1(s)
     v6_pfx_n_preferred_by_t1s: set[str]  # v4 prefixes not going via Tier 1(s)
-    asns_reachable: set[
-        int
+    asns_reachable: npt.NDArray[
+        np.uint32
     ]  # All ASNs this network can reach via any peer (the AS cone)
-    asns_reachable_via_peers: set[
-        int
+    asns_reachable_via_peers: npt.NDArray[
+        np.uint32
     ]  # ASNs which are reachable via other networks
-    asns_n_reachable_via_peers: set[
-        int
-    ]  # ASNs which are not reachable via other networks
     peers_w_reachable_asn: dict[
         int, int
     ]  # Count per peer of how many overlapping reachable ASNs the local ASN has with the peer ASN
     peers_wo_reachable_asn: dict[
         int, int
     ]  # Count per peer of how many reachable ASNs the local ASN has which the peer can not reach
-    on_net_asns: set[int]  # On-net ASNs (direct peers)
-    asns_on_net_for_peers: set[int]  # On-net ASNs also reachable via peers
-    asns_n_on_net_for_peers: set[int]  # On-net ASNs not reachable via peers
+    on_net_asns: npt.NDArray[np.uint32]  # On-net ASNs (direct peers)
+    asns_on_net_for_peers: npt.NDArray[
+        np.uint32
+    ]  # On-net ASNs also reachable via peers
+    asns_n_on_net_for_peers: npt.NDArray[
+        np.uint32
+    ]  # On-net (and local) ASNs not reachable via peers
     peers_w_asn_on_net: dict[
         int, int
     ]  # Count per peer of how many overlapping on-net ASNs the local ASN has with the peer ASN
@@ -81,77 +105,191 @@ class AsStats:
         int, int
     ]  # Count per peer of how many on-net ASNs the local ASN has which the peer does not have on-net
 
+    __slots__ = (
+        "asn",
+        "v4_percent",
+        "v6_percent",
+        "v4_pfx_tree",
+        "v6_pfx_tree",
+        "as_path_lengths",
+        "avg_as_path_length",
+        "weighted_as_path_score",
+        "as_hops",
+        "as_hops_freq",
+        "avg_as_hops",
+        "weighted_as_hops_score",
+        "peers_w_cover_v4_pfx",
+        "peers_wo_cover_v4_pfx",
+        "v4_pfx_covered_by_peers",
+        "v4_pfx_preferred_by_t1s",
+        "v4_pfx_n_preferred_by_t1s",
+        "peers_w_cover_v6_pfx",
+        "peers_wo_cover_v6_pfx",
+        "v6_pfx_covered_by_peers",
+        "v6_pfx_preferred_by_t1s",
+        "v6_pfx_n_preferred_by_t1s",
+        "asns_reachable",
+        "asns_reachable_via_peers",
+        "peers_w_reachable_asn",
+        "peers_wo_reachable_asn",
+        "on_net_asns",
+        "asns_on_net_for_peers",
+        "asns_n_on_net_for_peers",
+        "peers_w_asn_on_net",
+        "peers_wo_asn_on_net",
+    )
+
     def __init__(
         self: AsStats,
         asn: int = -1,
         v4_percent: float = 0.0,
         v6_percent: float = 0.0,
-        v4_pfx_tree: pytricia.PyTricia = pytricia.PyTricia(IPV4_SIZE),
-        v6_pfx_tree: pytricia.PyTricia = pytricia.PyTricia(IPV6_SIZE),
-        as_path_lengths: dict[int, int] = {},
+        v4_pfx_tree: Optional[pytricia.PyTricia] = None,
+        v6_pfx_tree: Optional[pytricia.PyTricia] = None,
+        as_path_lengths: Optional[dict[int, int]] = None,
         avg_as_path_length: int = 0,
         weighted_as_path_score: int = 0,
-        as_hops: dict[int, set[int]] = {},
-        as_hops_freq: dict[int, int] = {},
+        as_hops: Optional[dict[int, npt.NDArray[np.uint32]]] = None,
+        as_hops_freq: Optional[dict[int, int]] = None,
         avg_as_hops: int = 0,
         weighted_as_hops_score: int = 0,
-        peers_w_cover_v4_pfx: dict[int, int] = {},
-        peers_wo_cover_v4_pfx: dict[int, int] = {},
-        v4_pfx_covered_by_peers: set[str] = set(),
-        v4_pfx_n_covered_by_peers: set[str] = set(),
-        v4_pfx_preferred_by_t1s: set[str] = set(),
-        v4_pfx_n_preferred_by_t1s: set[str] = set(),
-        peers_w_cover_v6_pfx: dict[int, int] = {},
-        peers_wo_cover_v6_pfx: dict[int, int] = {},
-        v6_pfx_covered_by_peers: set[str] = set(),
-        v6_pfx_n_covered_by_peers: set[str] = set(),
-        v6_pfx_preferred_by_t1s: set[str] = set(),
-        v6_pfx_n_preferred_by_t1s: set[str] = set(),
-        asns_reachable: set[int] = set(),
-        asns_reachable_via_peers: set[int] = set(),
-        asns_n_reachable_via_peers: set[int] = set(),
-        peers_w_reachable_asn: dict[int, int] = {},
-        peers_wo_reachable_asn: dict[int, int] = {},
-        on_net_asns: set[int] = set(),
-        asns_on_net_for_peers: set[int] = set(),
-        asns_n_on_net_for_peers: set[int] = set(),
-        peers_w_asn_on_net: dict[int, int] = {},
-        peers_wo_asn_on_net: dict[int, int] = {},
+        peers_w_cover_v4_pfx: Optional[dict[int, int]] = None,
+        peers_wo_cover_v4_pfx: Optional[dict[int, int]] = None,
+        v4_pfx_covered_by_peers: Optional[set[str]] = None,
+        v4_pfx_preferred_by_t1s: Optional[set[str]] = None,
+        v4_pfx_n_preferred_by_t1s: Optional[set[str]] = None,
+        peers_w_cover_v6_pfx: Optional[dict[int, int]] = None,
+        peers_wo_cover_v6_pfx: Optional[dict[int, int]] = None,
+        v6_pfx_covered_by_peers: Optional[set[str]] = None,
+        v6_pfx_preferred_by_t1s: Optional[set[str]] = None,
+        v6_pfx_n_preferred_by_t1s: Optional[set[str]] = None,
+        asns_reachable: Optional[npt.NDArray[np.uint32]] = None,
+        asns_reachable_via_peers: Optional[npt.NDArray[np.uint32]] = None,
+        peers_w_reachable_asn: Optional[dict[int, int]] = None,
+        peers_wo_reachable_asn: Optional[dict[int, int]] = None,
+        on_net_asns: Optional[npt.NDArray[np.uint32]] = None,
+        asns_on_net_for_peers: Optional[npt.NDArray[np.uint32]] = None,
+        asns_n_on_net_for_peers: Optional[npt.NDArray[np.uint32]] = None,
+        peers_w_asn_on_net: Optional[dict[int, int]] = None,
+        peers_wo_asn_on_net: Optional[dict[int, int]] = None,
     ) -> None:
+        """
+        Every field which isn't passed in gets its own new empty value,
+        no state is shared between objects through default arguments.
+        """
+        empty = asn_array([])
         self.asn = asn
         self.v4_percent = v4_percent
         self.v6_percent = v6_percent
-        self.v4_pfx_tree = v4_pfx_tree
-        self.v6_pfx_tree = v6_pfx_tree
-        self.as_path_lengths = as_path_lengths
+        self.v4_pfx_tree = (
+            v4_pfx_tree
+            if v4_pfx_tree is not None
+            else pytricia.PyTricia(IPV4_SIZE)
+        )
+        self.v6_pfx_tree = (
+            v6_pfx_tree
+            if v6_pfx_tree is not None
+            else pytricia.PyTricia(IPV6_SIZE)
+        )
+        self.as_path_lengths = as_path_lengths or {}
         self.avg_as_path_length = avg_as_path_length
         self.weighted_as_path_score = weighted_as_path_score
-        self.as_hops = as_hops
-        self.as_hops_freq = as_hops_freq
+        self.as_hops = as_hops or {}
+        self.as_hops_freq = as_hops_freq or {}
         self.avg_as_hops = avg_as_hops
         self.weighted_as_hops_score = weighted_as_hops_score
-        self.peers_w_cover_v4_pfx = peers_w_cover_v4_pfx
-        self.peers_wo_cover_v4_pfx = peers_wo_cover_v4_pfx
-        self.v4_pfx_covered_by_peers = v4_pfx_covered_by_peers
-        self.v4_pfx_n_covered_by_peers = v4_pfx_n_covered_by_peers
-        self.v4_pfx_preferred_by_t1s = v4_pfx_preferred_by_t1s
-        self.v4_pfx_n_preferred_by_t1s = v4_pfx_n_preferred_by_t1s
-        self.peers_w_cover_v6_pfx = peers_w_cover_v6_pfx
-        self.peers_wo_cover_v6_pfx = peers_wo_cover_v6_pfx
-        self.v6_pfx_covered_by_peers = v6_pfx_covered_by_peers
-        self.v6_pfx_n_covered_by_peers = v6_pfx_n_covered_by_peers
-        self.v6_pfx_preferred_by_t1s = v6_pfx_preferred_by_t1s
-        self.v6_pfx_n_preferred_by_t1s = v6_pfx_n_preferred_by_t1s
-        self.asns_reachable = asns_reachable
-        self.asns_reachable_via_peers = asns_reachable_via_peers
-        self.asns_n_reachable_via_peers = asns_n_reachable_via_peers
-        self.peers_w_reachable_asn = peers_w_reachable_asn
-        self.peers_wo_reachable_asn = peers_wo_reachable_asn
-        self.on_net_asns = on_net_asns
-        self.asns_on_net_for_peers = asns_on_net_for_peers
-        self.asns_n_on_net_for_peers = asns_n_on_net_for_peers
-        self.peers_w_asn_on_net = peers_w_asn_on_net
-        self.peers_wo_asn_on_net = peers_wo_asn_on_net
+        self.peers_w_cover_v4_pfx = peers_w_cover_v4_pfx or {}
+        self.peers_wo_cover_v4_pfx = peers_wo_cover_v4_pfx or {}
+        self.v4_pfx_covered_by_peers = v4_pfx_covered_by_peers or set()
+        self.v4_pfx_preferred_by_t1s = v4_pfx_preferred_by_t1s or set()
+        self.v4_pfx_n_preferred_by_t1s = v4_pfx_n_preferred_by_t1s or set()
+        self.peers_w_cover_v6_pfx = peers_w_cover_v6_pfx or {}
+        self.peers_wo_cover_v6_pfx = peers_wo_cover_v6_pfx or {}
+        self.v6_pfx_covered_by_peers = v6_pfx_covered_by_peers or set()
+        self.v6_pfx_preferred_by_t1s = v6_pfx_preferred_by_t1s or set()
+        self.v6_pfx_n_preferred_by_t1s = v6_pfx_n_preferred_by_t1s or set()
+        self.asns_reachable = (
+            asns_reachable if asns_reachable is not None else empty
+        )
+        self.asns_reachable_via_peers = (
+            asns_reachable_via_peers
+            if asns_reachable_via_peers is not None
+            else empty
+        )
+        self.peers_w_reachable_asn = peers_w_reachable_asn or {}
+        self.peers_wo_reachable_asn = peers_wo_reachable_asn or {}
+        self.on_net_asns = on_net_asns if on_net_asns is not None else empty
+        self.asns_on_net_for_peers = (
+            asns_on_net_for_peers
+            if asns_on_net_for_peers is not None
+            else empty
+        )
+        self.asns_n_on_net_for_peers = (
+            asns_n_on_net_for_peers
+            if asns_n_on_net_for_peers is not None
+            else empty
+        )
+        self.peers_w_asn_on_net = peers_w_asn_on_net or {}
+        self.peers_wo_asn_on_net = peers_wo_asn_on_net or {}
+
+    @property
+    def asns_n_reachable_via_peers(self: AsStats) -> npt.NDArray[np.uint32]:
+        """
+        ASNs which are not reachable via other networks
+        """
+        return np.setdiff1d(
+            self.asns_reachable,
+            self.asns_reachable_via_peers,
+            assume_unique=True,
+        )
+
+    @property
+    def v4_pfx_n_covered_by_peers(self: AsStats) -> set[str]:
+        """
+        v4 prefixes not visible by any other network
+        """
+        return {
+            prefix
+            for prefix in self.v4_pfx_tree
+            if prefix not in self.v4_pfx_covered_by_peers
+        }
+
+    @property
+    def v6_pfx_n_covered_by_peers(self: AsStats) -> set[str]:
+        """
+        v6 prefixes not visible by any other network
+        """
+        return {
+            prefix
+            for prefix in self.v6_pfx_tree
+            if prefix not in self.v6_pfx_covered_by_peers
+        }
+
+    def __getstate__(self: AsStats) -> dict[str, Any]:
+        """
+        pytricia trees can't be pickled, so pickle them as lists of prefixes.
+        This lets AsStats objects be passed to, and returned from, pool
+        workers. The coverage pools don't share AsStats objects, the workers
+        read their fields from the stats store and the global prefixes from
+        SharedArrays.
+        """
+        state = {field: getattr(self, field) for field in AsStats.__slots__}
+        state["v4_pfx_tree"] = list(self.v4_pfx_tree)
+        state["v6_pfx_tree"] = list(self.v6_pfx_tree)
+        return state
+
+    def __setstate__(self: AsStats, state: dict[str, Any]) -> None:
+        """
+        Rebuild the pytricia trees from their lists of prefixes
+        """
+        for field, value in state.items():
+            setattr(self, field, value)
+        self.v4_pfx_tree = pytricia.PyTricia(IPV4_SIZE)
+        for prefix in state["v4_pfx_tree"]:
+            self.v4_pfx_tree.insert(prefix, None)
+        self.v6_pfx_tree = pytricia.PyTricia(IPV6_SIZE)
+        for prefix in state["v6_pfx_tree"]:
+            self.v6_pfx_tree.insert(prefix, None)
 
     @staticmethod
     def from_dict(data: dict[str, Any]) -> AsStats:
@@ -159,13 +297,12 @@ class AsStats:
         Return an AsnRoutes object from a dict.
         Ensure that dict keys which needs to be int, are int. In the case
         they were read from JSON, they will be string.
+        Derived fields are ignored, they are calculated from other fields.
         """
         as_stats = AsStats(
             asn=data["asn"],
             v4_percent=data["v4_percent"],
             v6_percent=data["v6_percent"],
-            v4_pfx_tree=pytricia.PyTricia(IPV4_SIZE),
-            v6_pfx_tree=pytricia.PyTricia(IPV6_SIZE),
             as_path_lengths={
                 int(key): value
                 for key, value in data["as_path_lengths"].items()
@@ -173,7 +310,8 @@ class AsStats:
             avg_as_path_length=data["avg_as_path_length"],
             weighted_as_path_score=data["weighted_as_path_score"],
             as_hops={
-                int(key): value for key, value in data["as_hops"].items()
+                int(key): asn_array(value)
+                for key, value in data["as_hops"].items()
             },
             as_hops_freq={
                 int(key): value for key, value in data["as_hops_freq"].items()
@@ -189,7 +327,6 @@ class AsStats:
                 for key, value in data["peers_wo_cover_v4_pfx"].items()
             },
             v4_pfx_covered_by_peers=set(data["v4_pfx_covered_by_peers"]),
-            v4_pfx_n_covered_by_peers=set(data["v4_pfx_n_covered_by_peers"]),
             v4_pfx_preferred_by_t1s=set(data["v4_pfx_preferred_by_t1s"]),
             v4_pfx_n_preferred_by_t1s=set(data["v4_pfx_n_preferred_by_t1s"]),
             peers_w_cover_v6_pfx={
@@ -201,12 +338,12 @@ class AsStats:
                 for key, value in data["peers_wo_cover_v6_pfx"].items()
             },
             v6_pfx_covered_by_peers=set(data["v6_pfx_covered_by_peers"]),
-            v6_pfx_n_covered_by_peers=set(data["v6_pfx_n_covered_by_peers"]),
             v6_pfx_preferred_by_t1s=set(data["v6_pfx_preferred_by_t1s"]),
             v6_pfx_n_preferred_by_t1s=set(data["v6_pfx_n_preferred_by_t1s"]),
-            asns_reachable=set(data["asns_reachable"]),
-            asns_reachable_via_peers=set(data["asns_reachable_via_peers"]),
-            asns_n_reachable_via_peers=set(data["asns_n_reachable_via_peers"]),
+            asns_reachable=asn_array(data["asns_reachable"]),
+            asns_reachable_via_peers=asn_array(
+                data["asns_reachable_via_peers"]
+            ),
             peers_w_reachable_asn={
                 int(key): value
                 for key, value in data["peers_w_reachable_asn"].items()
@@ -215,9 +352,9 @@ class AsStats:
                 int(key): value
                 for key, value in data["peers_wo_reachable_asn"].items()
             },
-            on_net_asns=set(data["on_net_asns"]),
-            asns_on_net_for_peers=set(data["asns_on_net_for_peers"]),
-            asns_n_on_net_for_peers=set(data["asns_n_on_net_for_peers"]),
+            on_net_asns=asn_array(data["on_net_asns"]),
+            asns_on_net_for_peers=asn_array(data["asns_on_net_for_peers"]),
+            asns_n_on_net_for_peers=asn_array(data["asns_n_on_net_for_peers"]),
             peers_w_asn_on_net={
                 int(key): value
                 for key, value in data["peers_w_asn_on_net"].items()
@@ -235,28 +372,24 @@ class AsStats:
         return as_stats
 
     @staticmethod
-    def from_json(uncompressed: bool, filename: str) -> AsStats:
+    def from_json(filename: str) -> AsStats:
         """
         Read an AsStats object from disk, which has been serialised as JSON.
-        This may have been optionally GZIP compressed
+        This may have been compressed with any codec.
         """
         if not os.path.exists(filename):
             raise FileExistsError(f"AsStats file doesn't exist: {filename}")
 
         print(f"{os.getpid()}: Reading {filename}")
-        if uncompressed:
-            with open(filename) as f:
-                return AsStats.from_dict(orjson.loads(f.read()))
-        else:
-            with gzip.open(filename, "rt") as f:
-                return AsStats.from_dict(orjson.loads(f.read()))
+        return AsStats.from_dict(load_json(filename))
 
-    def to_dict(self: AsStats) -> dict[str, Any]:
+    def to_dict(self: AsStats, derived: bool = True) -> dict[str, Any]:
         """
         In case the dict is being serialised to JSON, we need to ensure all
         dict keys are strings because JSON objects must have string keys.
+        Derived fields are included unless derived is False.
         """
-        return {
+        data = {
             "asn": self.asn,
             "v4_percent": self.v4_percent,
             "v6_percent": self.v6_percent,
@@ -268,7 +401,7 @@ class AsStats:
             "avg_as_path_length": self.avg_as_path_length,
             "weighted_as_path_score": self.weighted_as_path_score,
             "as_hops": {
-                str(key): list(value) for key, value in self.as_hops.items()
+                str(key): value.tolist() for key, value in self.as_hops.items()
             },
             "as_hops_freq": {
                 str(key): value for key, value in self.as_hops_freq.items()
@@ -284,7 +417,6 @@ class AsStats:
                 for key, value in self.peers_wo_cover_v4_pfx.items()
             },
             "v4_pfx_covered_by_peers": list(self.v4_pfx_covered_by_peers),
-            "v4_pfx_n_covered_by_peers": list(self.v4_pfx_n_covered_by_peers),
             "v4_pfx_preferred_by_t1s": list(self.v4_pfx_preferred_by_t1s),
             "v4_pfx_n_preferred_by_t1s": list(self.v4_pfx_n_preferred_by_t1s),
             "peers_w_cover_v6_pfx": {
@@ -296,14 +428,10 @@ class AsStats:
                 for key, value in self.peers_wo_cover_v6_pfx.items()
             },
             "v6_pfx_covered_by_peers": list(self.v6_pfx_covered_by_peers),
-            "v6_pfx_n_covered_by_peers": list(self.v6_pfx_n_covered_by_peers),
             "v6_pfx_preferred_by_t1s": list(self.v6_pfx_preferred_by_t1s),
             "v6_pfx_n_preferred_by_t1s": list(self.v6_pfx_n_preferred_by_t1s),
-            "asns_reachable": list(self.asns_reachable),
-            "asns_reachable_via_peers": list(self.asns_reachable_via_peers),
-            "asns_n_reachable_via_peers": list(
-                self.asns_n_reachable_via_peers
-            ),
+            "asns_reachable": self.asns_reachable.tolist(),
+            "asns_reachable_via_peers": self.asns_reachable_via_peers.tolist(),
             "peers_w_reachable_asn": {
                 str(key): value
                 for key, value in self.peers_w_reachable_asn.items()
@@ -312,9 +440,9 @@ class AsStats:
                 str(key): value
                 for key, value in self.peers_wo_reachable_asn.items()
             },
-            "on_net_asns": list(self.on_net_asns),
-            "asns_on_net_for_peers": list(self.asns_on_net_for_peers),
-            "asns_n_on_net_for_peers": list(self.asns_n_on_net_for_peers),
+            "on_net_asns": self.on_net_asns.tolist(),
+            "asns_on_net_for_peers": self.asns_on_net_for_peers.tolist(),
+            "asns_n_on_net_for_peers": self.asns_n_on_net_for_peers.tolist(),
             "peers_w_asn_on_net": {
                 str(key): value
                 for key, value in self.peers_w_asn_on_net.items()
@@ -324,23 +452,129 @@ class AsStats:
                 for key, value in self.peers_wo_asn_on_net.items()
             },
         }
+        if derived:
+            data["asns_n_reachable_via_peers"] = (
+                self.asns_n_reachable_via_peers.tolist()
+            )
+            data["v4_pfx_n_covered_by_peers"] = list(
+                self.v4_pfx_n_covered_by_peers
+            )
+            data["v6_pfx_n_covered_by_peers"] = list(
+                self.v6_pfx_n_covered_by_peers
+            )
+        return data
 
-    def to_json(self: AsStats, uncompressed: bool, filename: str) -> None:
+    def to_json(self: AsStats, codec: Codec, filename: str) -> None:
         """
-        Write an AsStats object to disk serialised as JSON.
-        This can optionally be GZIP compressed.
+        Write an AsStats object to disk serialised as JSON, using the codec
         """
-        os.makedirs(os.path.dirname(filename), exist_ok=True)
-        if uncompressed:
-            with open(filename, "wb") as f:
-                f.write(
-                    orjson.dumps(self.to_dict(), option=orjson.OPT_INDENT_2)
-                )
-        else:
-            with gzip.open(filename, "wb") as f:
-                f.write(
-                    orjson.dumps(self.to_dict(), option=orjson.OPT_INDENT_2)
-                )
+        codec.write_json(filename, self.to_dict())
+        print(f"{os.getpid()}: Wrote to {filename}")
+
+    @staticmethod
+    def load(filename: str, fields: Optional[Iterable[str]] = None) -> AsStats:
+        """
+        Read an AsStats object from disk, only decoding the chosen fields.
+        Fields which aren't loaded are left empty. The ASN is always loaded,
+        and derived fields load the fields they are calculated from.
+        A JSON file is fully decoded, whichever fields are chosen.
+        """
+        if not os.path.exists(filename):
+            raise FileExistsError(f"AsStats file doesn't exist: {filename}")
+
+        with open(filename, "rb") as f:
+            if f.read(len(FIELDS_MAGIC)) != FIELDS_MAGIC:
+                return AsStats.from_json(filename)
+
+            print(f"{os.getpid()}: Reading {filename}")
+            directory = AsStats.read_directory(f, filename)
+            if fields is None:
+                fields = directory.keys()
+            stored_fields = {"asn"}
+            for field in fields:
+                stored_fields.update(DERIVED_FIELDS.get(field, [field]))
+
+            data = AsStats().to_dict(derived=False)
+            for field in stored_fields:
+                if field not in directory:
+                    raise ValueError(f"No field {field} in {filename}")
+                offset, length = directory[field]
+                f.seek(offset)
+                data[field] = orjson.loads(decompress(f.read(length)))
+
+        return AsStats.from_dict(data)
+
+    @staticmethod
+    def read_directory(f: Any, filename: str) -> dict[str, list[int]]:
+        """
+        Return the {field: [offset, length]} directory of an AsStats file
+        """
+        f.seek(-FIELDS_FOOTER.size, os.SEEK_END)
+        offset, length, magic = FIELDS_FOOTER.unpack(
+            f.read(FIELDS_FOOTER.size)
+        )
+        if magic != FIELDS_MAGIC:
+            raise ValueError(f"Truncated AsStats file: {filename}")
+        f.seek(offset)
+        directory: dict[str, list[int]] = orjson.loads(f.read(length))
+        return directory
+
+    def to_file(
+        self: AsStats,
+        codec: Codec,
+        filename: str,
+        fields: Optional[Iterable[str]] = None,
+    ) -> None:
+        """
+        Write an AsStats object to disk, with each field compressed on its
+        own so that it can be loaded without the others.
+
+        If fields are chosen, only those are written from this object, the
+        rest are copied unchanged from the existing file. This means an
+        object which was only partially loaded can be written back.
+        """
+        data = self.to_dict(derived=False)
+        blocks: dict[str, bytes] = {}
+        if fields is not None and os.path.exists(filename):
+            fields = set(fields)
+            with open(filename, "rb") as f:
+                if f.read(len(FIELDS_MAGIC)) != FIELDS_MAGIC:
+                    raise ValueError(f"Not an AsStats fields file: {filename}")
+                for field, (offset, length) in AsStats.read_directory(
+                    f, filename
+                ).items():
+                    if field not in fields and field in data:
+                        f.seek(offset)
+                        blocks[field] = f.read(length)
+        to_compress = [field for field in data if field not in blocks]
+
+        # zlib, bz2 and lzma release the GIL while compressing
+        with ThreadPoolExecutor(max_workers=codec.threads) as executor:
+            for field, block in zip(
+                to_compress,
+                executor.map(
+                    codec.compress,
+                    [orjson.dumps(data[field]) for field in to_compress],
+                ),
+                strict=True,
+            ):
+                blocks[field] = block
+
+        if os.path.dirname(filename):
+            os.makedirs(os.path.dirname(filename), exist_ok=True)
+        tmp_filename = f"{filename}.{os.getpid()}.tmp"
+        with open(tmp_filename, "wb") as f:
+            f.write(FIELDS_MAGIC)
+            directory: dict[str, list[int]] = {}
+            for field in data:
+                directory[field] = [f.tell(), len(blocks[field])]
+                f.write(blocks[field])
+            offset = f.tell()
+            f.write(orjson.dumps(directory))
+            f.write(
+                FIELDS_FOOTER.pack(offset, f.tell() - offset, FIELDS_MAGIC)
+            )
+        os.replace(tmp_filename, filename)
         print(f"{os.getpid()}: Wrote to {filename}")
 
 
@@ -410,6 +644,17 @@ class AsnRoutes:
             routes=data["routes"],
         )
 
+    @staticmethod
+    def from_json(filename: str) -> AsnRoutes:
+        """
+        Read an AsnRoutes object from disk, which has been serialised as JSON.
+        This may have been compressed with any codec.
+        """
+        if not os.path.exists(filename):
+            raise FileExistsError(f"AsnRoutes file doesn't exist: {filename}")
+
+        return AsnRoutes.from_dict(load_json(filename))
+
     def merge_asn_routes(self: AsnRoutes, asn_routes: AsnRoutes) -> None:
         """
         Merge another AsnRoutes object into this one
@@ -434,25 +679,177 @@ class AsnRoutes:
             "routes": self.routes,
         }
 
-    def to_json(self: AsnRoutes, uncompressed: bool, filename: str) -> None:
+    def to_json(self: AsnRoutes, codec: Codec, filename: str) -> None:
         """
-        Write an AsnRoutes object to disk, serialised as JSON.
-        This can optionally be gzip compressed.
+        Write an AsnRoutes object to disk, serialised as JSON, using the codec
         """
-        os.makedirs(os.path.dirname(filename), exist_ok=True)
-        if uncompressed:
-            with open(filename, "wb") as f:
-                f.write(
-                    orjson.dumps(self.to_dict(), option=orjson.OPT_INDENT_2)
-                )
-        else:
-            with gzip.open(filename, "wb") as f:
-                f.write(
-                    orjson.dumps(self.to_dict(), option=orjson.OPT_INDENT_2)
-                )
+        codec.write_json(filename, self.to_dict())
         # print(f"{os.getpid()}: Wrote to {filename}")
 
 
+class AsnRoutesSummary:
+    """
+    Summary counts of a merged AsnRoutes object.
+    This is written next to the merged routes so that the full table doesn't
+    need to be loaded again just to count it.
+    """
+
+    peer_as: int
+    v4_count: int
+    v6_count: int
+    asn_count: int  # Unique ASNs seen in all AS paths
+    path_count: int  # Total AS paths across all prefixes
+    # The size and mtime of the routes file the summary was written with
+    routes_size: int
+    routes_mtime_ns: int
+
+    def __init__(
+        self: AsnRoutesSummary,
+        peer_as: int = -1,
+        v4_count: int = 0,
+        v6_count: int = 0,
+        asn_count: int = 0,
+        path_count: int = 0,
+        routes_size: int = -1,
+        routes_mtime_ns: int = -1,
+    ) -> None:
+        self.peer_as = peer_as
+        self.v4_count = v4_count
+        self.v6_count = v6_count
+        self.asn_count = asn_count
+        self.path_count = path_count
+        self.routes_size = routes_size
+        self.routes_mtime_ns = routes_mtime_ns
+
+    @staticmethod
+    def from_asn_routes(asn_routes: AsnRoutes) -> AsnRoutesSummary:
+        """
+        Return an AsnRoutesSummary calculated from an AsnRoutes object
+        """
+        return AsnRoutesSummary.from_routes(
+            asn_routes.peer_as,
+            asn_routes.v4_count,
+            asn_routes.v6_count,
+            asn_routes.routes.items(),
+        )
+
+    @staticmethod
+    def from_routes(
+        peer_as: int,
+        v4_count: int,
+        v6_count: int,
+        routes: Iterable[tuple[str, list[list[int]]]],
+    ) -> AsnRoutesSummary:
+        """
+        Return an AsnRoutesSummary calculated from (prefix, as_paths) pairs,
+        e.g. from a stream which never holds the whole table in memory
+        """
+        seen_asns: set[int] = set()
+        path_count = 0
+        for _, as_paths in routes:
+            path_count += len(as_paths)
+            for as_path in as_paths:
+                seen_asns.update(as_path)
+
+        return AsnRoutesSummary(
+            peer_as=peer_as,
+            v4_count=v4_count,
+            v6_count=v6_count,
+            asn_count=len(seen_asns),
+            path_count=path_count,
+        )
+
+    @staticmethod
+    def from_dict(data: dict[str, Any]) -> AsnRoutesSummary:
+        """
+        Return an AsnRoutesSummary object from a dict
+        """
+        return AsnRoutesSummary(
+            peer_as=int(data["peer_as"]),
+            v4_count=int(data["v4_count"]),
+            v6_count=int(data["v6_count"]),
+            asn_count=int(data["asn_count"]),
+            path_count=int(data["path_count"]),
+            # Summaries written before these were stored never match
+            routes_size=int(data.get("routes_size", -1)),
+            routes_mtime_ns=int(data.get("routes_mtime_ns", -1)),
+        )
+
+    @staticmethod
+    def from_json(filename: str) -> AsnRoutesSummary:
+        """
+        Read an AsnRoutesSummary object from disk, serialised as JSON
+        """
+        if not os.path.exists(filename):
+            raise FileExistsError(f"Summary file doesn't exist: {filename}")
+
+        with open(filename, "rb") as f:
+            return AsnRoutesSummary.from_dict(orjson.loads(f.read()))
+
+    def matches(self: AsnRoutesSummary, routes_file: str) -> bool:
+        """
+        Return True if the routes file hasn't changed since the summary was
+        written with it. Only the size and mtime are compared, so a routes
+        file rewritten with the same size and mtime (e.g. copied over with
+        cp -p, or extracted from a snapshot, which restores mtimes) still
+        matches an outdated summary. Re-run the merge rather than copying
+        routes files between runs.
+        """
+        stat = os.stat(routes_file)
+        return (stat.st_size, stat.st_mtime_ns) == (
+            self.routes_size,
+            self.routes_mtime_ns,
+        )
+
+    def set_routes_file(self: AsnRoutesSummary, routes_file: str) -> None:
+        """
+        Tie the summary to the routes file it was calculated from, which must
+        already have been written
+        """
+        stat = os.stat(routes_file)
+        self.routes_size = stat.st_size
+        self.routes_mtime_ns = stat.st_mtime_ns
+
+    def to_dict(self: AsnRoutesSummary) -> dict[str, Any]:
+        return {
+            "peer_as": self.peer_as,
+            "v4_count": self.v4_count,
+            "v6_count": self.v6_count,
+            "asn_count": self.asn_count,
+            "path_count": self.path_count,
+            "routes_size": self.routes_size,
+            "routes_mtime_ns": self.routes_mtime_ns,
+        }
+
+    def to_json(self: AsnRoutesSummary, filename: str) -> None:
+        """
+        Write an AsnRoutesSummary object to disk, serialised as JSON.
+        This is always uncompressed, it's only a handful of bytes.
+        """
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        with open(filename, "wb") as f:
+            f.write(orjson.dumps(self.to_dict(), option=orjson.OPT_INDENT_2))
+
+    def to_report(
+        self: AsnRoutesSummary,
+        asn_threshold: int,
+        v4_threshold: int,
+        v6_threshold: int,
+    ) -> dict[str, int | bool]:
+        """
+        Return the full table report entry for this ASN, given the thresholds
+        """
+        return {
+            "asn": self.peer_as,
+            "v4_count": self.v4_count,
+            "v4_full": self.v4_count >= v4_threshold,
+            "v6_count": self.v6_count,
+            "v6_full": self.v6_count >= v6_threshold,
+            "asn_count": self.asn_count,
+            "asn_full": self.asn_count >= asn_threshold,
+        }
+
+
 class PeerStats:
     peer_type: int
     peer_bgp_id: str
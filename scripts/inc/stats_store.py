@@ -0,0 +1,329 @@
+"""
+A read-only, memory-mapped store of the parsed AsStats of every network.
+
+coverage.py writes the store once after parsing the AsnRoutes files. Each
+coverage stage, and each worker process, then opens it with mmap. Arrays are
+numpy views straight onto the mapped file, so nothing is decompressed or
+copied, and every process shares the same pages in the OS page cache.
+
+Only the fields calculated when parsing are stored. The fields calculated by
+the coverage stages are left empty when an AsStats object is loaded.
+
+File layout, each array starts on an 8 byte boundary:
+
+MAGIC
+arrays: the arrays of all networks
+directory: JSON dict keyed by ASN, with the scalars and histograms of each
+           network, and the [dtype, offset, count] of each of its arrays
+footer: directory offset (uint64), directory length (uint64), MAGIC
+
+Arrays:
+- ASN sets are uint32 arrays, as_hops has one array per hop count.
+- Prefix trees are a uint32 network array and uint8 mask array for v4, and
+  two uint64 network arrays (high and low 64 bits) and a uint8 mask array
+  for v6.
+- Sets of prefix strings are stored as newline separated text.
+"""
+
+from __future__ import annotations
+
+import ipaddress
+import mmap
+import os
+import struct
+from collections.abc import Iterable
+from typing import Any, Optional
+
+import numpy as np
+import numpy.typing as npt
+import orjson
+
+from inc.aggregate6 import int_to_ip, ip_to_int
+from inc.globals import IPV4_SIZE, IPV6_SIZE
+from inc.prefix_keys import make_keys
+from inc.stats import DERIVED_FIELDS, AsStats
+
+MAGIC = b"T1STOR01"
+FOOTER = struct.Struct("<QQ8s")
+U64_MASK = 2**64 - 1
+
+SCALAR_FIELDS = [
+    "avg_as_path_length",
+    "weighted_as_path_score",
+    "avg_as_hops",
+    "weighted_as_hops_score",
+]
+HISTOGRAM_FIELDS = ["as_path_lengths", "as_hops_freq"]
+ASN_FIELDS = ["asns_reachable", "on_net_asns", "asns_n_on_net_for_peers"]
+PREFIX_TREE_FIELDS = ["v4_pfx_tree", "v6_pfx_tree"]
+TEXT_FIELDS = [
+    "v4_pfx_preferred_by_t1s",
+    "v4_pfx_n_preferred_by_t1s",
+    "v6_pfx_preferred_by_t1s",
+    "v6_pfx_n_preferred_by_t1s",
+]
+# All the AsStats fields in the store
+STORE_FIELDS = (
+    ["asn", "as_hops"]
+    + SCALAR_FIELDS
+    + HISTOGRAM_FIELDS
+    + ASN_FIELDS
+    + PREFIX_TREE_FIELDS
+    + TEXT_FIELDS
+)
+
+
+def align(offset: int) -> int:
+    """
+    Return the next offset which is on an 8 byte boundary
+    """
+    return (offset + 7) & ~7
+
+
+class StatsStoreWriter:
+    """
+    Write AsStats objects to a store, one network at a time
+    """
+
+    def __init__(self: StatsStoreWriter, filename: str) -> None:
+        self.filename = filename
+        self.directory: dict[str, dict[str, Any]] = {}
+        if os.path.dirname(filename):
+            os.makedirs(os.path.dirname(filename), exist_ok=True)
+        self.tmp_filename = f"{filename}.{os.getpid()}.tmp"
+        self.f = open(self.tmp_filename, "wb")
+        self.f.write(MAGIC)
+
+    def __enter__(self: StatsStoreWriter) -> StatsStoreWriter:
+        return self
+
+    def __exit__(self: StatsStoreWriter, *args: Any) -> None:
+        self.close()
+
+    def add(self: StatsStoreWriter, as_stats: AsStats) -> None:
+        """
+        Add the parsed fields of a network
+        """
+        arrays: dict[str, list[Any]] = {}
+        entry = {
+            "scalars": {
+                field: getattr(as_stats, field) for field in SCALAR_FIELDS
+            },
+            "histograms": {
+                field: {
+                    str(key): value
+                    for key, value in getattr(as_stats, field).items()
+                }
+                for field in HISTOGRAM_FIELDS
+            },
+            "arrays": arrays,
+        }
+
+        for field in ASN_FIELDS:
+            arrays[field] = self.write_array(getattr(as_stats, field))
+        for hop_count, hop_asns in as_stats.as_hops.items():
+            arrays[f"as_hops/{hop_count}"] = self.write_array(hop_asns)
+
+        v4_prefixes = [prefix.split("/") for prefix in as_stats.v4_pfx_tree]
+        arrays["v4_pfx_tree/nets"] = self.write_array(
+            np.array(
+                [ip_to_int(net, IPV4_SIZE) for net, _ in v4_prefixes],
+                dtype=np.uint32,
+            )
+        )
+        arrays["v4_pfx_tree/masks"] = self.write_array(
+            np.array([int(mask) for _, mask in v4_prefixes], dtype=np.uint8)
+        )
+        v6_prefixes = [prefix.split("/") for prefix in as_stats.v6_pfx_tree]
+        v6_nets = [ip_to_int(net, IPV6_SIZE) for net, _ in v6_prefixes]
+        arrays["v6_pfx_tree/hi"] = self.write_array(
+            np.array([net >> 64 for net in v6_nets], dtype=np.uint64)
+        )
+        arrays["v6_pfx_tree/lo"] = self.write_array(
+            np.array([net & U64_MASK for net in v6_nets], dtype=np.uint64)
+        )
+        arrays["v6_pfx_tree/masks"] = self.write_array(
+            np.array([int(mask) for _, mask in v6_prefixes], dtype=np.uint8)
+        )
+
+        for field in TEXT_FIELDS:
+            text = "\n".join(sorted(getattr(as_stats, field))).encode()
+            arrays[field] = self.write_array(
+                np.frombuffer(text, dtype=np.uint8)
+            )
+
+        self.directory[str(as_stats.asn)] = entry
+
+    def close(self: StatsStoreWriter) -> None:
+        """
+        Write the directory and footer, and move the store into place
+        """
+        if self.f.closed:
+            return
+        offset = align(self.f.tell())
+        self.f.write(b"\0" * (offset - self.f.tell()))
+        directory = orjson.dumps(self.directory)
+        self.f.write(directory)
+        self.f.write(FOOTER.pack(offset, len(directory), MAGIC))
+        self.f.close()
+        os.replace(self.tmp_filename, self.filename)
+        print(f"Wrote stats store for {len(self.directory)} networks")
+
+    def write_array(
+        self: StatsStoreWriter, array: npt.NDArray[Any]
+    ) -> list[Any]:
+        """
+        Write an array at the next 8 byte boundary.
+        Return its [dtype, offset, count] directory entry.
+        """
+        offset = align(self.f.tell())
+        self.f.write(b"\0" * (offset - self.f.tell()))
+        self.f.write(array.tobytes())
+        return [array.dtype.str, offset, len(array)]
+
+
+class StatsStore:
+    """
+    Read AsStats objects from a memory-mapped store
+    """
+
+    def __init__(self: StatsStore, filename: str) -> None:
+        if not os.path.exists(filename):
+            raise FileExistsError(f"Stats store doesn't exist: {filename}")
+
+        self.filename = filename
+        with open(filename, "rb") as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.mm[: len(MAGIC)] != MAGIC:
+            raise ValueError(f"Not a stats store: {filename}")
+
+        offset, length, magic = FOOTER.unpack_from(
+            self.mm, len(self.mm) - FOOTER.size
+        )
+        if magic != MAGIC:
+            raise ValueError(f"Truncated stats store: {filename}")
+        self.directory: dict[str, dict[str, Any]] = orjson.loads(
+            self.mm[offset : offset + length]
+        )
+
+    def __contains__(self: StatsStore, asn: int) -> bool:
+        return str(asn) in self.directory
+
+    @property
+    def asns(self: StatsStore) -> list[int]:
+        return [int(asn) for asn in self.directory]
+
+    def array(self: StatsStore, asn: int, name: str) -> npt.NDArray[Any]:
+        """
+        Return a read-only view of one of a network's arrays
+        """
+        dtype, offset, count = self.entry(asn)["arrays"][name]
+        return np.frombuffer(
+            self.mm, dtype=np.dtype(dtype), count=count, offset=offset
+        )
+
+    def as_stats(
+        self: StatsStore, asn: int, fields: Optional[Iterable[str]] = None
+    ) -> AsStats:
+        """
+        Return an AsStats object with the chosen fields loaded.
+        ASN sets are views onto the store, not copies.
+        """
+        if fields is None:
+            fields = STORE_FIELDS
+        stored_fields = set()
+        for field in fields:
+            stored_fields.update(DERIVED_FIELDS.get(field, [field]))
+
+        entry = self.entry(asn)
+        as_stats = AsStats(asn=asn)
+        for field in stored_fields:
+            if field in SCALAR_FIELDS:
+                setattr(as_stats, field, entry["scalars"][field])
+            elif field in HISTOGRAM_FIELDS:
+                setattr(
+                    as_stats,
+                    field,
+                    {
+                        int(key): value
+                        for key, value in entry["histograms"][field].items()
+                    },
+                )
+            elif field in ASN_FIELDS:
+                setattr(as_stats, field, self.array(asn, field))
+            elif field == "as_hops":
+                as_stats.as_hops = {
+                    int(name.split("/")[1]): self.array(asn, name)
+                    for name in entry["arrays"]
+                    if name.startswith("as_hops/")
+                }
+            elif field in PREFIX_TREE_FIELDS or field in TEXT_FIELDS:
+                prefixes = self.prefixes(asn, field)
+                if field in TEXT_FIELDS:
+                    setattr(as_stats, field, set(prefixes))
+                    continue
+                tree = getattr(as_stats, field)
+                for prefix in prefixes:
+                    tree.insert(prefix, None)
+        return as_stats
+
+    def close(self: StatsStore) -> None:
+        self.mm.close()
+
+    def entry(self: StatsStore, asn: int) -> dict[str, Any]:
+        """
+        Return the directory entry of a network
+        """
+        if str(asn) not in self.directory:
+            raise KeyError(f"AS{asn} isn't in the stats store {self.filename}")
+        return self.directory[str(asn)]
+
+    def prefix_keys(
+        self: StatsStore, asn: int, afi: int
+    ) -> npt.NDArray[np.uint64]:
+        """
+        Return the prefixes of a network's v4 or v6 tree as uint64 keys,
+        in the format of inc.prefix_keys
+        """
+        if afi == 4:
+            return make_keys(
+                self.array(asn, "v4_pfx_tree/nets"),
+                self.array(asn, "v4_pfx_tree/masks"),
+                4,
+            )
+        if self.array(asn, "v6_pfx_tree/lo").any():
+            raise ValueError(f"AS{asn} has v6 prefixes longer than /56")
+        try:
+            return make_keys(
+                self.array(asn, "v6_pfx_tree/hi") >> np.uint64(8),
+                self.array(asn, "v6_pfx_tree/masks"),
+                6,
+            )
+        except ValueError as e:
+            raise ValueError(f"AS{asn}: {e}") from e
+
+    def prefixes(self: StatsStore, asn: int, field: str) -> list[str]:
+        """
+        Return a prefix tree, or set of prefixes, of a network as strings
+        """
+        if field in TEXT_FIELDS:
+            text = self.array(asn, field).tobytes().decode()
+            return text.split("\n") if text else []
+        if field == "v4_pfx_tree":
+            return [
+                f"{int_to_ip(net, IPV4_SIZE)}/{mask}"
+                for net, mask in zip(
+                    self.array(asn, "v4_pfx_tree/nets").tolist(),
+                    self.array(asn, "v4_pfx_tree/masks").tolist(),
+                )
+            ]
+        if field == "v6_pfx_tree":
+            return [
+                f"{ipaddress.IPv6Address((hi << 64) | lo)}/{mask}"
+                for hi, lo, mask in zip(
+                    self.array(asn, "v6_pfx_tree/hi").tolist(),
+                    self.array(asn, "v6_pfx_tree/lo").tolist(),
+                    self.array(asn, "v6_pfx_tree/masks").tolist(),
+                )
+            ]
+        raise ValueError(f"{field} isn't a prefix field")
@@ -3,19 +3,42 @@
 import argparse
 import gc
 import gzip
+import heapq
+import itertools
 import multiprocessing
 import os
 import sys
 import tempfile
-from typing import Union
+from collections.abc import Iterator
+from typing import Any, Union
 
+import numpy as np
 import orjson
 from inc.asns import asns
+from inc.binary_routes import BinaryRoutes
+from inc.codec import (
+    CODEC_PRESETS,
+    COMPRESSION_SUFFIXES,
+    find_file,
+    get_codec,
+)
 from inc.globals import MERGED_PATHS_PATH, RIB_PATHS_PATH
-from inc.stats import AsnRoutes
+from inc.routes_files import open_routes
+from inc.sorted_routes import (
+    SortedRoutesWriter,
+    prefix_key,
+    write_sorted_routes,
+)
+from inc.stats import AsnRoutes, AsnRoutesSummary
 
 cli_args: argparse.Namespace
 
+# Rough memory cost of buffering one (prefix, AS path) record, plus each ASN
+RECORD_BYTES = 350
+ASN_BYTES = 36
+# Bytes of an ASN run file to read at a time
+ASN_RUN_BLOCK = 2**16
+
 
 def merge_results() -> None:
     """
@@ -32,13 +55,9 @@ def merge_results() -> None:
     for asn in cli_args.asns:
         json_files: list[Union[str, None]] = []
         for input_dir in cli_args.input_dirs:
-            if not cli_args.uncompressed:
-                filename = os.path.join(input_dir, f"{asn}-routes.json.gz")
-            else:
-                filename = os.path.join(input_dir, f"{asn}-routes.json")
-            if not os.path.exists(filename):
-                raise FileExistsError(f"Input file doesn't exist: {filename}")
-            json_files.append(filename)
+            json_files.append(
+                find_file(os.path.join(input_dir, f"{asn}-routes.json"))
+            )
 
         if not json_files:
             print(f"No files to merge for AS{asn}")
@@ -46,6 +65,11 @@ def merge_results() -> None:
 
         print(f"Merging {len(json_files)} files for AS{asn}")
 
+        if cli_args.membudget:
+            external_merge(asn, [f for f in json_files if f])
+            print("")
+            continue
+
         # Merge pairs of files. If we have an odd number to merge,
         # one file will be merged with nothing.
         if len(json_files) % 2 != 0:
@@ -80,12 +104,7 @@ def merge_results() -> None:
                 merging = False
 
         if (json_file := json_files[0]) is not None:
-            if not cli_args.uncompressed:
-                with gzip.open(json_file, "rb") as f:
-                    asn_routes = AsnRoutes.from_dict(orjson.loads(f.read()))
-            else:
-                with open(json_file) as f:
-                    asn_routes = AsnRoutes.from_dict(orjson.loads(f.read()))
+            asn_routes = AsnRoutes.from_json(json_file)
         else:
             raise ValueError("Missing filename to load")
 
@@ -94,13 +113,21 @@ def merge_results() -> None:
             f"AS{asn}. Total: {asn_routes.v4_count + asn_routes.v6_count}, "
             f"v4: {asn_routes.v4_count}, v6: {asn_routes.v6_count}"
         )
-        if cli_args.uncompressed:
-            output_file = os.path.join(cli_args.output, f"{asn}-routes.json")
+        output_file = get_output_filename(asn)
+        if cli_args.format == "binary":
+            BinaryRoutes.from_asn_routes(asn_routes).to_file(output_file)
+        elif cli_args.format == "sorted":
+            write_sorted_routes(asn_routes, output_file)
         else:
-            output_file = os.path.join(
-                cli_args.output, f"{asn}-routes.json.gz"
-            )
-        asn_routes.to_json(cli_args.uncompressed, output_file)
+            asn_routes.to_json(cli_args.codec, output_file)
+        print(f"Wrote merged routes to {output_file}")
+
+        # Write the counts alongside the routes so they needn't be re-parsed
+        summary_file = os.path.join(cli_args.output, f"{asn}-summary.json")
+        summary = AsnRoutesSummary.from_asn_routes(asn_routes)
+        summary.set_routes_file(output_file)
+        summary.to_json(summary_file)
+        print(f"Wrote summary to {summary_file}")
 
         for filename in all_tmp_files:
             os.unlink(filename)
@@ -112,6 +139,150 @@ def merge_results() -> None:
     print("")
 
 
+def external_merge(asn: str, json_files: list[str]) -> None:
+    """
+    Merge the AsnRoutes files for an ASN within a fixed memory budget.
+
+    Each input file is streamed one prefix at a time, and its
+    (prefix, AS path) records are buffered until the memory budget is
+    reached. The buffer is then sorted and spilled to a run file in the
+    scratch directory. The runs are merged as a stream, de-duplicating AS
+    paths per prefix, into a single merged run, which is then streamed into
+    the output file. The unique ASNs are counted the same way, the set of
+    ASNs seen is spilled to a sorted run whenever it reaches the budget.
+
+    Each record carries a sequence number in the order it was read, so that
+    the AS paths of each prefix keep the same order as the pairwise merge.
+    The scratch files are removed even if the merge fails.
+    """
+    budget = cli_args.membudget * 2**20
+    os.makedirs(cli_args.scratch, exist_ok=True)
+    with tempfile.TemporaryDirectory(
+        prefix=f"{asn}-", dir=cli_args.scratch
+    ) as scratch_dir:
+        runs: list[str] = []
+        records: list[tuple[str, int, list[int]]] = []
+        used = 0
+        seq = 0
+
+        for json_file in json_files:
+            print(f"{os.getpid()}: Streaming {json_file}")
+            for prefix, as_paths in open_routes(json_file):
+                for as_path in as_paths:
+                    records.append((prefix, seq, as_path))
+                    seq += 1
+                    used += RECORD_BYTES + (ASN_BYTES * len(as_path))
+                if used >= budget:
+                    runs.append(write_run(records, scratch_dir))
+                    records = []
+                    used = 0
+        if records:
+            runs.append(write_run(records, scratch_dir))
+            records = []
+        print(f"Spilled {seq} AS paths into {len(runs)} runs for AS{asn}")
+
+        # Merge the runs into one, with all the AS paths of a prefix on one
+        # line
+        merged_run = os.path.join(scratch_dir, "merged.run.gz")
+        seen_asns: set[int] = set()
+        asn_runs: list[str] = []
+        v4_count = v6_count = path_count = 0
+        with gzip.open(merged_run, "wb", compresslevel=1) as f:
+            for prefix, group in itertools.groupby(
+                heapq.merge(
+                    *[read_run(run) for run in runs], key=run_sort_key
+                ),
+                key=lambda record: record[0],
+            ):
+                merged_paths: list[list[int]] = []
+                for _, _, as_path in group:
+                    if as_path not in merged_paths:
+                        merged_paths.append(as_path)
+                if ":" in prefix:
+                    v6_count += 1
+                else:
+                    v4_count += 1
+                path_count += len(merged_paths)
+                for as_path in merged_paths:
+                    seen_asns.update(as_path)
+                if len(seen_asns) * ASN_BYTES >= budget:
+                    asn_runs.append(write_asn_run(seen_asns, scratch_dir))
+                    seen_asns = set()
+                f.write(orjson.dumps([prefix, merged_paths]) + b"\n")
+
+        for run in runs:
+            os.unlink(run)
+
+        if asn_runs and seen_asns:
+            asn_runs.append(write_asn_run(seen_asns, scratch_dir))
+        summary = AsnRoutesSummary(
+            peer_as=int(asn),
+            v4_count=v4_count,
+            v6_count=v6_count,
+            asn_count=count_asn_runs(asn_runs) if asn_runs else len(seen_asns),
+            path_count=path_count,
+        )
+        del seen_asns
+
+        print(f"Finished merging AS{asn}")
+        print(
+            f"AS{asn}. Total: {summary.v4_count + summary.v6_count}, "
+            f"v4: {summary.v4_count}, v6: {summary.v6_count}"
+        )
+
+        output_file = get_output_filename(asn)
+        if cli_args.format == "sorted":
+            with SortedRoutesWriter(output_file, int(asn)) as writer:
+                for prefix, as_paths in read_run(merged_run):
+                    writer.add(prefix, as_paths)
+        else:
+            with cli_args.codec.open(output_file) as f_out:
+                f_out.write(
+                    b'{"peer_as":%d,"v4_count":%d,"v6_count":%d,"routes":{'
+                    % (summary.peer_as, summary.v4_count, summary.v6_count)
+                )
+                for idx, (prefix, as_paths) in enumerate(read_run(merged_run)):
+                    if idx:
+                        f_out.write(b",")
+                    f_out.write(orjson.dumps(prefix))
+                    f_out.write(b":")
+                    f_out.write(orjson.dumps(as_paths))
+                f_out.write(b"}}")
+        print(f"Wrote merged routes to {output_file}")
+
+    summary_file = os.path.join(cli_args.output, f"{asn}-summary.json")
+    summary.set_routes_file(output_file)
+    summary.to_json(summary_file)
+    print(f"Wrote summary to {summary_file}")
+
+
+def count_asn_runs(asn_runs: list[str]) -> int:
+    """
+    Return the number of unique ASNs in sorted ASN run files, merging them
+    as a stream
+    """
+    count = 0
+    last = -1
+    for asn in heapq.merge(*[read_asn_run(run) for run in asn_runs]):
+        if asn != last:
+            count += 1
+            last = asn
+    return count
+
+
+def get_output_filename(asn: str) -> str:
+    """
+    Return the filename for the merged routes of an ASN
+    """
+    if cli_args.format == "binary":
+        return os.path.join(cli_args.output, f"{asn}-routes.bin")
+    if cli_args.format == "sorted":
+        return os.path.join(cli_args.output, f"{asn}-routes.sorted")
+    return cli_args.codec.filename(
+        os.path.join(cli_args.output, f"{asn}-routes.json")
+    )
+
+
 def merge_json_files(json_files: tuple[str | None, str | None]) -> str:
     """
     Load two AsnRoute route objs from JSON and return the first one
@@ -122,22 +293,11 @@ def merge_json_files(json_files: tuple[str | None, str | None]) -> str:
 
     assert f1
     print(f"{os.getpid()}: Loading 1st JSON file {f1}")
-    if os.path.splitext(f1)[1] == ".gz":
-        with gzip.open(f1, "rb") as f:
-            try:
-                f1_data = orjson.loads(f.read())
-            except orjson.JSONDecodeError as e:
-                print(f"Error loading 1st JSON file {f1}")
-                raise e
-    else:
-        with open(f1) as f:
-            try:
-                f1_data = orjson.loads(f.read())
-            except orjson.JSONDecodeError as e:
-                print(f"Error loading 1st JSON file {f1}")
-                raise e
-
-    asn_routes_1 = AsnRoutes.from_dict(f1_data)
+    try:
+        asn_routes_1 = AsnRoutes.from_json(f1)
+    except orjson.JSONDecodeError as e:
+        print(f"Error loading 1st JSON file {f1}")
+        raise e
     print(
         f"{os.getpid()}: Parsed {len(asn_routes_1.routes)} "
         "routes from 1st JSON file"
@@ -145,21 +305,11 @@ def merge_json_files(json_files: tuple[str | None, str | None]) -> str:
 
     if f2:
         print(f"{os.getpid()}: Loading 2nd JSON file {f2}")
-        if os.path.splitext(f2)[1] == ".gz":
-            with gzip.open(f2, "rb") as f:
-                try:
-                    f2_data = orjson.loads(f.read())
-                except orjson.JSONDecodeError as e:
-                    print(f"Error loading 2nd JSON file {f2}")
-                    raise e
-        else:
-            with open(f2) as f:
-                try:
-                    f2_data = orjson.loads(f.read())
-                except orjson.JSONDecodeError as e:
-                    print(f"Error loading 2nd JSON file {f2}")
-                    raise e
-        asn_routes_2 = AsnRoutes.from_dict(f2_data)
+        try:
+            asn_routes_2 = AsnRoutes.from_json(f2)
+        except orjson.JSONDecodeError as e:
+            print(f"Error loading 2nd JSON file {f2}")
+            raise e
     else:
         asn_routes_2 = AsnRoutes(peer_as=asn_routes_1.peer_as, routes={})
     print(
@@ -174,10 +324,69 @@ def merge_json_files(json_files: tuple[str | None, str | None]) -> str:
     asn_routes_1.merge_asn_routes(asn_routes_2)
     print(f"{os.getpid()} Merged into {len(asn_routes_1.routes)} routes")
 
-    _, filename = tempfile.mkstemp()
-    if not cli_args.uncompressed:
-        filename = filename + ".gz"
-    asn_routes_1.to_json(cli_args.uncompressed, filename)
+    # Tmp files are read once and deleted, so favour speed over size
+    codec = CODEC_PRESETS["fast"]
+    fd, filename = tempfile.mkstemp(suffix=codec.suffix)
+    os.close(fd)
+    asn_routes_1.to_json(codec, filename)
+    return filename
+
+
+def read_asn_run(filename: str) -> Iterator[int]:
+    """
+    Yield the ASNs from a sorted ASN run file, a block at a time
+    """
+    with open(filename, "rb") as f:
+        while block := f.read(ASN_RUN_BLOCK):
+            yield from np.frombuffer(block, dtype="<u4").tolist()
+
+
+def read_run(filename: str) -> Iterator[Any]:
+    """
+    Yield the records from a sorted run file
+    """
+    with gzip.open(filename, "rb") as f:
+        for line in f:
+            yield orjson.loads(line)
+
+
+def run_sort_key(record: Any) -> tuple[Any, int]:
+    """
+    Runs are sorted by prefix, and then by the order records were read in.
+    The sorted format needs prefixes in (AFI, network, mask) order.
+    """
+    if cli_args.format == "sorted":
+        return (prefix_key(record[0]), record[1])
+    return (record[0], record[1])
+
+
+def write_asn_run(asns: set[int], directory: str) -> str:
+    """
+    Write a set of ASNs, sorted, to an ASN run file in the scratch directory.
+    Return the filename.
+    """
+    fd, filename = tempfile.mkstemp(suffix=".asns", dir=directory)
+    with os.fdopen(fd, "wb") as f:
+        f.write(np.array(sorted(asns), dtype="<u4").tobytes())
+    print(f"{os.getpid()}: Wrote {len(asns)} ASNs to {filename}")
+    return filename
+
+
+def write_run(
+    records: list[tuple[str, int, list[int]]], directory: str
+) -> str:
+    """
+    Sort a buffer of (prefix, sequence number, AS path) records and write
+    them to a run file in the scratch directory.
+    Return the filename.
+    """
+    records.sort(key=run_sort_key)
+    fd, filename = tempfile.mkstemp(suffix=".run.gz", dir=directory)
+    os.close(fd)
+    with gzip.open(filename, "wb", compresslevel=1) as f:
+        for record in records:
+            f.write(orjson.dumps(record) + b"\n")
+    print(f"{os.getpid()}: Wrote {len(records)} records to {filename}")
     return filename
 
 
@@ -194,6 +403,35 @@ def parse_cli_args() -> None:
         type=str,
         default=",".join([str(asn) for asn in sorted(asns.keys())]),
     )
+    parser.add_argument(
+        "-codec",
+        help="Output codec for JSON merged routes, either a preset "
+        f"({', '.join(CODEC_PRESETS.keys())}) "
+        "or compression[:level][:indent|compact][:t<threads>] where "
+        "compression is one of "
+        f"{', '.join(COMPRESSION_SUFFIXES.keys())}. "
+        "gzip is compressed with -p threads unless t<threads> is given",
+        type=str,
+        default="default",
+    )
+    parser.add_argument(
+        "-format",
+        help="Output format for the merged routes. 'json' is a JSON "
+        "serialised AsnRoutes object. 'sorted' is a prefix sorted file of "
+        "compressed blocks, with a block index, which can be searched and "
+        "streamed without loading the whole table. 'binary' is a columnar "
+        "file of prefix integers and a de-duplicated AS path pool",
+        choices=["binary", "json", "sorted"],
+        default="json",
+    )
+    parser.add_argument(
+        "-membudget",
+        help="Merge each ASN within this many MB of memory, by spilling "
+        "sorted runs to the scratch directory and merging them as a stream. "
+        "This is slower but runs on small hosts. 0 disables this",
+        type=int,
+        default=0,
+    )
     parser.add_argument(
         "-output",
         help="Path to output directory for merged routes",
@@ -207,9 +445,16 @@ def parse_cli_args() -> None:
         type=int,
         default=multiprocessing.cpu_count() - 1,
     )
+    parser.add_argument(
+        "-scratch",
+        help="Path to scratch directory for sorted runs, used by -membudget",
+        type=str,
+        metavar="path",
+        default=tempfile.gettempdir(),
+    )
     parser.add_argument(
         "-uncompressed",
-        help="Write uncompressed output files",
+        help="Write uncompressed output files, overrides -codec",
         default=False,
         action="store_true",
         required=False,
@@ -227,6 +472,14 @@ def parse_cli_args() -> None:
     global cli_args
     cli_args = parser.parse_args()
     cli_args.asns = cli_args.asns.split(",")
+    # Merged routes are written by the parent process, one ASN at a time
+    cli_args.codec = get_codec(cli_args.codec, cli_args.uncompressed).parallel(
+        cli_args.p
+    )
+
+    if cli_args.membudget and cli_args.format == "binary":
+        print("The binary format can't be written within a memory budget")
+        sys.exit(1)
 
     if not cli_args.input_dirs:
         print(
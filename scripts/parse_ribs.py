@@ -13,6 +13,7 @@ import traceback
 
 import mrtparse  # type: ignore
 from inc.asns import asns
+from inc.codec import CODEC_PRESETS, COMPRESSION_SUFFIXES, get_codec
 from inc.globals import BGP_RIBS_PATH, RIB_PATHS_PATH
 from inc.stats import AsnRoutes
 
@@ -34,6 +35,16 @@ def parse_cli_args() -> None:
         type=str,
         default=",".join([str(asn) for asn in sorted(asns.keys())]),
     )
+    parser.add_argument(
+        "-codec",
+        help="Output codec, either a preset "
+        f"({', '.join(CODEC_PRESETS.keys())}) "
+        "or compression[:level][:indent|compact][:t<threads>] where "
+        "compression is one of "
+        f"{', '.join(COMPRESSION_SUFFIXES.keys())}",
+        type=str,
+        default="default",
+    )
     parser.add_argument(
         "-p",
         help="No. of processes to start",
@@ -42,7 +53,7 @@ def parse_cli_args() -> None:
     )
     parser.add_argument(
         "-uncompressed",
-        help="Write uncompressed output files",
+        help="Write uncompressed output files, overrides -codec",
         default=False,
         action="store_true",
         required=False,
@@ -65,6 +76,7 @@ def parse_cli_args() -> None:
     global cli_args
     cli_args = parser.parse_args()
     cli_args.asns = cli_args.asns.split(",")
+    cli_args.codec = get_codec(cli_args.codec, cli_args.uncompressed)
 
     if not cli_args.ribs:
         print("You must specify a glob of RIB files to parse!")
@@ -128,10 +140,10 @@ def parse_file(filename: str) -> None:
             f"v4: {asn_routes.v4_count}, v6: {asn_routes.v6_count}"
         )
 
-        asn_filename = os.path.join(output_dir, f"{asn}-routes.json")
-        if not cli_args.uncompressed:
-            asn_filename = asn_filename + ".gz"
-        asn_routes.to_json(cli_args.uncompressed, asn_filename)
+        asn_filename = cli_args.codec.filename(
+            os.path.join(output_dir, f"{asn}-routes.json")
+        )
+        asn_routes.to_json(cli_args.codec, asn_filename)
 
     print(f"{os.getpid()}: Parsed file {filename}", flush=True)
 
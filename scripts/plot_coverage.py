@@ -3,7 +3,6 @@
 from __future__ import annotations
 
 import argparse
-import gzip
 import math
 import json
 import os
@@ -11,6 +10,7 @@ from csv import DictReader
 
 import plotly.graph_objects as go
 import plotly.offline as po
+from inc.codec import find_file, open_file
 from inc.globals import (
     COVERAGE_AS_CONE,
     COVERAGE_AS_HOP_COUNT_ASNS,
@@ -495,9 +495,9 @@ class T1Peerings:
 
 
 def load_global_stats() -> dict[str, list[int | str] | int]:
-    filename = os.path.join(COVERAGE_DATA_PATH, COVERAGE_GLOBAL)
+    filename = find_file(os.path.join(COVERAGE_DATA_PATH, COVERAGE_GLOBAL))
     print(f"Loading global stats from {filename}")
-    with gzip.open(filename) as f:
+    with open_file(filename) as f:
         # orjson can't load >64bit int
         global_stats: dict = json.loads(f.read())
 
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+import sys
+
+from inc.codec import CODEC_PRESETS, COMPRESSION_SUFFIXES, get_codec
+from inc.snapshot import SnapshotReader, SnapshotWriter
+from tabulate import tabulate
+
+cli_args: argparse.Namespace
+
+
+def create_snapshot() -> None:
+    """
+    Write the chosen files and directories to a snapshot archive
+    """
+    codec = get_codec(cli_args.codec)
+    with SnapshotWriter(
+        cli_args.archive, codec, cli_args.append, cli_args.recompress
+    ) as writer:
+        writer.add_paths(cli_args.paths)
+        count = len(writer.index)
+    print(f"Wrote {count} files to {cli_args.archive}")
+
+
+def extract_snapshot() -> None:
+    """
+    Extract the members which match the chosen patterns, or all members
+    """
+    with SnapshotReader(cli_args.archive) as reader:
+        names: list[str] = []
+        for pattern in cli_args.paths or ["*"]:
+            names.extend(reader.glob(pattern))
+        if not names:
+            print(f"No members match {cli_args.paths} in {cli_args.archive}")
+            sys.exit(1)
+        for name in sorted(set(names)):
+            print(f"Extracted {reader.extract(name, cli_args.output)}")
+
+
+def list_snapshot() -> None:
+    """
+    Print the members which match the chosen patterns, or all members
+    """
+    with SnapshotReader(cli_args.archive) as reader:
+        table_data: list[list[str]] = []
+        for pattern in cli_args.paths or ["*"]:
+            for name in reader.glob(pattern):
+                _, length, compression, size, _ = reader.info(name)
+                table_data.append([name, str(size), str(length), compression])
+    print(
+        tabulate(
+            table_data,
+            headers=["Member", "Size", "Stored", "Compression"],
+            tablefmt="psql",
+        )
+    )
+
+
+def parse_cli_args() -> None:
+    parser = argparse.ArgumentParser(
+        description="Script to create, list and extract indexed snapshot "
+        "archives of the data produced by a run. Each file is compressed on "
+        "its own, so single files can be read from an old snapshot without "
+        "decompressing the whole archive",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        "-append",
+        help="Add files to an existing archive, instead of overwriting it",
+        default=False,
+        action="store_true",
+        required=False,
+    )
+    parser.add_argument(
+        "-codec",
+        help="Compression for files which aren't already compressed, either "
+        f"a preset ({', '.join(CODEC_PRESETS.keys())}) "
+        "or compression[:level] where compression is one of "
+        f"{', '.join(COMPRESSION_SUFFIXES.keys())}",
+        type=str,
+        default="default",
+    )
+    parser.add_argument(
+        "-extract",
+        help="Extract the members matching paths, which may be shell style "
+        "patterns, or all members if no paths are given",
+        default=False,
+        action="store_true",
+        required=False,
+    )
+    parser.add_argument(
+        "-list",
+        help="List the members matching paths, which may be shell style "
+        "patterns, or all members if no paths are given",
+        default=False,
+        action="store_true",
+        required=False,
+    )
+    parser.add_argument(
+        "-output",
+        help="Path to output directory for extracted files",
+        type=str,
+        metavar="path",
+        default=os.curdir,
+    )
+    parser.add_argument(
+        "-recompress",
+        help="Recompress files which are already compressed, e.g. "
+        "intermediates written with a fast codec, with -codec. Extracting "
+        "them compresses them again with the fast codec, so they decompress "
+        "to the same contents but aren't byte-identical to the originals",
+        default=False,
+        action="store_true",
+        required=False,
+    )
+    parser.add_argument(
+        "archive",
+        help="Snapshot archive filename",
+        type=str,
+    )
+    parser.add_argument(
+        "paths",
+        help="Files and directories to archive, or member patterns to list "
+        "or extract",
+        type=str,
+        nargs="*",
+    )
+
+    global cli_args
+    cli_args = parser.parse_args()
+
+
+def main() -> None:
+    parse_cli_args()
+
+    if cli_args.list:
+        list_snapshot()
+    elif cli_args.extract:
+        extract_snapshot()
+    else:
+        create_snapshot()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,8 @@
+import os
+import sys
+
+# The scripts import their modules as inc.*, relative to the scripts directory
+sys.path.insert(
+    0,
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"),
+)
@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+import pytest
+
+from inc.binary_routes import BinaryRoutes
+from inc.stats import AsnRoutes
+
+ROUTES = {
+    "0.0.0.0/0": [[64500]],
+    "10.0.0.0/8": [[64500, 64501]],
+    "192.0.2.0/24": [[64500, 64501], [64500, 64502, 64501]],
+    "::/0": [[64500]],
+    "2001:db8:0:100::/56": [[64500, 64501]],
+    "2001:db8::1/128": [[64500, 4200000000]],
+}
+
+
+def make_routes(routes: dict[str, list[list[int]]]) -> AsnRoutes:
+    asn_routes = AsnRoutes(peer_as=64500, routes={})
+    for prefix, as_paths in routes.items():
+        for as_path in as_paths:
+            asn_routes.add_prefix(prefix, as_path)
+    return asn_routes
+
+
+@pytest.mark.parametrize("suffix", [".bin", ".bin.gz"])
+def test_round_trip(tmp_path: Path, suffix: str) -> None:
+    filename = str(tmp_path / f"64500-routes{suffix}")
+    BinaryRoutes.from_asn_routes(make_routes(ROUTES)).to_file(filename)
+    binary_routes = BinaryRoutes.from_file(filename)
+    assert binary_routes.peer_as == 64500
+    assert (binary_routes.v4_count, binary_routes.v6_count) == (3, 3)
+    assert dict(binary_routes) == ROUTES
+
+    asn_routes = binary_routes.to_asn_routes()
+    assert (asn_routes.v4_count, asn_routes.v6_count) == (3, 3)
+    assert asn_routes.routes == ROUTES
+
+
+def test_empty_table(tmp_path: Path) -> None:
+    filename = str(tmp_path / "64500-routes.bin")
+    BinaryRoutes.from_asn_routes(make_routes({})).to_file(filename)
+    binary_routes = BinaryRoutes.from_file(filename)
+    assert (binary_routes.v4_count, binary_routes.v6_count) == (0, 0)
+    assert binary_routes.path_count == 0
+    assert list(binary_routes) == []
+
+
+def test_paths_are_stored_once() -> None:
+    binary_routes = BinaryRoutes.from_asn_routes(make_routes(ROUTES))
+    assert binary_routes.path_count == 4
+    assert len(binary_routes.path_refs) == 7
+    assert binary_routes.as_paths(2) == ROUTES["192.0.2.0/24"]
+
+
+def test_v4_prefixes_first() -> None:
+    routes = {"::/0": [[64500]], "0.0.0.0/0": [[64500]]}
+    binary_routes = BinaryRoutes.from_asn_routes(make_routes(routes))
+    assert list(binary_routes.prefixes()) == ["0.0.0.0/0", "::/0"]
+
+
+def test_invalid_peer_as(tmp_path: Path) -> None:
+    asn_routes = make_routes(ROUTES)
+    asn_routes.peer_as = -1
+    with pytest.raises(ValueError):
+        BinaryRoutes.from_asn_routes(asn_routes).to_file(
+            str(tmp_path / "routes.bin")
+        )
+
+
+def test_not_binary_routes(tmp_path: Path) -> None:
+    filename = str(tmp_path / "64500-routes.bin")
+    with open(filename, "wb") as f:
+        f.write(b"\0" * 64)
+    with pytest.raises(ValueError):
+        BinaryRoutes.from_file(filename)
+
+
+def test_missing(tmp_path: Path) -> None:
+    with pytest.raises(FileExistsError):
+        BinaryRoutes.from_file(str(tmp_path / "64500-routes.bin"))
@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+import numpy as np
+import numpy.typing as npt
+import pytest
+
+from inc.bitsets import BitsetMatrix
+from inc.stats import asn_array
+
+
+def random_sets(offset: int, count: int = 6) -> list[npt.NDArray[np.uint32]]:
+    rng = np.random.default_rng(0)
+    sets = [
+        asn_array(offset + rng.integers(0, 300, size=rng.integers(0, 200)))
+        for _ in range(count)
+    ]
+    sets.append(asn_array([]))
+    return sets
+
+
+def expected_counts(sets: list[npt.NDArray[np.uint32]]) -> list[list[int]]:
+    return [
+        [len(set(a.tolist()) & set(b.tolist())) for b in sets] for a in sets
+    ]
+
+
+# Dense IDs from a lookup table, and sparse IDs from sorting 4-byte ASNs
+@pytest.mark.parametrize("offset", [0, 2**31])
+def test_intersection_counts(offset: int) -> None:
+    sets = random_sets(offset)
+    matrix = BitsetMatrix.from_sets(sets)
+    assert len(matrix) == len(sets)
+    assert matrix.intersection_counts().tolist() == expected_counts(sets)
+
+
+@pytest.mark.parametrize("offset", [0, 2**31])
+def test_shared_items(offset: int) -> None:
+    sets = random_sets(offset)
+    shared = BitsetMatrix.from_sets(sets).shared_items()
+    for idx, items in enumerate(sets):
+        others = set().union(
+            *(
+                other.tolist()
+                for o_idx, other in enumerate(sets)
+                if o_idx != idx
+            )
+        )
+        assert shared[idx].tolist() == sorted(set(items.tolist()) & others)
+        assert shared[idx].dtype == items.dtype
+
+
+def test_universe() -> None:
+    matrix = BitsetMatrix.from_sets(
+        [asn_array([5, 4200000000]), asn_array([5, 64500])]
+    )
+    assert matrix.universe.tolist() == [5, 64500, 4200000000]
+    assert [ids.tolist() for ids in matrix.ids] == [[0, 2], [0, 1]]
+
+
+@pytest.mark.parametrize("size", [63, 64, 65, 128])
+def test_word_boundaries(size: int) -> None:
+    # The last item is in the last bit of a word, or the first of the next
+    sets = [asn_array(range(size)), asn_array([0, size - 1])]
+    matrix = BitsetMatrix.from_sets(sets)
+    assert matrix.rows.shape == (2, (size + 63) // 64)
+    assert matrix.intersection_counts().tolist() == [[size, 2], [2, 2]]
+
+
+def test_no_sets() -> None:
+    matrix = BitsetMatrix.from_sets([])
+    assert len(matrix) == 0
+    assert matrix.intersection_counts().shape == (0, 0)
+    assert matrix.shared_items() == []
+
+
+def test_empty_sets() -> None:
+    matrix = BitsetMatrix.from_sets([asn_array([]), asn_array([])])
+    assert matrix.intersection_counts().tolist() == [[0, 0], [0, 0]]
+    assert [items.tolist() for items in matrix.shared_items()] == [[], []]
+
+
+def test_other_matrix() -> None:
+    sets = random_sets(0)
+    matrix = BitsetMatrix.from_sets(sets)
+    top = BitsetMatrix(matrix.universe, matrix.ids[:2])
+    bottom = BitsetMatrix(matrix.universe, matrix.ids[2:])
+    assert top.intersection_counts(bottom).tolist() == [
+        row[2:] for row in expected_counts(sets)[:2]
+    ]
+
+
+def test_out() -> None:
+    sets = random_sets(0)
+    matrix = BitsetMatrix.from_sets(sets)
+    out = np.zeros(matrix.rows.shape, dtype="<u8")
+    BitsetMatrix(matrix.universe, matrix.ids, out)
+    assert np.array_equal(out, matrix.rows)
+    with pytest.raises(ValueError):
+        BitsetMatrix(matrix.universe, matrix.ids, out[1:])
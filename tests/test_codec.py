@@ -0,0 +1,133 @@
+from __future__ import annotations
+
+import array
+import gzip
+from pathlib import Path
+
+import pytest
+
+from inc.codec import (
+    CODEC_PRESETS,
+    COMPRESSION_SUFFIXES,
+    Codec,
+    ParallelGzipWriter,
+    decompress,
+    find_file,
+    get_codec,
+    load_json,
+)
+
+BLOCK_SIZE = 16
+OBJ = {"peer_as": 64500, "routes": {"0.0.0.0/0": [[64500, 64501]]}}
+
+
+def test_from_str() -> None:
+    codec = Codec.from_str("gzip:6:compact:t4")
+    assert (codec.compression, codec.level, codec.indent, codec.threads) == (
+        "gzip",
+        6,
+        False,
+        4,
+    )
+    assert repr(codec) == "gzip:6:compact:t4"
+    assert repr(Codec.from_str(repr(codec))) == repr(codec)
+
+
+def test_from_str_preset() -> None:
+    codec = Codec.from_str("small:9")
+    assert (codec.compression, codec.level) == ("lzma", 9)
+    # Presets are copied, not changed
+    assert CODEC_PRESETS["small"].level == 6
+
+
+@pytest.mark.parametrize("spec", ["zip", "gzip:fast", "gzip:t"])
+def test_from_str_invalid(spec: str) -> None:
+    with pytest.raises(ValueError):
+        Codec.from_str(spec)
+
+
+def test_get_codec() -> None:
+    assert get_codec("small").compression == "lzma"
+    assert get_codec("small", uncompressed=True).compression == "none"
+
+
+def test_parallel() -> None:
+    assert Codec.from_str("fast").parallel(8).threads == 8
+    assert Codec.from_str("fast:t2").parallel(8).threads == 2
+    assert CODEC_PRESETS["fast"].threads == 1
+
+
+@pytest.mark.parametrize("compression", list(COMPRESSION_SUFFIXES))
+@pytest.mark.parametrize("data", [b"", b"x" * 1000])
+def test_compress(compression: str, data: bytes) -> None:
+    assert decompress(Codec(compression).compress(data)) == data
+
+
+@pytest.mark.parametrize("spec", ["default", "fast", "small", "none", "bz2"])
+def test_write_json(tmp_path: Path, spec: str) -> None:
+    codec = Codec.from_str(spec)
+    base = str(tmp_path / "out" / "64500-routes.json")
+    codec.write_json(codec.filename(base), OBJ)
+    assert find_file(base) == base + codec.suffix
+    assert load_json(find_file(base, codec)) == OBJ
+
+
+def test_find_file_missing(tmp_path: Path) -> None:
+    with pytest.raises(FileExistsError):
+        find_file(str(tmp_path / "64500-routes.json"))
+
+
+@pytest.mark.parametrize(
+    "size, members",
+    [
+        (0, 1),
+        (1, 1),
+        (BLOCK_SIZE - 1, 1),
+        (BLOCK_SIZE, 1),
+        (BLOCK_SIZE + 1, 2),
+        (BLOCK_SIZE * 3, 3),
+        (BLOCK_SIZE * 20 + 5, 21),
+    ],
+)
+@pytest.mark.parametrize("write_size", [1, 7, BLOCK_SIZE, 1000])
+def test_parallel_gzip_writer(
+    tmp_path: Path, size: int, members: int, write_size: int
+) -> None:
+    data = bytes(range(256)) * (size // 256 + 1)
+    data = data[:size]
+    filename = str(tmp_path / "out.gz")
+    with ParallelGzipWriter(filename, 6, 2, BLOCK_SIZE) as f:
+        for pos in range(0, size, write_size):
+            f.write(data[pos : pos + write_size])
+    assert f.members == members
+    with open(filename, "rb") as f_in:
+        assert gzip.decompress(f_in.read()) == data
+    with gzip.open(filename, "rb") as f_in:
+        assert f_in.read() == data
+
+
+def test_parallel_gzip_writer_buffers(tmp_path: Path) -> None:
+    # Writes of any buffer are split into bytes
+    filename = str(tmp_path / "out.gz")
+    with ParallelGzipWriter(filename, 6, 2, BLOCK_SIZE) as f:
+        assert f.write(array.array("I", range(10))) == 40
+        assert f.write(bytearray(b"abc")) == 3
+    with gzip.open(filename, "rb") as f_in:
+        assert f_in.read() == array.array("I", range(10)).tobytes() + b"abc"
+
+
+def test_parallel_gzip_writer_closed(tmp_path: Path) -> None:
+    f = ParallelGzipWriter(str(tmp_path / "out.gz"))
+    f.close()
+    f.close()
+    with pytest.raises(ValueError):
+        f.write(b"x")
+
+
+def test_codec_open_parallel(tmp_path: Path) -> None:
+    codec = Codec.from_str("fast:t2")
+    filename = str(tmp_path / "out.json.gz")
+    with codec.open(filename) as f:
+        assert isinstance(f, ParallelGzipWriter)
+    codec.write_json(filename, OBJ)
+    assert load_json(filename) == OBJ
@@ -0,0 +1,23 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+import pytest
+
+import merge_rib_stats
+
+
+@pytest.mark.parametrize("block", [4, 8, 2**16])
+def test_asn_runs(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch, block: int
+) -> None:
+    # Blocks of one and two ASNs, and the whole run in one block
+    monkeypatch.setattr(merge_rib_stats, "ASN_RUN_BLOCK", block)
+    runs = [
+        merge_rib_stats.write_asn_run({3, 1, 4200000000}, str(tmp_path)),
+        merge_rib_stats.write_asn_run({1, 5, 9, 2}, str(tmp_path)),
+        merge_rib_stats.write_asn_run(set(), str(tmp_path)),
+    ]
+    assert list(merge_rib_stats.read_asn_run(runs[0])) == [1, 3, 4200000000]
+    assert list(merge_rib_stats.read_asn_run(runs[2])) == []
+    assert merge_rib_stats.count_asn_runs(runs) == 6
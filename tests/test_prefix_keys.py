@@ -0,0 +1,181 @@
+from __future__ import annotations
+
+import ipaddress
+from pathlib import Path
+
+import numpy as np
+import numpy.typing as npt
+import pytest
+
+from inc.prefix_keys import (
+    KEY_NET_BITS,
+    address_count,
+    covered_keys,
+    key_parents,
+    key_prefixes,
+    make_keys,
+)
+from inc.stats import AsStats
+from inc.stats_store import StatsStore, StatsStoreWriter
+
+
+def keys_of(prefixes: list[str], afi: int) -> npt.NDArray[np.uint64]:
+    networks = [ipaddress.ip_network(prefix) for prefix in prefixes]
+    shift = networks[0].max_prefixlen - KEY_NET_BITS[afi] if networks else 0
+    return np.sort(
+        make_keys(
+            np.array(
+                [int(net.network_address) >> shift for net in networks],
+                dtype=np.uint64,
+            ),
+            np.array([net.prefixlen for net in networks], dtype=np.uint8),
+            afi,
+        )
+    )
+
+
+def union_size(prefixes: list[str]) -> int:
+    size = 0
+    reach = -1
+    for net in sorted(ipaddress.ip_network(prefix) for prefix in prefixes):
+        start = int(net.network_address)
+        end = start + net.num_addresses
+        size += max(0, end - max(start, reach))
+        reach = max(reach, end)
+    return size
+
+
+V4_PREFIXES = [
+    "10.0.0.0/8",
+    "10.1.0.0/16",
+    "10.255.255.255/32",
+    "11.0.0.0/8",
+    "192.0.2.0/24",
+    "192.0.2.128/25",
+]
+V6_PREFIXES = [
+    "2001:db8::/32",
+    "2001:db8:1::/48",
+    "2001:db8:0:100::/56",
+    "2001:db9::/56",
+    "2001:db9:0:100::/56",
+    "3fff::/20",
+]
+
+
+@pytest.mark.parametrize(
+    "prefixes, afi",
+    [
+        (V4_PREFIXES, 4),
+        (V6_PREFIXES, 6),
+        (["0.0.0.0/0", "255.255.255.255/32"], 4),
+        (["::/0", "ffff:ffff:ffff:ff00::/56"], 6),
+    ],
+)
+def test_round_trip(prefixes: list[str], afi: int) -> None:
+    keys = keys_of(prefixes, afi)
+    assert key_prefixes(keys, afi) == sorted(
+        prefixes, key=lambda prefix: ipaddress.ip_network(prefix)
+    )
+
+
+def test_empty() -> None:
+    for afi in (4, 6):
+        keys = make_keys(
+            np.array([], dtype=np.uint64), np.array([], dtype=np.uint8), afi
+        )
+        assert key_prefixes(keys, afi) == []
+        assert address_count(keys, afi) == (0, 0)
+        assert key_parents(keys, afi).tolist() == []
+        covered, counts = covered_keys(keys, [], afi)
+        assert covered == [] and counts.tolist() == []
+
+
+@pytest.mark.parametrize(
+    "prefixes, afi, ranges",
+    [
+        (V4_PREFIXES, 4, 2),
+        (V6_PREFIXES, 6, 2),
+        (["0.0.0.0/0", "10.0.0.0/8"], 4, 1),
+        (["::/0", "2001:db8::/56"], 6, 1),
+        (["2001:db8::/56", "2001:db8:0:200::/56"], 6, 2),
+    ],
+)
+def test_address_count(prefixes: list[str], afi: int, ranges: int) -> None:
+    assert address_count(keys_of(prefixes, afi), afi) == (
+        union_size(prefixes),
+        ranges,
+    )
+
+
+def test_v4_default_route() -> None:
+    assert address_count(keys_of(["0.0.0.0/0"], 4), 4) == (2**32, 1)
+
+
+def test_v6_56() -> None:
+    keys = keys_of(["2001:db8:0:ff00::/56"], 6)
+    assert key_prefixes(keys, 6) == ["2001:db8:0:ff00::/56"]
+    assert address_count(keys, 6) == (2**72, 1)
+
+
+@pytest.mark.parametrize("afi, mask", [(4, 33), (6, 57), (6, 64), (6, 128)])
+def test_masks_too_long(afi: int, mask: int) -> None:
+    with pytest.raises(ValueError):
+        make_keys(
+            np.array([0], dtype=np.uint64),
+            np.array([mask], dtype=np.uint8),
+            afi,
+        )
+
+
+def test_key_parents() -> None:
+    prefixes = ["10.0.0.0/8", "10.1.0.0/16", "10.1.1.0/24", "11.0.0.0/8"]
+    keys = keys_of(prefixes, 4)
+    assert key_parents(keys, 4).tolist() == [-1, 0, 1, -1]
+
+
+def test_covered_keys() -> None:
+    keys = keys_of(V6_PREFIXES, 6)
+    prefixes = key_prefixes(keys, 6)
+    tables = [
+        np.array([prefixes.index("2001:db8::/32")], dtype=np.int64),
+        np.array([prefixes.index("2001:db8:1::/48")], dtype=np.int64),
+        np.array([], dtype=np.int64),
+    ]
+    covered, counts = covered_keys(keys, tables, 6)
+    assert [prefixes[idx] for idx in covered[0]] == [
+        "2001:db8::/32",
+        "2001:db8:0:100::/56",
+        "2001:db8:1::/48",
+    ]
+    assert [prefixes[idx] for idx in covered[1]] == ["2001:db8:1::/48"]
+    assert covered[2].tolist() == []
+    assert dict(zip(prefixes, counts.tolist())) == {
+        "2001:db8::/32": 1,
+        "2001:db8:0:100::/56": 1,
+        "2001:db8:1::/48": 2,
+        "2001:db9::/56": 0,
+        "2001:db9:0:100::/56": 0,
+        "3fff::/20": 0,
+    }
+
+
+def test_stats_store_prefix_keys(tmp_path: Path) -> None:
+    as_stats = AsStats(asn=64500)
+    as_stats.v4_pfx_tree.insert("0.0.0.0/0", None)
+    as_stats.v6_pfx_tree.insert("2001:db8:0:100::/56", None)
+    as_stats_long = AsStats(asn=64501)
+    as_stats_long.v6_pfx_tree.insert("2001:db8:0:180::/57", None)
+    filename = str(tmp_path / "stats.store")
+    with StatsStoreWriter(filename) as writer:
+        writer.add(as_stats)
+        writer.add(as_stats_long)
+
+    store = StatsStore(filename)
+    assert key_prefixes(store.prefix_keys(64500, 4), 4) == ["0.0.0.0/0"]
+    assert key_prefixes(store.prefix_keys(64500, 6), 6) == [
+        "2001:db8:0:100::/56"
+    ]
+    with pytest.raises(ValueError):
+        store.prefix_keys(64501, 6)
+    store.close()
@@ -0,0 +1,209 @@
+from __future__ import annotations
+
+import gzip
+import os
+from pathlib import Path
+
+import pytest
+
+import inc.snapshot
+from inc.codec import CODEC_PRESETS, decompress
+from inc.snapshot import (
+    MAGIC,
+    SnapshotReader,
+    SnapshotWriter,
+    member_name,
+)
+
+CODEC = CODEC_PRESETS["fast"]
+JSON_GZ = gzip.compress(b'{"peer_as": 64500}', mtime=0)
+
+
+def make_snapshot(filename: str, recompress: bool = False) -> None:
+    with SnapshotWriter(filename, CODEC, recompress=recompress) as writer:
+        writer.add("coverage/global-stats.json", b'{"v4": 1}', 100)
+        writer.add("merged_paths/64500-routes.json.gz", JSON_GZ, 200)
+        writer.add("merged_paths/64500-summary.json", b"", 300)
+
+
+def test_round_trip(tmp_path: Path) -> None:
+    filename = str(tmp_path / "run.snap")
+    make_snapshot(filename)
+    with SnapshotReader(filename) as reader:
+        assert list(reader) == [
+            "coverage/global-stats.json",
+            "merged_paths/64500-routes.json.gz",
+            "merged_paths/64500-summary.json",
+        ]
+        assert reader.read("coverage/global-stats.json") == b'{"v4": 1}'
+        assert reader.read("merged_paths/64500-summary.json") == b""
+        # Compressed files are stored as-is
+        assert reader.info("merged_paths/64500-routes.json.gz")[2] == "none"
+        assert reader.read("merged_paths/64500-routes.json.gz") == JSON_GZ
+        assert reader.load_json("merged_paths/64500-routes.json.gz") == {
+            "peer_as": 64500
+        }
+        assert reader.info("merged_paths/64500-summary.json")[4] == 300
+        assert "./coverage/global-stats.json" in reader
+        assert reader.glob("merged_paths/*.json") == [
+            "merged_paths/64500-summary.json"
+        ]
+        with pytest.raises(KeyError):
+            reader.read("coverage/64500-stats.fields")
+
+
+def test_empty_archive(tmp_path: Path) -> None:
+    filename = str(tmp_path / "run.snap")
+    SnapshotWriter(filename, CODEC).close()
+    with SnapshotReader(filename) as reader:
+        assert len(reader) == 0
+        assert list(reader) == []
+
+
+def test_recompress(tmp_path: Path) -> None:
+    filename = str(tmp_path / "run.snap")
+    make_snapshot(filename, recompress=True)
+    with SnapshotReader(filename) as reader:
+        name = "merged_paths/64500-routes.json.gz"
+        assert reader.info(name)[2] == "gzip"
+        assert reader.read(name) == decompress(JSON_GZ)
+        # Extracting compresses it again, it isn't byte-identical
+        extracted = reader.extract(name, str(tmp_path / "out"))
+    with open(extracted, "rb") as f:
+        assert decompress(f.read()) == decompress(JSON_GZ)
+
+
+def test_append(tmp_path: Path) -> None:
+    filename = str(tmp_path / "run.snap")
+    make_snapshot(filename)
+    size = os.path.getsize(filename)
+    with SnapshotWriter(filename, CODEC, append=True) as writer:
+        writer.add("coverage/global-stats.json", b'{"v4": 2}', 400)
+        writer.add("asn_graphs/64500.json", b"[]", 500)
+    # The old archive is left in place, the new members follow it
+    with open(filename, "rb") as f:
+        old = f.read(size)
+    assert old.endswith(MAGIC)
+    with SnapshotReader(filename) as reader:
+        assert len(reader) == 4
+        assert reader.read("coverage/global-stats.json") == b'{"v4": 2}'
+        assert reader.read("asn_graphs/64500.json") == b"[]"
+        assert reader.read("merged_paths/64500-routes.json.gz") == JSON_GZ
+
+
+def test_append_new_file(tmp_path: Path) -> None:
+    filename = str(tmp_path / "run.snap")
+    with SnapshotWriter(filename, CODEC, append=True) as writer:
+        writer.add("coverage/global-stats.json", b"{}", 100)
+    with SnapshotReader(filename) as reader:
+        assert list(reader) == ["coverage/global-stats.json"]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 9, 2**20])
+def test_interrupted_append(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch, chunk_size: int
+) -> None:
+    monkeypatch.setattr(inc.snapshot, "SCAN_CHUNK_SIZE", chunk_size)
+    filename = str(tmp_path / "run.snap")
+    make_snapshot(filename)
+
+    # Members are written, but the writer never writes the index and footer.
+    # The member contains MAGIC, which isn't a footer.
+    writer = SnapshotWriter(filename, CODEC, append=True)
+    writer.add("asn_graphs/64500.json", b"x" * 100 + MAGIC + b"x" * 100, 500)
+    writer.f.close()
+    with SnapshotReader(filename) as reader:
+        assert "asn_graphs/64500.json" not in reader
+        assert reader.read("coverage/global-stats.json") == b'{"v4": 1}'
+
+    with SnapshotWriter(filename, CODEC, append=True) as writer:
+        writer.add("asn_graphs/64501.json", b"[]", 600)
+    with SnapshotReader(filename) as reader:
+        assert len(reader) == 4
+        assert "asn_graphs/64500.json" not in reader
+        assert reader.read("asn_graphs/64501.json") == b"[]"
+
+
+def test_truncated(tmp_path: Path) -> None:
+    filename = str(tmp_path / "run.snap")
+    make_snapshot(filename)
+    with open(filename, "r+b") as f:
+        f.truncate(os.path.getsize(filename) - 1)
+    with pytest.raises(ValueError):
+        SnapshotReader(filename)
+
+
+def test_not_snapshot(tmp_path: Path) -> None:
+    filename = str(tmp_path / "run.snap")
+    with open(filename, "wb") as f:
+        f.write(b"\0" * 64)
+    with pytest.raises(ValueError):
+        SnapshotReader(filename)
+    with pytest.raises(FileExistsError):
+        SnapshotReader(str(tmp_path / "missing.snap"))
+
+
+def test_extract(tmp_path: Path) -> None:
+    filename = str(tmp_path / "run.snap")
+    make_snapshot(filename)
+    output_dir = str(tmp_path / "out")
+    with SnapshotReader(filename) as reader:
+        for name in reader:
+            extracted = reader.extract(name, output_dir)
+            assert extracted == os.path.join(
+                os.path.realpath(output_dir), name
+            )
+            with open(extracted, "rb") as f:
+                assert f.read() == reader.read(name)
+            assert os.path.getmtime(extracted) == reader.info(name)[4]
+
+
+@pytest.mark.parametrize(
+    "name",
+    [
+        "../escape.json",
+        "coverage/../../escape.json",
+        "/etc/escape.json",
+        "./coverage/global-stats.json",
+        "coverage//global-stats.json",
+    ],
+)
+def test_add_invalid_name(tmp_path: Path, name: str) -> None:
+    with SnapshotWriter(str(tmp_path / "run.snap"), CODEC) as writer:
+        with pytest.raises(ValueError):
+            writer.add(name, b"{}", 100)
+
+
+@pytest.mark.parametrize("name", ["../escape.json", "/tmp/escape.json", "."])
+def test_extract_traversal(tmp_path: Path, name: str) -> None:
+    # An archive written by something else, which doesn't check the names
+    filename = str(tmp_path / "run.snap")
+    with SnapshotWriter(filename, CODEC) as writer:
+        writer.add("escape.json", b"{}", 100)
+        writer.index[name] = writer.index.pop("escape.json")
+    with SnapshotReader(filename) as reader:
+        with pytest.raises(ValueError):
+            reader.extract(name, str(tmp_path / "out"))
+    assert not os.path.exists(tmp_path / "escape.json")
+
+
+def test_member_name(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.chdir(tmp_path)
+    assert member_name("./coverage/global-stats.json") == (
+        os.path.join("coverage", "global-stats.json")
+    )
+    outside = os.path.join(os.path.dirname(tmp_path), "escape.json")
+    assert member_name(outside) == outside.lstrip(os.sep)
+
+
+def test_extract_through_symlink(tmp_path: Path) -> None:
+    filename = str(tmp_path / "run.snap")
+    with SnapshotWriter(filename, CODEC) as writer:
+        writer.add("link/escape.json", b"{}", 100)
+    (tmp_path / "out").mkdir()
+    (tmp_path / "elsewhere").mkdir()
+    (tmp_path / "out" / "link").symlink_to(tmp_path / "elsewhere")
+    with SnapshotReader(filename) as reader:
+        with pytest.raises(ValueError):
+            reader.extract("link/escape.json", str(tmp_path / "out"))
+    assert not os.path.exists(tmp_path / "elsewhere" / "escape.json")
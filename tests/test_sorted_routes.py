@@ -0,0 +1,152 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+import pytest
+
+from inc.sorted_routes import (
+    MAGIC,
+    SortedRoutesReader,
+    SortedRoutesWriter,
+    merge_join,
+    prefix_key,
+    write_sorted_routes,
+)
+from inc.stats import AsnRoutes
+
+ROUTES = {
+    "0.0.0.0/0": [[64500]],
+    "10.0.0.0/8": [[64500, 64501]],
+    "10.0.0.0/16": [[64500, 64501], [64500, 64502, 64501]],
+    "10.1.0.0/16": [[64500, 64501]],
+    "192.0.2.0/24": [[64500, 64503]],
+    "::/0": [[64500]],
+    "2001:db8::/32": [[64500, 64504]],
+    "2001:db8:0:100::/56": [[64500, 64504, 64505]],
+}
+
+
+def make_routes(routes: dict[str, list[list[int]]]) -> AsnRoutes:
+    asn_routes = AsnRoutes(peer_as=64500, routes={})
+    for prefix, as_paths in routes.items():
+        for as_path in as_paths:
+            asn_routes.add_prefix(prefix, as_path)
+    return asn_routes
+
+
+def write(
+    directory: Path,
+    routes: dict[str, list[list[int]]],
+    block_prefixes: int = 3,
+) -> str:
+    filename = str(directory / "64500-routes.sorted")
+    write_sorted_routes(make_routes(routes), filename, block_prefixes)
+    return filename
+
+
+def test_prefix_key_sorts_covering_prefixes_first() -> None:
+    prefixes = sorted(ROUTES, key=prefix_key)
+    assert prefixes.index("10.0.0.0/8") < prefixes.index("10.0.0.0/16")
+    assert prefixes.index("0.0.0.0/0") == 0
+    assert all(":" in prefix for prefix in prefixes[5:])
+
+
+@pytest.mark.parametrize("block_prefixes", [1, 3, len(ROUTES), 4096])
+def test_round_trip(tmp_path: Path, block_prefixes: int) -> None:
+    filename = write(tmp_path, ROUTES, block_prefixes)
+    with SortedRoutesReader(filename) as reader:
+        assert reader.peer_as == 64500
+        assert (reader.v4_count, reader.v6_count) == (5, 3)
+        assert len(reader) == len(ROUTES)
+        assert [prefix for prefix, _ in reader] == sorted(
+            ROUTES, key=prefix_key
+        )
+        assert reader.to_asn_routes().routes == ROUTES
+
+
+def test_empty_table(tmp_path: Path) -> None:
+    filename = write(tmp_path, {})
+    with SortedRoutesReader(filename) as reader:
+        assert len(reader) == 0
+        assert list(reader) == []
+        assert reader.get("0.0.0.0/0") is None
+        assert list(reader.iter_range("0.0.0.0/0", "::/0")) == []
+
+
+def test_get(tmp_path: Path) -> None:
+    filename = write(tmp_path, ROUTES)
+    with SortedRoutesReader(filename) as reader:
+        for prefix, as_paths in ROUTES.items():
+            assert reader.get(prefix) == as_paths
+        assert reader.get("10.0.0.0/9") is None
+        assert reader.get("198.51.100.0/24") is None
+        assert reader.get("2001:db8:0:100::/57") is None
+
+
+def test_iter_range(tmp_path: Path) -> None:
+    filename = write(tmp_path, ROUTES)
+    with SortedRoutesReader(filename) as reader:
+        assert [
+            prefix for prefix, _ in reader.iter_range("10.0.0.0/8", "::/0")
+        ] == [
+            "10.0.0.0/8",
+            "10.0.0.0/16",
+            "10.1.0.0/16",
+            "192.0.2.0/24",
+            "::/0",
+        ]
+        assert list(reader.iter_range("11.0.0.0/8", "192.0.0.0/8")) == []
+
+
+def test_add_out_of_order(tmp_path: Path) -> None:
+    filename = str(tmp_path / "64500-routes.sorted")
+    with SortedRoutesWriter(filename, 64500) as writer:
+        writer.add("10.0.0.0/16", [[64500]])
+        with pytest.raises(ValueError):
+            writer.add("10.0.0.0/8", [[64500]])
+
+
+def test_merge_join(tmp_path: Path) -> None:
+    routes_2 = {
+        "10.0.0.0/8": [[64510]],
+        "172.16.0.0/12": [[64510]],
+        "2001:db8::/32": [[64510]],
+    }
+    filename_1 = write(tmp_path / "1", ROUTES)
+    filename_2 = write(tmp_path / "2", routes_2)
+    with SortedRoutesReader(filename_1) as reader_1, SortedRoutesReader(
+        filename_2
+    ) as reader_2:
+        joined = {
+            prefix: (as_paths_1, as_paths_2)
+            for prefix, as_paths_1, as_paths_2 in merge_join(
+                reader_1, reader_2
+            )
+        }
+    assert list(joined) == sorted(
+        ROUTES.keys() | routes_2.keys(), key=prefix_key
+    )
+    assert joined["10.0.0.0/8"] == (ROUTES["10.0.0.0/8"], [[64510]])
+    assert joined["172.16.0.0/12"] == (None, [[64510]])
+    assert joined["0.0.0.0/0"] == (ROUTES["0.0.0.0/0"], None)
+
+
+def test_not_sorted_routes(tmp_path: Path) -> None:
+    filename = str(tmp_path / "64500-routes.sorted")
+    with open(filename, "wb") as f:
+        f.write(b"\0" * 64)
+    with pytest.raises(ValueError):
+        SortedRoutesReader(filename)
+
+
+def test_truncated(tmp_path: Path) -> None:
+    filename = write(tmp_path, ROUTES)
+    with open(filename, "r+b") as f:
+        f.truncate(len(MAGIC) + 10)
+    with pytest.raises(ValueError):
+        SortedRoutesReader(filename)
+
+
+def test_missing(tmp_path: Path) -> None:
+    with pytest.raises(FileExistsError):
+        SortedRoutesReader(str(tmp_path / "64500-routes.sorted"))